@@ -1,25 +1,34 @@
+import logging
 import re
 from django.utils import timezone
 import graphene
 from django.contrib.auth import (
     get_user_model,
 )
+from django.conf import settings
+from django.db import transaction
 from django.shortcuts import get_object_or_404
-from django.core.paginator import Paginator
 from users.models import Address
 from utils.validation_utils import is_persian_string
 from utils.schema_utils import (
     resolve_model_with_filters,
     staff_member_required,
 )
+from utils.dataloaders import register
+from utils.query_optimizer import optimize_queryset
+from utils.pagination import paginate, paginate_keyset
+from utils.login_throttle import LOCKOUT_KINDS, get_login_lockouts, unlock_login
 from users.models import Business
 from sales.models import (
+    ORDER_STATUS_TRANSITIONS,
+    can_transition_order,
     ItemVariant,
     Order,
     OrderItem,
     DisplayItem,
     OrderTransaction,
 )
+from admin_dash.tasks import send_order_status_emails
 from users.schema import (
     UserType,
     BusinessType,
@@ -38,6 +47,13 @@ from sales.schema import (
 )
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
+
+# Stable orderings of the paginated lists, each ends with a unique field
+ORDER_ORDERING = ("-creation_date", "-id")
+TRANSACTION_ORDERING = ("-creation_date", "-id")
+USER_ORDERING = ("-date_joined", "-id")
+BUSINESS_ORDERING = ("-id",)
 
 # ========================Mutations Start========================
 
@@ -64,6 +80,8 @@ class CreateItemVariantInput(graphene.InputObjectType):
 
 
 class CreateDisplayItem(graphene.Mutation):
+    query_budget = 2
+
     class Arguments:
         input = CreateDisplayItemInput(required=True)
 
@@ -102,6 +120,8 @@ class CreateDisplayItem(graphene.Mutation):
 
 
 class CreateItemVariant(graphene.Mutation):
+    query_budget = 2
+
     class Arguments:
         input = CreateItemVariantInput(required=True)
 
@@ -118,7 +138,7 @@ class CreateItemVariant(graphene.Mutation):
             display_item = DisplayItem.objects.get(pk=display_item)
         except DisplayItem.DoesNotExist:
             errors["display_item"] = "آیتم نمایشی یافت نشد"
-            return errors
+            return display_item, errors
 
         name = input.get("name")
         if not is_persian_string(name):
@@ -253,16 +273,16 @@ class CreateItemVariant(graphene.Mutation):
         if not is_persian_string(wood_color):
             errors["wood_color"] = "نام رنگ چوب باید فارسی باشد"
 
-        return errors
+        return display_item, errors
 
     @staff_member_required
     def mutate(self, info, input):
         try:
-            errors = CreateItemVariant.validate_input(input)
+            display_item, errors = CreateItemVariant.validate_input(input)
             if errors:
                 return CreateItemVariant(success=False, errors=errors)
 
-            input["display_item"] = DisplayItem.objects.get(id=input["display_item"])
+            input["display_item"] = display_item
             item_variant = ItemVariant.objects.create(
                 **input,
             )
@@ -318,6 +338,8 @@ class UpdateBusinessInput(graphene.InputObjectType):
 
 
 class UpdateDisplayItem(graphene.Mutation):
+    query_budget = 3
+
     class Arguments:
         input = UpdateDisplayItemInput(required=True)
 
@@ -367,6 +389,8 @@ class UpdateDisplayItem(graphene.Mutation):
 
 
 class UpdateOrder(graphene.Mutation):
+    query_budget = 2
+
     class Arguments:
         input = UpdateOrderInput(required=True)
 
@@ -388,8 +412,9 @@ class UpdateOrder(graphene.Mutation):
                 order.due_date = due_date
 
         status = input.get("status")
-        if status:
-            if order.status in ("c", "de", "d", "ps"):
+        if status and status != order.status:
+            # The same transitions as bulkTransitionOrders
+            if not can_transition_order(order.status, status):
                 errors["status"] = "شما توانایی تغییر وضعیت سفارش را ندارید"
             else:
                 order.status = status
@@ -434,7 +459,105 @@ class UpdateOrder(graphene.Mutation):
             return UpdateOrder(success=False, errors="خطایی رخ داده است")
 
 
+class BulkTransitionOrders(graphene.Mutation):
+    query_budget = 5
+
+    class Arguments:
+        ids = graphene.List(graphene.NonNull(graphene.ID), required=True)
+        to_status = graphene.String(required=True)
+
+    updated = graphene.Int()
+    success = graphene.Boolean()
+    errors = graphene.JSONString()
+
+    @staticmethod
+    def validate_input(orders, ids, to_status):
+        errors = {}
+
+        from_statuses = [
+            status
+            for status, targets in ORDER_STATUS_TRANSITIONS.items()
+            if to_status in targets
+        ]
+        if not from_statuses:
+            errors["to_status"] = "وضعیت سفارش نامعتبر است"
+            return errors
+
+        missing = [id for id in ids if id not in orders]
+        if missing:
+            errors["ids"] = {str(id): "سفارش مورد نظر یافت نشد" for id in missing}
+
+        invalid = [
+            id
+            for id, status in orders.items()
+            if not can_transition_order(status, to_status)
+        ]
+        if invalid:
+            errors.setdefault("ids", {}).update(
+                {
+                    str(id): "شما توانایی تغییر وضعیت این سفارش را ندارید"
+                    for id in invalid
+                }
+            )
+
+        return errors
+
+    @staff_member_required
+    def mutate(self, info, ids, to_status):
+        try:
+            malformed = [id for id in ids if not str(id).isdigit()]
+            ids = {int(id) for id in ids if str(id).isdigit()}
+            if not ids and not malformed:
+                return BulkTransitionOrders(
+                    success=False, errors={"ids": "سفارشی انتخاب نشده است"}
+                )
+            if len(ids) > settings.BULK_TRANSITION_MAX_ORDERS:
+                return BulkTransitionOrders(
+                    success=False,
+                    errors={
+                        "ids": f"حداکثر {settings.BULK_TRANSITION_MAX_ORDERS} سفارش قابل تغییر است"
+                    },
+                )
+
+            with transaction.atomic():
+                orders = dict(
+                    Order.objects.select_for_update()
+                    .filter(pk__in=ids)
+                    .values_list("id", "status")
+                )
+                errors = BulkTransitionOrders.validate_input(orders, ids, to_status)
+                if malformed and "to_status" not in errors:
+                    errors.setdefault("ids", {}).update(
+                        {str(id): "شناسه سفارش نامعتبر است" for id in malformed}
+                    )
+                if errors:
+                    return BulkTransitionOrders(success=False, errors=errors)
+
+                updated = Order.objects.filter(pk__in=ids).update(status=to_status)
+                if to_status == "c":
+                    OrderTransaction.objects.filter(order_id__in=ids).exclude(
+                        status="c"
+                    ).update(status="c")
+
+                order_ids = sorted(ids)
+                batch_size = settings.ORDER_EMAIL_BATCH_SIZE
+                for start in range(0, len(order_ids), batch_size):
+                    batch = order_ids[start : start + batch_size]
+                    transaction.on_commit(
+                        lambda batch=batch: send_order_status_emails.delay(
+                            batch, to_status
+                        )
+                    )
+
+            return BulkTransitionOrders(updated=updated, success=True)
+        except Exception:
+            logger.exception("Bulk transition of orders to %s failed", to_status)
+            return BulkTransitionOrders(success=False, errors="خطایی رخ داده است")
+
+
 class UpdateItemVariant(graphene.Mutation):
+    query_budget = 2
+
     class Arguments:
         input = UpdateItemVariantInput(required=True)
 
@@ -627,7 +750,9 @@ class UpdateItemVariant(graphene.Mutation):
     def mutate(self, info, input):
         try:
             try:
-                item_variant = ItemVariant.objects.get(pk=input.get("id"))
+                item_variant = ItemVariant.objects.select_related("display_item").get(
+                    pk=input.get("id")
+                )
             except ItemVariant.DoesNotExist:
                 return UpdateItemVariant(
                     success=False, errors="نوع نمایشی مورد نظر یافت نشد"
@@ -644,6 +769,8 @@ class UpdateItemVariant(graphene.Mutation):
 
 
 class UpdateTransaction(graphene.Mutation):
+    query_budget = 2
+
     class Arguments:
         input = UpdateTransactionInput(required=True)
 
@@ -674,6 +801,8 @@ class UpdateTransaction(graphene.Mutation):
 
 
 class UpdateBusiness(graphene.Mutation):
+    query_budget = 2
+
     class Arguments:
         input = UpdateBusinessInput(required=True)
 
@@ -725,6 +854,8 @@ class DeleteTransactionInput(graphene.InputObjectType):
 
 
 class DeleteOrderItem(graphene.Mutation):
+    query_budget = 6
+
     class Arguments:
         input = DeleteOrderItemInput(required=True)
 
@@ -737,7 +868,7 @@ class DeleteOrderItem(graphene.Mutation):
         try:
 
             try:
-                order_item = OrderItem.objects.get(pk=input.id)
+                order_item = OrderItem.objects.select_related("order").get(pk=input.id)
             except OrderItem.DoesNotExist:
                 return DeleteOrderItem(success=False, errors="محصول مورد نظر یافت نشد")
 
@@ -766,6 +897,8 @@ class DeleteOrderItem(graphene.Mutation):
 
 
 class DeleteOrder(graphene.Mutation):
+    query_budget = 5
+
     class Arguments:
         input = DeleteOrderInput(required=True)
 
@@ -800,6 +933,8 @@ class DeleteOrder(graphene.Mutation):
 
 
 class DeleteDisplayItem(graphene.Mutation):
+    query_budget = 6
+
     class Arguments:
         input = DeleteDisplayItemInput(required=True)
 
@@ -831,6 +966,8 @@ class DeleteDisplayItem(graphene.Mutation):
 
 
 class DeleteItemVariant(graphene.Mutation):
+    query_budget = 4
+
     class Arguments:
         input = DeleteItemVariantInput(required=True)
 
@@ -843,7 +980,9 @@ class DeleteItemVariant(graphene.Mutation):
         try:
 
             try:
-                item_variant = ItemVariant.objects.get(pk=input.id)
+                item_variant = ItemVariant.objects.select_related("display_item").get(
+                    pk=input.id
+                )
             except ItemVariant.DoesNotExist:
                 return DeleteItemVariant(
                     success=False, errors="نوع آیتم مورد نظر پیدا نشد"
@@ -869,6 +1008,8 @@ class DeleteItemVariant(graphene.Mutation):
 
 
 class DeleteTransaction(graphene.Mutation):
+    query_budget = 2
+
     class Arguments:
         input = DeleteTransactionInput(required=True)
 
@@ -881,7 +1022,9 @@ class DeleteTransaction(graphene.Mutation):
         try:
 
             try:
-                transcation = OrderTransaction.objects.get(pk=input.id)
+                transcation = OrderTransaction.objects.select_related("order").get(
+                    pk=input.id
+                )
             except OrderTransaction.DoesNotExist:
                 return DeleteTransaction(
                     success=False, errors="تراکنش مورد نظر پیدا نشد"
@@ -910,11 +1053,34 @@ class DeleteTransaction(graphene.Mutation):
 # ========================Delete End========================
 
 
+class UnlockLogin(graphene.Mutation):
+    query_budget = 0
+
+    class Arguments:
+        kind = graphene.String(required=True)
+        identifier = graphene.String(required=True)
+
+    success = graphene.Boolean()
+    errors = graphene.String()
+
+    @staff_member_required
+    def mutate(self, info, kind, identifier):
+        try:
+            if kind not in LOCKOUT_KINDS:
+                return UnlockLogin(success=False, errors="نوع محدودیت معتبر نیست")
+            unlock_login(kind, identifier)
+            return UnlockLogin(success=True)
+        except Exception as e:
+            print(e)
+            return UnlockLogin(success=False, errors="خطایی رخ داده است")
+
+
 class Mutation(graphene.ObjectType):
     create_display_item = CreateDisplayItem.Field()
     create_item_variant = CreateItemVariant.Field()
     update_display_item = UpdateDisplayItem.Field()
     update_order = UpdateOrder.Field()
+    bulk_transition_orders = BulkTransitionOrders.Field()
     update_item_variant = UpdateItemVariant.Field()
     update_transaction = UpdateTransaction.Field()
     update_business = UpdateBusiness.Field()
@@ -923,6 +1089,7 @@ class Mutation(graphene.ObjectType):
     delete_display_item = DeleteDisplayItem.Field()
     delete_item_variant = DeleteItemVariant.Field()
     delete_transaction = DeleteTransaction.Field()
+    unlock_login = UnlockLogin.Field()
 
 
 # ========================Mutations End========================
@@ -979,24 +1146,59 @@ class PaginatedOrder(graphene.ObjectType):
     items = graphene.List(OrderType)
     total_pages = graphene.Int()
     total_items = graphene.Int()
+    is_estimate = graphene.Boolean()
 
 
 class PaginatedTransaction(graphene.ObjectType):
     items = graphene.List(OrderTransactionType)
     total_pages = graphene.Int()
     total_items = graphene.Int()
+    is_estimate = graphene.Boolean()
 
 
 class PaginatedUser(graphene.ObjectType):
     items = graphene.List(UserType)
     total_pages = graphene.Int()
     total_items = graphene.Int()
+    is_estimate = graphene.Boolean()
 
 
 class PaginatedBusiness(graphene.ObjectType):
     items = graphene.List(BusinessType)
     total_pages = graphene.Int()
     total_items = graphene.Int()
+    is_estimate = graphene.Boolean()
+
+
+class OrderConnection(graphene.ObjectType):
+    items = graphene.List(OrderType)
+    end_cursor = graphene.String()
+    has_next_page = graphene.Boolean()
+
+
+class TransactionConnection(graphene.ObjectType):
+    items = graphene.List(OrderTransactionType)
+    end_cursor = graphene.String()
+    has_next_page = graphene.Boolean()
+
+
+class UserConnection(graphene.ObjectType):
+    items = graphene.List(UserType)
+    end_cursor = graphene.String()
+    has_next_page = graphene.Boolean()
+
+
+class BusinessConnection(graphene.ObjectType):
+    items = graphene.List(BusinessType)
+    end_cursor = graphene.String()
+    has_next_page = graphene.Boolean()
+
+
+class LoginLockoutType(graphene.ObjectType):
+    kind = graphene.String()
+    identifier = graphene.String()
+    level = graphene.Int()
+    locked_until = graphene.DateTime()
 
 
 class Query(graphene.ObjectType):
@@ -1006,6 +1208,12 @@ class Query(graphene.ObjectType):
         per_page=graphene.Int(),
         filter=OrderFilterInput(),
     )
+    orders_connection = graphene.Field(
+        OrderConnection,
+        first=graphene.Int(),
+        after=graphene.String(),
+        filter=OrderFilterInput(),
+    )
     order = graphene.Field(OrderType, id=graphene.ID(required=True))
     transactions = graphene.Field(
         PaginatedTransaction,
@@ -1013,6 +1221,12 @@ class Query(graphene.ObjectType):
         per_page=graphene.Int(),
         filter=TranscationFilterInput(),
     )
+    transactions_connection = graphene.Field(
+        TransactionConnection,
+        first=graphene.Int(),
+        after=graphene.String(),
+        filter=TranscationFilterInput(),
+    )
     transaction = graphene.Field(OrderTransactionType, id=graphene.ID(required=True))
 
     users = graphene.Field(
@@ -1021,6 +1235,12 @@ class Query(graphene.ObjectType):
         per_page=graphene.Int(),
         filter=UserFilterInput(),
     )
+    users_connection = graphene.Field(
+        UserConnection,
+        first=graphene.Int(),
+        after=graphene.String(),
+        filter=UserFilterInput(),
+    )
 
     businesses = graphene.Field(
         PaginatedBusiness,
@@ -1028,16 +1248,54 @@ class Query(graphene.ObjectType):
         per_page=graphene.Int(),
         filter=BusinessFilterInput(),
     )
+    businesses_connection = graphene.Field(
+        BusinessConnection,
+        first=graphene.Int(),
+        after=graphene.String(),
+        filter=BusinessFilterInput(),
+    )
+
+    login_lockouts = graphene.List(LoginLockoutType)
+
+    query_budgets = {
+        "orders": 4,
+        "orders_connection": 3,
+        "order": 4,
+        "transactions": 2,
+        "transactions_connection": 1,
+        "transaction": 2,
+        "users": 3,
+        "users_connection": 1,
+        "businesses": 2,
+        "businesses_connection": 1,
+        "login_lockouts": 0,
+    }
 
     @staff_member_required
     def resolve_orders(self, info, page=1, per_page=10, filter={}):
-        orders = resolve_model_with_filters(Order, filter)
-        paginator = Paginator(orders, per_page)
-        paginated_qs = paginator.page(page)
+        orders = optimize_queryset(
+            resolve_model_with_filters(Order, filter), info, "items"
+        ).order_by(*ORDER_ORDERING)
+        items, total_pages, total_items, is_estimate = paginate(orders, page, per_page)
         return PaginatedOrder(
-            items=paginated_qs.object_list,
-            total_pages=paginator.num_pages,
-            total_items=paginator.count,
+            items=register(info, items),
+            total_pages=total_pages,
+            total_items=total_items,
+            is_estimate=is_estimate,
+        )
+
+    @staff_member_required
+    def resolve_orders_connection(self, info, first=None, after=None, filter={}):
+        orders = optimize_queryset(
+            resolve_model_with_filters(Order, filter), info, "items"
+        )
+        items, end_cursor, has_next_page = paginate_keyset(
+            orders, ORDER_ORDERING, first, after
+        )
+        return OrderConnection(
+            items=register(info, items),
+            end_cursor=end_cursor,
+            has_next_page=has_next_page,
         )
 
     @staff_member_required
@@ -1046,13 +1304,31 @@ class Query(graphene.ObjectType):
 
     @staff_member_required
     def resolve_transactions(self, info, page=1, per_page=10, filter={}):
-        transactions = resolve_model_with_filters(OrderTransaction, filter)
-        paginator = Paginator(transactions, per_page)
-        paginated_qs = paginator.page(page)
+        transactions = optimize_queryset(
+            resolve_model_with_filters(OrderTransaction, filter), info, "items"
+        ).order_by(*TRANSACTION_ORDERING)
+        items, total_pages, total_items, is_estimate = paginate(
+            transactions, page, per_page
+        )
         return PaginatedTransaction(
-            items=paginated_qs.object_list,
-            total_pages=paginator.num_pages,
-            total_items=paginator.count,
+            items=register(info, items),
+            total_pages=total_pages,
+            total_items=total_items,
+            is_estimate=is_estimate,
+        )
+
+    @staff_member_required
+    def resolve_transactions_connection(self, info, first=None, after=None, filter={}):
+        transactions = optimize_queryset(
+            resolve_model_with_filters(OrderTransaction, filter), info, "items"
+        )
+        items, end_cursor, has_next_page = paginate_keyset(
+            transactions, TRANSACTION_ORDERING, first, after
+        )
+        return TransactionConnection(
+            items=register(info, items),
+            end_cursor=end_cursor,
+            has_next_page=has_next_page,
         )
 
     @staff_member_required
@@ -1061,26 +1337,64 @@ class Query(graphene.ObjectType):
 
     @staff_member_required
     def resolve_users(self, info, page=1, per_page=10, filter={}):
-        users = resolve_model_with_filters(User, filter)
-        paginator = Paginator(users, per_page)
-        paginated_qs = paginator.page(page)
+        users = optimize_queryset(
+            resolve_model_with_filters(User, filter), info, "items"
+        ).order_by(*USER_ORDERING)
+        items, total_pages, total_items, is_estimate = paginate(users, page, per_page)
         return PaginatedUser(
-            items=paginated_qs.object_list,
-            total_pages=paginator.num_pages,
-            total_items=paginator.count,
+            items=register(info, items),
+            total_pages=total_pages,
+            total_items=total_items,
+            is_estimate=is_estimate,
+        )
+
+    @staff_member_required
+    def resolve_users_connection(self, info, first=None, after=None, filter={}):
+        users = optimize_queryset(
+            resolve_model_with_filters(User, filter), info, "items"
+        )
+        items, end_cursor, has_next_page = paginate_keyset(
+            users, USER_ORDERING, first, after
+        )
+        return UserConnection(
+            items=register(info, items),
+            end_cursor=end_cursor,
+            has_next_page=has_next_page,
         )
 
     @staff_member_required
     def resolve_businesses(self, info, page=1, per_page=10, filter={}):
-        businesses = resolve_model_with_filters(Business, filter)
-        paginator = Paginator(businesses, per_page)
-        paginated_qs = paginator.page(page)
+        businesses = optimize_queryset(
+            resolve_model_with_filters(Business, filter), info, "items"
+        ).order_by(*BUSINESS_ORDERING)
+        items, total_pages, total_items, is_estimate = paginate(
+            businesses, page, per_page
+        )
         return PaginatedBusiness(
-            items=paginated_qs.object_list,
-            total_pages=paginator.num_pages,
-            total_items=paginator.count,
+            items=register(info, items),
+            total_pages=total_pages,
+            total_items=total_items,
+            is_estimate=is_estimate,
         )
 
+    @staff_member_required
+    def resolve_businesses_connection(self, info, first=None, after=None, filter={}):
+        businesses = optimize_queryset(
+            resolve_model_with_filters(Business, filter), info, "items"
+        )
+        items, end_cursor, has_next_page = paginate_keyset(
+            businesses, BUSINESS_ORDERING, first, after
+        )
+        return BusinessConnection(
+            items=register(info, items),
+            end_cursor=end_cursor,
+            has_next_page=has_next_page,
+        )
+
+    @staff_member_required
+    def resolve_login_lockouts(self, info):
+        return [LoginLockoutType(**lockout) for lockout in get_login_lockouts()]
+
 
 # ========================Queries End========================
 
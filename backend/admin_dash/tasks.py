@@ -1,41 +1,89 @@
 # Import necessary modules
 from celery import shared_task
-from django.core.mail import EmailMultiAlternatives, BadHeaderError
+from django.core.mail import EmailMultiAlternatives, BadHeaderError, get_connection
 from django.template.loader import render_to_string
 from django.conf import settings
+from sales.models import Order
 import logging
 
 # Get logger instance for this module
 logger = logging.getLogger(__name__)
 
 
+def order_status_message(order, status):
+    """
+    Build the status email of an order loaded with its user and items.
+    """
+    status = dict(Order._meta.get_field("status").choices).get(status, status)
+    subject = f"وضعیت سفارش - {order.order_number}"
+    context = {
+        "full_name": order.user.get_full_name(),
+        "order_number": order.order_number,
+        "status": status,
+        "items": [item.name for item in order.items.all()],
+    }
+
+    text_content = render_to_string("order_status.txt", context)
+    html_content = render_to_string("order_status.html", context)
+
+    email = EmailMultiAlternatives(
+        subject, text_content, settings.EMAIL_HOST_USER, [order.user.email]
+    )
+    email.attach_alternative(html_content, "text/html")
+    return email
+
+
 @shared_task(bind=True)
-def send_order_status_email(self, user_full_name, email, order_number, status, items):
+def send_order_status_email(self, order_id, status):
+    email = None
     try:
+        order = (
+            Order.objects.select_related("user")
+            .prefetch_related("items")
+            .get(pk=order_id)
+        )
+        email = order.user.email
         logger.info(
-            f"Sending order status email to {email} for user {user_full_name}, order {order_number} with status {status}"
+            f"Sending order status email to {email} for user {order.user.get_full_name()}, order {order.order_number} with status {status}"
         )
 
-        subject = f"وضعیت سفارش - {order_number}"
-        to = email
-        context = {
-            "full_name": user_full_name,
-            "order_number": order_number,
-            "status": status,
-            "items": items,
-        }
+        order_status_message(order, status).send()
+
+        logger.info(f"Order status email sent successfully to {email}")
+        return "DONE"
 
-        text_content = render_to_string("order_status.txt", context)
-        html_content = render_to_string("order_status.html", context)
+    except Order.DoesNotExist:
+        logger.error(f"Order {order_id} no longer exists, status email not sent")
+        return "FAILED"
 
-        email = EmailMultiAlternatives(
-            subject, text_content, settings.EMAIL_HOST_USER, [to]
+    except BadHeaderError as e:
+        logger.error(f"BadHeaderError occurred: {e}")
+        return "FAILED"
+
+    except Exception as e:
+        logger.error(f"Error sending order status email to {email}: {e}")
+        raise self.retry(exc=e, countdown=60, max_retries=3)
+
+
+@shared_task(bind=True)
+def send_order_status_emails(self, order_ids, status):
+    """
+    Status emails of a batch of orders, loaded with two queries and sent
+    over a single SMTP connection.
+    """
+    try:
+        orders = (
+            Order.objects.filter(pk__in=order_ids)
+            .select_related("user")
+            .prefetch_related("items")
         )
-        email.attach_alternative(html_content, "text/html")
+        messages = [order_status_message(order, status) for order in orders]
 
-        email.send()
+        logger.info(f"Sending {len(messages)} order status emails with status {status}")
 
-        logger.info(f"Order status email sent successfully to {email}")
+        sent = get_connection().send_messages(messages)
+
+        logger.info(f"{sent} order status emails sent successfully")
         return "DONE"
 
     except BadHeaderError as e:
@@ -43,5 +91,5 @@ def send_order_status_email(self, user_full_name, email, order_number, status, i
         return "FAILED"
 
     except Exception as e:
-        logger.error(f"Error sending order status email to {email}: {e}")
+        logger.error(f"Error sending order status emails for {order_ids}: {e}")
         raise self.retry(exc=e, countdown=60, max_retries=3)
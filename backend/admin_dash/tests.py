@@ -1,3 +1,352 @@
-from django.test import TestCase
+import json
+from datetime import date
+from unittest import mock
+from django.core import mail
+from django.test import TestCase, override_settings
+from admin_dash.schema import schema
+from admin_dash.tasks import send_order_status_email, send_order_status_emails
+from sales.models import DisplayItem, Order
+from utils import test_utils
+from utils.login_throttle import record_login_failure, unlock_login
 
-# Create your tests here.
+
+class AdminQueryBudgetTests(test_utils.GraphQLBudgetTestCase):
+    url = "/api/admin_dash/graphql/"
+    schema = schema
+
+    def execute(self, query, variables=None):
+        return super().execute(query, variables, user=self.data.staff)
+
+    def test_orders(self):
+        self.execute("""{ orders { totalItems items {
+                orderNumber user { username } address { title }
+                items { name itemVariant { name } } transactions { amount }
+            } } }""")
+
+    def test_orders_connection(self):
+        query = """query ($after: String) {
+            ordersConnection(first: 2, after: $after) { endCursor hasNextPage items {
+                id user { username } items { name } transactions { amount }
+            } }
+        }"""
+        first = self.execute(query)["ordersConnection"]
+        # Orders placed meanwhile do not shift the next page
+        Order.objects.create(user=self.data.customer)
+        second = self.execute(query, {"after": first["endCursor"]})["ordersConnection"]
+        self.assertTrue(first["hasNextPage"])
+        self.assertFalse(second["hasNextPage"])
+        self.assertEqual(
+            [int(order["id"]) for order in first["items"] + second["items"]],
+            [order.id for order in reversed(self.data.orders)],
+        )
+
+    def test_connection_rejects_malformed_cursor(self):
+        result = test_utils.execute_graphql(
+            self.url,
+            '{ ordersConnection(first: 2, after: "abc") { endCursor } }',
+            user=self.data.staff,
+        )
+        self.assertEqual(result["errors"][0]["message"], "مکان نمای صفحه نامعتبر است")
+
+    def test_order(self):
+        self.execute(
+            """query ($id: ID!) { order(id: $id) {
+                orderNumber user { username } items { name } transactions { amount }
+            } }""",
+            {"id": self.data.orders[0].id},
+        )
+
+    def test_transactions(self):
+        self.execute("""{ transactions { totalItems items {
+                amount order { orderNumber user { username } }
+            } } }""")
+
+    def test_transactions_connection(self):
+        self.execute("""{ transactionsConnection(first: 10) { items {
+                amount order { orderNumber }
+            } } }""")
+
+    def test_transaction(self):
+        self.execute(
+            "query ($id: ID!) { transaction(id: $id) { amount order { orderNumber } } }",
+            {"id": self.data.orders[0].transactions.first().id},
+        )
+
+    def test_users(self):
+        self.execute("""{ users { totalItems items {
+                username business { name } addresses { title }
+            } } }""")
+
+    def test_users_connection(self):
+        self.execute(
+            "{ usersConnection(first: 10) { items { username business { name } } } }"
+        )
+
+    def test_businesses(self):
+        self.execute("{ businesses { totalItems items { name user { username } } } }")
+
+    def test_businesses_connection(self):
+        self.execute(
+            "{ businessesConnection(first: 10) { items { name user { username } } } }"
+        )
+
+    def test_create_display_item(self):
+        data = self.execute(
+            """mutation ($input: CreateDisplayItemInput!) {
+                createDisplayItem(input: $input) { success }
+            }""",
+            {"input": {"type": "j", "name": "جلومبلی"}},
+        )
+        self.assertTrue(data["createDisplayItem"]["success"])
+
+    def test_create_item_variant(self):
+        data = self.execute(
+            """mutation ($input: CreateItemVariantInput!) {
+                createItemVariant(input: $input) { success itemVariant { name } }
+            }""",
+            {
+                "input": {
+                    "displayItem": self.data.display_items[1].id,
+                    "name": "سرویس تازه",
+                    "dimensions": '{"length": 200, "width": 160, "height": 90}',
+                    "price": 1000,
+                    "description": "توضیحات",
+                    "fabric": "مخمل",
+                    "color": "سبز",
+                    "woodColor": "قهوه ای",
+                }
+            },
+        )
+        self.assertTrue(data["createItemVariant"]["success"])
+
+    def test_update_display_item(self):
+        data = self.execute(
+            """mutation ($input: UpdateDisplayItemInput!) {
+                updateDisplayItem(input: $input) { success }
+            }""",
+            {"input": {"id": self.data.display_items[0].id, "name": "مبل دیگر"}},
+        )
+        self.assertTrue(data["updateDisplayItem"]["success"])
+
+    def test_update_item_variant(self):
+        data = self.execute(
+            """mutation ($input: UpdateItemVariantInput!) {
+                updateItemVariant(input: $input) { success }
+            }""",
+            {"input": {"id": self.data.item_variants[0].id, "price": 2000}},
+        )
+        self.assertTrue(data["updateItemVariant"]["success"])
+
+    @mock.patch("admin_dash.signals.send_order_status_email")
+    def test_update_order(self, send_order_status_email):
+        order = self.data.orders[0]
+        Order.objects.filter(pk=order.pk).update(status="p")
+        data = self.execute(
+            """mutation ($input: UpdateOrderInput!) {
+                updateOrder(input: $input) { success }
+            }""",
+            {"input": {"id": order.id, "status": "a"}},
+        )
+        self.assertTrue(data["updateOrder"]["success"])
+
+    @mock.patch("admin_dash.schema.send_order_status_emails")
+    def test_bulk_transition_orders(self, send_order_status_emails):
+        Order.objects.update(status="p")
+        data = self.execute(
+            """mutation ($ids: [ID!]!) {
+                bulkTransitionOrders(ids: $ids, toStatus: "c") { success updated }
+            }""",
+            {"ids": [order.id for order in self.data.orders]},
+        )
+        self.assertEqual(data["bulkTransitionOrders"]["updated"], 3)
+
+    @mock.patch("admin_dash.schema.send_order_status_emails")
+    def test_bulk_transition_reports_malformed_ids(self, send_order_status_emails):
+        Order.objects.update(status="p")
+        data = self.execute(
+            """mutation ($ids: [ID!]!) {
+                bulkTransitionOrders(ids: $ids, toStatus: "a") { success errors }
+            }""",
+            {"ids": [self.data.orders[0].id, "abc", 999999]},
+        )
+        self.assertFalse(data["bulkTransitionOrders"]["success"])
+        self.assertEqual(
+            set(json.loads(data["bulkTransitionOrders"]["errors"])["ids"]),
+            {"abc", "999999"},
+        )
+        self.assertFalse(Order.objects.filter(status="a").exists())
+
+    @mock.patch(
+        "admin_dash.schema.BulkTransitionOrders.validate_input",
+        side_effect=RuntimeError("broken"),
+    )
+    def test_bulk_transition_logs_failures(self, validate_input):
+        with self.assertLogs("admin_dash.schema", "ERROR") as logs:
+            data = self.execute(
+                """mutation ($ids: [ID!]!) {
+                    bulkTransitionOrders(ids: $ids, toStatus: "a") { success errors }
+                }""",
+                {"ids": [self.data.orders[0].id]},
+            )
+        self.assertFalse(data["bulkTransitionOrders"]["success"])
+        self.assertIn("RuntimeError: broken", logs.output[0])
+
+    @mock.patch("admin_dash.signals.send_order_status_email")
+    def test_update_order_follows_transitions(self, send_order_status_email):
+        order = self.data.orders[0]
+        Order.objects.filter(pk=order.pk).update(status="p")
+        query = """mutation ($input: UpdateOrderInput!) {
+            updateOrder(input: $input) { success }
+        }"""
+        # Accepted, then skipping to shipped is not a transition of the table
+        for status, success in (("a", True), ("s", False), ("pp", True)):
+            data = self.execute(query, {"input": {"id": order.id, "status": status}})
+            self.assertEqual(data["updateOrder"]["success"], success, status)
+        order.refresh_from_db()
+        self.assertEqual(order.status, "pp")
+
+    def test_update_transaction(self):
+        data = self.execute(
+            """mutation ($input: UpdateTransactionInput!) {
+                updateTransaction(input: $input) { success }
+            }""",
+            {
+                "input": {
+                    "id": self.data.orders[0].transactions.first().id,
+                    "status": "a",
+                }
+            },
+        )
+        self.assertTrue(data["updateTransaction"]["success"])
+
+    def test_update_business(self):
+        data = self.execute(
+            """mutation ($input: UpdateBusinessInput!) {
+                updateBusiness(input: $input) { success }
+            }""",
+            {"input": {"id": self.data.business.id, "isConfirmed": False}},
+        )
+        self.assertTrue(data["updateBusiness"]["success"])
+
+    def test_delete_order_item(self):
+        data = self.execute(
+            """mutation ($input: DeleteOrderItemInput!) {
+                deleteOrderItem(input: $input) { success }
+            }""",
+            {"input": {"id": self.data.orders[0].items.first().id}},
+        )
+        self.assertTrue(data["deleteOrderItem"]["success"])
+
+    def test_delete_order(self):
+        data = self.execute(
+            """mutation ($input: DeleteOrderInput!) {
+                deleteOrder(input: $input) { success }
+            }""",
+            {"input": {"id": self.data.orders[0].id}},
+        )
+        self.assertTrue(data["deleteOrder"]["success"])
+
+    def test_delete_display_item(self):
+        display_item = DisplayItem.objects.create(type="c", name="آینه")
+        test_utils.create_item_variant(display_item, name="آینه کنسول")
+        data = self.execute(
+            """mutation ($input: DeleteDisplayItemInput!) {
+                deleteDisplayItem(input: $input) { success }
+            }""",
+            {"input": {"id": display_item.id}},
+        )
+        self.assertTrue(data["deleteDisplayItem"]["success"])
+
+    def test_delete_item_variant(self):
+        item_variant = test_utils.create_item_variant(
+            self.data.display_items[0], name="مبل موقت"
+        )
+        data = self.execute(
+            """mutation ($input: DeleteItemVariantInput!) {
+                deleteItemVariant(input: $input) { success }
+            }""",
+            {"input": {"id": item_variant.id}},
+        )
+        self.assertTrue(data["deleteItemVariant"]["success"])
+
+    def test_delete_transaction(self):
+        data = self.execute(
+            """mutation ($input: DeleteTransactionInput!) {
+                deleteTransaction(input: $input) { success }
+            }""",
+            {"input": {"id": self.data.orders[0].transactions.first().id}},
+        )
+        self.assertTrue(data["deleteTransaction"]["success"])
+
+    @override_settings(LOGIN_THROTTLE_USERNAME_LIMIT=1)
+    def test_login_lockouts(self):
+        self.addCleanup(unlock_login, "ip", "192.0.2.1")
+        self.addCleanup(unlock_login, "username", "locked")
+        record_login_failure("locked", "192.0.2.1")
+        data = self.execute("{ loginLockouts { kind identifier level lockedUntil } }")
+        self.assertEqual(
+            [
+                (lockout["kind"], lockout["identifier"], lockout["level"])
+                for lockout in data["loginLockouts"]
+            ],
+            [("username", "locked", 1)],
+        )
+
+        data = self.execute(
+            """mutation { unlockLogin(kind: "username", identifier: "locked") {
+                success
+            } }"""
+        )
+        self.assertTrue(data["unlockLogin"]["success"])
+        self.assertEqual(
+            self.execute("{ loginLockouts { kind } }")["loginLockouts"], []
+        )
+
+
+class OrderStatusEmailTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = test_utils.SeedData()
+
+    def test_changed_fields(self):
+        order = Order.objects.get(pk=self.data.orders[0].pk)
+        self.assertEqual(order.changed_fields, [])
+        order.status = "p"
+        self.assertEqual(order.changed_fields, ["status"])
+        order.save()
+        self.assertEqual(order.changed_fields, [])
+
+        # Fields that were not loaded are left out
+        order = Order.objects.only("status").get(pk=order.pk)
+        order.due_date = date(2030, 1, 1)
+        self.assertEqual(order.changed_fields, [])
+
+    @mock.patch("admin_dash.signals.send_order_status_email")
+    def test_email_is_queued_when_the_status_changes(self, send_order_status_email):
+        order = Order.objects.get(pk=self.data.orders[0].pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            order.due_date = date(2030, 1, 1)
+            order.save()
+        send_order_status_email.delay.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = "p"
+            order.save()
+        send_order_status_email.delay.assert_called_once_with(order.id, "p")
+
+    def test_worker_loads_the_order(self):
+        order = self.data.orders[0]
+        with self.assertNumQueries(2):
+            send_order_status_email(order.id, "a")
+        (email,) = mail.outbox
+        self.assertEqual(email.to, [self.data.customer.email])
+        self.assertIn(order.order_number, email.subject)
+        self.assertIn("تایید شده", email.body)
+
+    def test_batch_is_loaded_at_once(self):
+        with self.assertNumQueries(2):
+            send_order_status_emails([order.id for order in self.data.orders], "c")
+        self.assertEqual(
+            sorted(email.subject for email in mail.outbox),
+            sorted(f"وضعیت سفارش - {order.order_number}" for order in self.data.orders),
+        )
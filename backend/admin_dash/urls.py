@@ -1,7 +1,7 @@
 from django.urls import path
 from django.views.decorators.csrf import csrf_exempt
-from graphene_django.views import GraphQLView
 from graphql_jwt.decorators import jwt_cookie
+from utils.graphql_view import CachedGraphQLView
 from admin_dash.schema import schema
 from utils.schema_utils import django_staff_member_required
 
@@ -11,7 +11,9 @@ urlpatterns = [
         jwt_cookie(
             csrf_exempt(
                 django_staff_member_required(
-                    GraphQLView.as_view(graphiql=False, schema=schema)
+                    CachedGraphQLView.as_view(
+                        graphiql=False, schema=schema, endpoint="admin_dash"
+                    )
                 )
             )
         ),
@@ -117,7 +117,7 @@ AUTHENTICATION_BACKENDS = [
 
 GRAPHENE = {
     "MIDDLEWARE": [
-        "graphql_jwt.middleware.JSONWebTokenMiddleware",
+        "utils.auth_context.AuthContextMiddleware",
     ],
 }
 
@@ -135,7 +135,7 @@ CORS_ALLOWED_ORIGINS = config("ALLOWED_ORIGINS", cast=Csv())
 
 CORS_ALLOW_CREDENTIALS = True
 
-CORS_ALLOW_METHODS = ["POST", "OPTIONS"]
+CORS_ALLOW_METHODS = ["GET", "POST", "OPTIONS"]
 
 # Allow specific HTTP headers
 CORS_ALLOW_HEADERS = [
@@ -146,6 +146,7 @@ CORS_ALLOW_HEADERS = [
     "User-Agent",
     "DNT",
     "Cache-Control",
+    "If-None-Match",
     "X-Mx-ReqToken",
     "X-Requested-With",
     "X-CSRFToken",
@@ -156,6 +157,7 @@ CORS_ALLOW_HEADERS = [
 # Expose specific headers to the browser
 CORS_EXPOSE_HEADERS = [
     "Content-Type",
+    "ETag",
     "X-CSRFToken",
 ]
 
@@ -182,12 +184,109 @@ DEFAULT_FROM_EMAIL = config("DEFAULT_FROM_EMAIL")
 
 OPTIMIZED_IMAGE_METHOD = "pillow"
 
-# CACHES = {
-#     "default": {
-#         "BACKEND": "django_redis.cache.RedisCache",
-#         "LOCATION": "redis://redis:6379/2",
-#         "OPTIONS": {
-#             "CLIENT_CLASS": "django_redis.client.DefaultClient",
-#         },
-#     }
-# }
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": config("REDIS_CACHE_URL", default="redis://redis:6379/2"),
+    }
+}
+
+# Shared pool for the features that talk to Redis directly
+REDIS_URL = config("REDIS_URL", default="redis://redis:6379/3")
+REDIS_MAX_CONNECTIONS = config("REDIS_MAX_CONNECTIONS", default=50, cast=int)
+REDIS_SOCKET_TIMEOUT = config("REDIS_SOCKET_TIMEOUT", default=1.0, cast=float)
+# Revoked JWTs live in Redis until they expire, see utils/token_revocation.py
+REVOKED_TOKENS_BLOOM_FILTER = config(
+    "REVOKED_TOKENS_BLOOM_FILTER", default=False, cast=bool
+)
+REVOKED_TOKENS_BLOOM_REFRESH = config(
+    "REVOKED_TOKENS_BLOOM_REFRESH", default=5, cast=int
+)
+REVOKED_TOKENS_BLOOM_CAPACITY = config(
+    "REVOKED_TOKENS_BLOOM_CAPACITY", default=100000, cast=int
+)
+REVOKED_TOKENS_BLOOM_ERROR_RATE = config(
+    "REVOKED_TOKENS_BLOOM_ERROR_RATE", default=0.001, cast=float
+)
+
+# Parsed GraphQL documents kept per schema in each worker
+GRAPHQL_DOCUMENT_CACHE_SIZE = config(
+    "GRAPHQL_DOCUMENT_CACHE_SIZE", default=256, cast=int
+)
+# Only execute persisted queries registered with register_persisted_queries
+GRAPHQL_PERSISTED_QUERIES_ONLY = config(
+    "GRAPHQL_PERSISTED_QUERIES_ONLY", default=False, cast=bool
+)
+# Seconds a persisted query registered by a client is kept
+GRAPHQL_PERSISTED_QUERY_TIMEOUT = config(
+    "GRAPHQL_PERSISTED_QUERY_TIMEOUT", default=24 * 60 * 60, cast=int
+)
+# Static cost budgets checked before execution, see utils/graphql_cost.py
+GRAPHQL_DEFAULT_LIST_SIZE = config("GRAPHQL_DEFAULT_LIST_SIZE", default=10, cast=int)
+GRAPHQL_COST_LIMITS = {
+    "sales": config("GRAPHQL_MAX_COST_SALES", default=2000, cast=int),
+    "users": config("GRAPHQL_MAX_COST_USERS", default=500, cast=int),
+    "admin_dash": config("GRAPHQL_MAX_COST_ADMIN_DASH", default=20000, cast=int),
+}
+# Page sizes of the cursor paginated lists
+GRAPHQL_DEFAULT_PAGE_SIZE = config("GRAPHQL_DEFAULT_PAGE_SIZE", default=10, cast=int)
+GRAPHQL_MAX_PAGE_SIZE = config("GRAPHQL_MAX_PAGE_SIZE", default=100, cast=int)
+# Larger lists get estimated totals, see utils/pagination.py
+GRAPHQL_EXACT_COUNT_THRESHOLD = config(
+    "GRAPHQL_EXACT_COUNT_THRESHOLD", default=10000, cast=int
+)
+GRAPHQL_COUNT_CACHE_TIMEOUT = config(
+    "GRAPHQL_COUNT_CACHE_TIMEOUT", default=60, cast=int
+)
+# Cached catalog resolvers, invalidated by the signals in sales/signals.py
+RESULT_CACHE_TIMEOUT = config("RESULT_CACHE_TIMEOUT", default=3600, cast=int)
+RESULT_CACHE_LOCK_TIMEOUT = config("RESULT_CACHE_LOCK_TIMEOUT", default=5, cast=int)
+# Staff bulk order status changes, see admin_dash.schema.BulkTransitionOrders
+BULK_TRANSITION_MAX_ORDERS = config(
+    "BULK_TRANSITION_MAX_ORDERS", default=1000, cast=int
+)
+ORDER_EMAIL_BATCH_SIZE = config("ORDER_EMAIL_BATCH_SIZE", default=50, cast=int)
+# Draft carts in Redis, see sales/cart.py
+CART_TIMEOUT = config("CART_TIMEOUT", default=30 * 24 * 60 * 60, cast=int)
+# What to do when a GraphQL operation runs more SQL queries than the budget
+# its schema declares: "raise", "log" or empty to skip counting
+GRAPHQL_QUERY_BUDGET_ACTION = config(
+    "GRAPHQL_QUERY_BUDGET_ACTION", default="log" if DEBUG else ""
+)
+# Catalog file shared by the workers through mmap, rebuilt by
+# sales.tasks.build_catalog_snapshot a few seconds after catalog changes.
+# Empty serves the catalog from the database and the result cache only
+CATALOG_SNAPSHOT_PATH = config(
+    "CATALOG_SNAPSHOT_PATH", default=str(BASE_DIR / "catalog.snapshot")
+)
+CATALOG_SNAPSHOT_DELAY = config("CATALOG_SNAPSHOT_DELAY", default=5, cast=int)
+# Emailed verification and OTP codes, see utils/email_verification.py. A code
+# is not emailed again to the same address for VERIFICATION_EMAIL_COOLDOWN
+# seconds, the one already sent is still valid
+VERIFICATION_CODE_TIMEOUT = config("VERIFICATION_CODE_TIMEOUT", default=300, cast=int)
+VERIFICATION_CODE_MAX_ATTEMPTS = config(
+    "VERIFICATION_CODE_MAX_ATTEMPTS", default=5, cast=int
+)
+VERIFICATION_EMAIL_COOLDOWN = config(
+    "VERIFICATION_EMAIL_COOLDOWN", default=60, cast=int
+)
+# Failed logins counted per username and per client ip over a sliding
+# window, see utils/login_throttle.py. Reaching a limit locks the subject
+# out for LOGIN_THROTTLE_LOCKOUT seconds, doubled for each further lockout
+# within LOGIN_THROTTLE_LEVEL_TIMEOUT and capped at LOGIN_THROTTLE_MAX_LOCKOUT
+LOGIN_THROTTLE_WINDOW = config("LOGIN_THROTTLE_WINDOW", default=15 * 60, cast=int)
+LOGIN_THROTTLE_USERNAME_LIMIT = config(
+    "LOGIN_THROTTLE_USERNAME_LIMIT", default=5, cast=int
+)
+LOGIN_THROTTLE_IP_LIMIT = config("LOGIN_THROTTLE_IP_LIMIT", default=20, cast=int)
+LOGIN_THROTTLE_LOCKOUT = config("LOGIN_THROTTLE_LOCKOUT", default=30, cast=int)
+LOGIN_THROTTLE_MAX_LOCKOUT = config(
+    "LOGIN_THROTTLE_MAX_LOCKOUT", default=60 * 60, cast=int
+)
+LOGIN_THROTTLE_LEVEL_TIMEOUT = config(
+    "LOGIN_THROTTLE_LEVEL_TIMEOUT", default=24 * 60 * 60, cast=int
+)
+LOGIN_THROTTLE_IP_HEADER = config("LOGIN_THROTTLE_IP_HEADER", default="REMOTE_ADDR")
+# Seconds a worker serves its province/city index before checking whether
+# another process changed the tables, see main/geo_index.py
+GEO_INDEX_CHECK_INTERVAL = config("GEO_INDEX_CHECK_INTERVAL", default=5, cast=int)
@@ -0,0 +1,124 @@
+import hashlib
+import re
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+from django.conf import settings
+from django.core.cache import cache
+from main.models import Cities, Provinces
+
+GEO_INDEX_VERSION_KEY = "geo_index_version"
+
+Province = namedtuple("Province", ["id", "name", "city_ids"])
+City = namedtuple("City", ["id", "name", "province_id"])
+
+
+def normalize_name(name):
+    """
+    Arabic yeh/kaf become their Persian forms and zero-width non-joiners and
+    runs of whitespace become single spaces, so "خرم‌آباد" finds "خرم آباد".
+    """
+    name = (name or "").replace("ي", "ی").replace("ك", "ک").replace("‌", " ")
+    return re.sub(r"\s+", " ", name).strip()
+
+
+class GeoIndex:
+    """
+    Immutable snapshot of the Provinces and Cities tables, keyed by id and
+    by normalized name. City names are only unique within a province, so
+    cities are looked up by name inside their province.
+    """
+
+    def __init__(self, provinces, cities, token=None):
+        city_ids = {province_id: [] for province_id, _ in provinces}
+        for city_id, _, province_id in cities:
+            city_ids[province_id].append(city_id)
+
+        self.token = token
+        self.provinces = MappingProxyType(
+            {
+                province_id: Province(province_id, name, tuple(city_ids[province_id]))
+                for province_id, name in provinces
+            }
+        )
+        self.cities = MappingProxyType(
+            {
+                city_id: City(city_id, name, province_id)
+                for city_id, name, province_id in cities
+            }
+        )
+        self.province_ids = MappingProxyType(
+            {normalize_name(p.name): p.id for p in self.provinces.values()}
+        )
+        self.city_ids = MappingProxyType(
+            {
+                (c.province_id, normalize_name(c.name)): c.id
+                for c in self.cities.values()
+            }
+        )
+
+        digest = hashlib.sha256()
+        for province in self.provinces.values():
+            digest.update(f"p{province.id}:{province.name}\n".encode("utf-8"))
+        for city in self.cities.values():
+            digest.update(
+                f"c{city.id}:{city.province_id}:{city.name}\n".encode("utf-8")
+            )
+        self.version = digest.hexdigest()
+
+    @classmethod
+    def load(cls, token=None):
+        return cls(
+            list(Provinces.objects.order_by("id").values_list("id", "name")),
+            list(
+                Cities.objects.order_by("id").values_list("id", "name", "province_id")
+            ),
+            token,
+        )
+
+    def province(self, name):
+        province_id = self.province_ids.get(normalize_name(name))
+        return self.provinces[province_id] if province_id is not None else None
+
+    def city(self, province_id, name):
+        city_id = self.city_ids.get((province_id, normalize_name(name)))
+        return self.cities[city_id] if city_id is not None else None
+
+    def cities_of(self, province_id):
+        province = self.provinces.get(province_id)
+        if province is None:
+            return []
+        return [self.cities[city_id] for city_id in province.city_ids]
+
+
+geo_index = None
+geo_index_checked = 0
+geo_index_lock = threading.Lock()
+
+
+def get_geo_index():
+    """
+    The index of this worker, loaded on first use. Whether another process
+    changed the tables and called invalidate_geo_index() is checked at most
+    once per GEO_INDEX_CHECK_INTERVAL seconds, other lookups are local.
+    """
+    global geo_index, geo_index_checked
+    index = geo_index
+    if index is not None and time.monotonic() < geo_index_checked:
+        return index
+
+    token = cache.get_or_set(GEO_INDEX_VERSION_KEY, time.time_ns, timeout=None)
+    with geo_index_lock:
+        index = geo_index
+        if index is None or index.token != token:
+            index = geo_index = GeoIndex.load(token)
+        geo_index_checked = time.monotonic() + settings.GEO_INDEX_CHECK_INTERVAL
+    return index
+
+
+def invalidate_geo_index():
+    """Reload the index of every worker, this one on its next lookup."""
+    global geo_index_checked
+    cache.set(GEO_INDEX_VERSION_KEY, time.time_ns(), timeout=None)
+    geo_index_checked = 0
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from utils.graphql_cost import get_cost_report
+
+
+class Command(BaseCommand):
+    help = "Print the histogram of GraphQL operation costs of each endpoint"
+
+    def handle(self, *args, **options):
+        for endpoint, limit in settings.GRAPHQL_COST_LIMITS.items():
+            self.stdout.write(self.style.SUCCESS(f"{endpoint} (limit {limit})"))
+            for bucket, count in get_cost_report(endpoint).items():
+                label = bucket if bucket == "rejected" else f"<= {bucket}"
+                self.stdout.write(f"  {label}: {count}")
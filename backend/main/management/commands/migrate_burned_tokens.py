@@ -0,0 +1,39 @@
+import jwt
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from main.models import BurnedTokens
+from utils.token_revocation import revoke_token
+
+
+class Command(BaseCommand):
+    help = "Move the still valid BurnedTokens rows to the Redis revocation store and empty the table"
+
+    def handle(self, *args, **options):
+        moved = 0
+        dropped = 0
+        for burned_token in BurnedTokens.objects.iterator():
+            token = burned_token.token or ""
+            if token.startswith("Bearer "):
+                token = token.split(" ")[1]
+            try:
+                payload = jwt.decode(
+                    token,
+                    settings.GRAPHQL_JWT["JWT_SECRET_KEY"],
+                    algorithms=[settings.GRAPHQL_JWT["JWT_ALGORITHM"]],
+                    options={"verify_exp": False},
+                )
+            except jwt.InvalidTokenError:
+                dropped += 1
+                continue
+
+            if revoke_token(token, payload["exp"]):
+                moved += 1
+            else:
+                dropped += 1
+
+        BurnedTokens.objects.all().delete()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Moved {moved} revoked tokens to Redis, dropped {dropped} expired or invalid ones"
+            )
+        )
@@ -0,0 +1,35 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from utils.graphql_view import hash_query, register_persisted_query
+
+
+class Command(BaseCommand):
+    help = "Register the GraphQL documents allowed when GRAPHQL_PERSISTED_QUERIES_ONLY is set"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "manifest",
+            help="JSON file with either a {sha256: query} object or a list of queries",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["manifest"], encoding="utf-8") as file:
+                manifest = json.load(file)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read manifest: {e}")
+
+        if isinstance(manifest, dict):
+            for sha256_hash, query in manifest.items():
+                if hash_query(query) != sha256_hash:
+                    raise CommandError(f"Hash {sha256_hash} does not match its query")
+            queries = manifest.values()
+        else:
+            queries = manifest
+
+        count = 0
+        for query in queries:
+            register_persisted_query(query)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Registered {count} persisted queries"))
@@ -0,0 +1,15 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from main.geo_index import invalidate_geo_index
+from main.models import Cities, Provinces
+
+
+@receiver([post_save, post_delete], sender=Provinces)
+@receiver([post_save, post_delete], sender=Cities)
+def invalidate_geo(sender, instance, **kwargs):
+    """
+    Make every worker reload its province/city index, once the change is
+    visible to them.
+    """
+    transaction.on_commit(invalidate_geo_index)
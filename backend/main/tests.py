@@ -1,3 +1,225 @@
-from django.test import TestCase
+import json
+from unittest import mock
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import Client, SimpleTestCase, TestCase
+from django.test import override_settings
+from graphql import parse
+from admin_dash.schema import schema as admin_schema
+from main import geo_index
+from main.geo_index import GeoIndex, normalize_name
+from main.models import Provinces
+from users.schema import schema as users_schema
+from utils import pagination
+from utils.graphql_cost import get_cost_report, operation_cost
+from utils.graphql_view import DocumentCache, document_caches, hash_query
 
-# Create your tests here.
+
+class GeoIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = GeoIndex(
+            [(1, "آذربایجان غربی"), (2, "فارس")],
+            [(1, "سردشت", 1), (2, "مهاباد", 1), (3, "سردشت", 2)],
+        )
+
+    def test_normalize_name(self):
+        self.assertEqual(normalize_name(" خرم‌آباد "), "خرم آباد")
+        self.assertEqual(normalize_name("كرمانشاه"), normalize_name("کرمانشاه"))
+
+    def test_city_within_province(self):
+        province = self.index.province("فارس")
+        self.assertEqual(self.index.city(province.id, "سردشت").id, 3)
+        self.assertIsNone(self.index.city(province.id, "مهاباد"))
+        self.assertEqual(
+            [city.name for city in self.index.cities_of(1)], ["سردشت", "مهاباد"]
+        )
+
+    def test_version_follows_content(self):
+        renamed = GeoIndex([(1, "آذربایجان غربی"), (2, "فارس")], [(1, "سردشت", 1)])
+        self.assertNotEqual(renamed.version, self.index.version)
+        self.assertEqual(
+            GeoIndex(
+                [(1, "آذربایجان غربی"), (2, "فارس")],
+                [(1, "سردشت", 1), (2, "مهاباد", 1), (3, "سردشت", 2)],
+            ).version,
+            self.index.version,
+        )
+
+
+class GeoIndexRefreshTests(TestCase):
+    def setUp(self):
+        Provinces.objects.create(name="تهران")
+        geo_index.invalidate_geo_index()
+
+    def test_version_is_checked_once_per_interval(self):
+        index = geo_index.get_geo_index()
+        with mock.patch.object(geo_index, "cache") as shared_cache:
+            for _ in range(3):
+                self.assertIs(geo_index.get_geo_index(), index)
+        shared_cache.get_or_set.assert_not_called()
+
+    def test_change_from_another_process(self):
+        with override_settings(GEO_INDEX_CHECK_INTERVAL=60):
+            index = geo_index.get_geo_index()
+        Provinces.objects.create(name="فارس")
+        cache.set(geo_index.GEO_INDEX_VERSION_KEY, 0, timeout=None)
+        self.assertIs(geo_index.get_geo_index(), index)
+
+        with override_settings(GEO_INDEX_CHECK_INTERVAL=0):
+            geo_index.geo_index_checked = 0
+            self.assertIsNotNone(geo_index.get_geo_index().province("فارس"))
+
+
+class DocumentCacheTests(SimpleTestCase):
+    def test_least_recently_used_is_evicted(self):
+        documents = DocumentCache(2)
+        documents.set("a", 1)
+        documents.set("b", 2)
+        documents.get("a")
+        documents.set("c", 3)
+        self.assertIsNone(documents.get("b"))
+        self.assertEqual(documents.get("a"), 1)
+        self.assertEqual(documents.get("c"), 3)
+
+
+class PersistedQueryTests(TestCase):
+    url = "/api/users/graphql/"
+
+    def post(self, body):
+        return Client().post(
+            self.url, json.dumps(body), content_type="application/json"
+        )
+
+    def persisted(self, sha256_hash, query=None):
+        body = {
+            "extensions": {"persistedQuery": {"version": 1, "sha256Hash": sha256_hash}}
+        }
+        if query is not None:
+            body["query"] = query
+        return self.post(body)
+
+    def error_code(self, response):
+        return response.json()["errors"][0]["extensions"]["code"]
+
+    def test_miss_register_hit(self):
+        query = "query PersistedMissRegisterHit { __typename }"
+        sha256_hash = hash_query(query)
+        self.addCleanup(cache.delete, f"persisted_query_{sha256_hash}")
+
+        response = self.persisted(sha256_hash)
+        self.assertEqual(self.error_code(response), "PersistedQueryNotFound")
+
+        with mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+            response = self.persisted(sha256_hash, query)
+        self.assertEqual(response.json()["data"], {"__typename": "Query"})
+        self.assertIsNotNone(cache_set.call_args.kwargs["timeout"])
+
+        # Served from the shared cache, not from this worker's documents
+        document_caches.clear()
+        response = self.persisted(sha256_hash)
+        self.assertEqual(response.json()["data"], {"__typename": "Query"})
+
+    def test_hash_mismatch(self):
+        response = self.persisted(hash_query("{ __typename }"), "{ provinces { id } }")
+        self.assertEqual(self.error_code(response), "PersistedQueryHashMismatch")
+
+    def test_extensions_must_be_objects(self):
+        for extensions in ([1], "5", {"persistedQuery": "abc"}):
+            response = self.post({"query": "{ __typename }", "extensions": extensions})
+            self.assertEqual(response.status_code, 400, extensions)
+
+
+@override_settings(GRAPHQL_EXACT_COUNT_THRESHOLD=100)
+class CountQuerysetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Provinces.objects.bulk_create(
+            [Provinces(name=name) for name in ("تهران", "فارس", "گیلان")]
+        )
+
+    def test_small_tables_are_counted_exactly(self):
+        with mock.patch.object(pagination, "table_estimate", return_value=50):
+            with self.assertNumQueries(1):
+                count = pagination.count_queryset(Provinces.objects.all())
+        self.assertEqual(count, (3, False))
+
+    def test_large_tables_use_the_estimate_or_a_cached_count(self):
+        with mock.patch.object(pagination, "table_estimate", return_value=5000):
+            with self.assertNumQueries(0):
+                count = pagination.count_queryset(Provinces.objects.all())
+            self.assertEqual(count, (5000, True))
+
+            filtered = Provinces.objects.filter(name="فارس")
+            with mock.patch.object(pagination, "cache", LocMemCache("counts", {})):
+                with self.assertNumQueries(1):
+                    self.assertEqual(pagination.count_queryset(filtered), (1, False))
+                with self.assertNumQueries(0):
+                    self.assertEqual(pagination.count_queryset(filtered), (1, True))
+
+    def test_table_estimate_is_read_once_per_interval(self):
+        connection = mock.MagicMock(vendor="postgresql")
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = (1234.0,)
+        self.addCleanup(pagination.table_estimates.clear)
+        with mock.patch.object(pagination, "connections", {"default": connection}):
+            for _ in range(3):
+                self.assertEqual(pagination.table_estimate(Provinces), 1234)
+        cursor.execute.assert_called_once()
+
+
+@override_settings(GRAPHQL_DEFAULT_LIST_SIZE=10)
+class OperationCostTests(SimpleTestCase):
+    def cost(self, schema, query, variables=None):
+        return operation_cost(schema.graphql_schema, parse(query), None, variables)
+
+    def test_lists_multiply_their_items(self):
+        self.assertEqual(
+            self.cost(
+                users_schema,
+                "{ provinces { name } currentUser { addresses { title } } }",
+            ),
+            21,
+        )
+
+    def test_page_size_argument(self):
+        query = """query ($first: Int) { ordersConnection(first: $first) {
+            endCursor items { user { username } items { name } }
+        } }"""
+        self.assertEqual(self.cost(admin_schema, query, {"first": 50}), 601)
+        self.assertEqual(self.cost(admin_schema, query, {"first": 5}), 61)
+
+    def test_fragments(self):
+        query = """{ currentUser { ...Addresses } }
+        fragment Addresses on UserType { ... on UserType { addresses { title } } }"""
+        self.assertEqual(self.cost(users_schema, query), 11)
+
+
+@override_settings(GRAPHQL_DEFAULT_LIST_SIZE=10)
+class CostLimitTests(TestCase):
+    url = "/api/users/graphql/"
+
+    def post(self, query):
+        return (
+            Client()
+            .post(
+                self.url, json.dumps({"query": query}), content_type="application/json"
+            )
+            .json()
+        )
+
+    def test_expensive_operation_is_rejected_before_execution(self):
+        rejected = get_cost_report("users")["rejected"]
+        with self.settings(
+            GRAPHQL_COST_LIMITS={**settings.GRAPHQL_COST_LIMITS, "users": 20}
+        ):
+            with self.assertNumQueries(0):
+                result = self.post(
+                    "{ provinces { name } currentUser { addresses { title } } }"
+                )
+            self.assertNotIn("errors", self.post("{ provinces { name } }"))
+        self.assertEqual(
+            result["errors"][0]["extensions"],
+            {"code": "QueryTooExpensive", "cost": 21, "limit": 20},
+        )
+        self.assertEqual(get_cost_report("users")["rejected"], rejected + 1)
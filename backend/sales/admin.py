@@ -32,7 +32,7 @@ class OrderAdmin(admin.ModelAdmin):
     )
     search_fields = ("order_number", "user__username")
     list_filter = ("status", "creation_date", "due_date")
-    readonly_fields = ("creation_date", "order_number")
+    readonly_fields = ("creation_date", "order_number", "total_price")
 
 
 # Registering OrderItem
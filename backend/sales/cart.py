@@ -0,0 +1,90 @@
+from django.conf import settings
+from utils.redis_pool import get_redis
+
+CART_PREFIX = "cart:"
+
+
+def cart_key(user_id):
+    return f"{CART_PREFIX}{user_id}"
+
+
+def get_cart(user_id):
+    """
+    Draft cart of the user as {item_variant_id: {"quantity", "description"}}.
+    A cart is one Redis hash holding "<id>" -> quantity and
+    "<id>:description" -> description fields, kept for CART_TIMEOUT seconds
+    after its last change.
+    """
+    return parse_cart(get_redis().hgetall(cart_key(user_id)))
+
+
+def parse_cart(fields):
+    items = {}
+    descriptions = {}
+    for field, value in fields.items():
+        field, value = field.decode(), value.decode()
+        if field.endswith(":description"):
+            descriptions[int(field.split(":")[0])] = value
+        else:
+            items[int(field)] = {"quantity": int(value), "description": None}
+    for item_variant_id, description in descriptions.items():
+        if item_variant_id in items:
+            items[item_variant_id]["description"] = description
+    return items
+
+
+def set_cart_item(
+    user_id, item_variant_id, quantity=None, increment=0, description=None
+):
+    key = cart_key(user_id)
+    pipe = get_redis().pipeline()
+    if quantity is not None:
+        pipe.hset(key, item_variant_id, quantity)
+    if increment:
+        pipe.hincrby(key, item_variant_id, increment)
+    if description is not None:
+        pipe.hset(key, f"{item_variant_id}:description", description)
+    pipe.expire(key, settings.CART_TIMEOUT)
+    pipe.execute()
+
+
+def add_to_cart(user_id, item_variant_id, quantity, description=None):
+    set_cart_item(user_id, item_variant_id, increment=quantity, description=description)
+
+
+def remove_from_cart(user_id, *item_variant_ids):
+    if not item_variant_ids:
+        return
+    fields = []
+    for item_variant_id in item_variant_ids:
+        fields += [item_variant_id, f"{item_variant_id}:description"]
+    get_redis().hdel(cart_key(user_id), *fields)
+
+
+def take_cart(user_id):
+    """
+    Read and delete the cart in one MULTI, so an item added meanwhile is
+    either part of the returned cart or left in Redis.
+    """
+    pipe = get_redis().pipeline()
+    pipe.hgetall(cart_key(user_id))
+    pipe.delete(cart_key(user_id))
+    fields, _ = pipe.execute()
+    return parse_cart(fields)
+
+
+def restore_cart(user_id, cart):
+    """
+    Put back items of a cart taken by take_cart(), adding to any quantity
+    stored since and keeping a newer description.
+    """
+    if not cart:
+        return
+    key = cart_key(user_id)
+    pipe = get_redis().pipeline()
+    for item_variant_id, item in cart.items():
+        pipe.hincrby(key, item_variant_id, item["quantity"])
+        if item["description"] is not None:
+            pipe.hsetnx(key, f"{item_variant_id}:description", item["description"])
+    pipe.expire(key, settings.CART_TIMEOUT)
+    pipe.execute()
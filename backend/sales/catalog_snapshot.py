@@ -0,0 +1,411 @@
+import bisect
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from sales.models import DisplayItem, ItemVariant
+from utils.result_cache import get_versions
+
+# File layout: header, display item records, item variant records (both
+# sorted by id), the variant record indices of every display item, then
+# the UTF-8 strings the records point to with (offset, length) pairs.
+MAGIC = b"CTLG"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sIQIIQ")
+DISPLAY_ITEM = struct.Struct("<qcIIII")
+ITEM_VARIANT = struct.Struct("<qqQ??" + "II" * 10)
+VARIANT_INDEX = struct.Struct("<I")
+RECORD_ID = struct.Struct("<q")
+NULL = 0xFFFFFFFF
+
+VARIANT_COLUMNS = (
+    "id",
+    "display_item__id",
+    "price",
+    "show_in_first_page",
+    "is_for_business",
+)
+VARIANT_STRINGS = (
+    "name",
+    "dimensions",
+    "description",
+    "fabric",
+    "color",
+    "wood_color",
+    "thumbnail",
+    "slider1",
+    "slider2",
+    "slider3",
+)
+
+# Fields the listing filters may use, with the type their values are cast to
+DISPLAY_ITEM_FILTERS = {"id": int, "type": str, "name": str}
+ITEM_VARIANT_FILTERS = {
+    "id": int,
+    "display_item__id": int,
+    "name": str,
+    "price": int,
+    "fabric": str,
+    "color": str,
+    "wood_color": str,
+    "show_in_first_page": bool,
+    "is_for_business": bool,
+}
+LOOKUPS = {
+    "exact": lambda value, other: value == other,
+    "in": lambda value, others: value in others,
+    "iexact": lambda value, other: value.upper() == other.upper(),
+    "icontains": lambda value, other: other.upper() in value.upper(),
+    "gt": lambda value, other: value > other,
+    "lt": lambda value, other: value < other,
+    "gte": lambda value, other: value >= other,
+    "lte": lambda value, other: value <= other,
+}
+
+
+class StringTable:
+    def __init__(self):
+        self.blob = bytearray()
+        self.offsets = {}
+
+    def add(self, value):
+        if value is None:
+            return 0, NULL
+        data = value.encode("utf-8")
+        if data not in self.offsets:
+            self.offsets[data] = len(self.blob)
+            self.blob += data
+        return self.offsets[data], len(data)
+
+
+def write_catalog_snapshot(path=None):
+    """
+    Write the catalog to a new file next to path and move it over path, so
+    readers see either the previous snapshot or the complete new one.
+    """
+    path = path or settings.CATALOG_SNAPSHOT_PATH
+    # Read before the rows: a change committed meanwhile bumps the version
+    # again and the snapshot is rebuilt rather than served stale
+    (version,) = get_versions(["catalog"])
+    display_items = list(
+        DisplayItem.objects.order_by("id").values_list("id", "type", "name")
+    )
+    item_variants = list(
+        ItemVariant.objects.order_by("id").values_list(
+            "id",
+            "display_item_id",
+            "price",
+            "show_in_first_page",
+            "is_for_business",
+            *VARIANT_STRINGS,
+        )
+    )
+
+    variant_indices = {id: [] for id, _, _ in display_items}
+    for index, variant in enumerate(item_variants):
+        variant_indices[variant[1]].append(index)
+
+    strings = StringTable()
+    records = bytearray()
+    position = 0
+    for id, type, name in display_items:
+        count = len(variant_indices[id])
+        records += DISPLAY_ITEM.pack(
+            id, type.encode("ascii"), *strings.add(name), position, count
+        )
+        position += count
+    for id, display_item_id, price, show, business, *values in item_variants:
+        values[1] = json.dumps(values[1], ensure_ascii=False)
+        refs = [ref for value in values for ref in strings.add(value)]
+        records += ITEM_VARIANT.pack(id, display_item_id, price, show, business, *refs)
+    for id, _, _ in display_items:
+        for index in variant_indices[id]:
+            records += VARIANT_INDEX.pack(index)
+
+    strings_offset = HEADER.size + len(records)
+    header = HEADER.pack(
+        MAGIC,
+        FORMAT_VERSION,
+        version,
+        len(display_items),
+        len(item_variants),
+        strings_offset,
+    )
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile(
+        dir=directory, prefix=f"{os.path.basename(path)}.", delete=False
+    ) as file:
+        file.write(header)
+        file.write(records)
+        file.write(strings.blob)
+        file.flush()
+        os.fsync(file.fileno())
+    os.chmod(file.name, 0o644)
+    os.replace(file.name, path)
+    return version
+
+
+class RecordIds:
+    """Ids of fixed size records read in place, for bisect."""
+
+    def __init__(self, buffer, offset, size, count):
+        self.buffer = buffer
+        self.offset = offset
+        self.size = size
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return RECORD_ID.unpack_from(self.buffer, self.offset + index * self.size)[0]
+
+
+class CatalogSnapshot:
+    """
+    Read-only view of a snapshot file. The file is mapped rather than read,
+    so every worker of the host shares the same pages and records are only
+    decoded when a query reaches them.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            stat = os.fstat(file.fileno())
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.file_id = (stat.st_ino, stat.st_mtime_ns)
+        (
+            magic,
+            format_version,
+            self.version,
+            self.display_item_count,
+            self.item_variant_count,
+            self.strings_offset,
+        ) = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a catalog snapshot")
+
+        self.display_items_offset = HEADER.size
+        self.item_variants_offset = (
+            self.display_items_offset + self.display_item_count * DISPLAY_ITEM.size
+        )
+        self.variant_indices_offset = (
+            self.item_variants_offset + self.item_variant_count * ITEM_VARIANT.size
+        )
+        self.display_item_ids = RecordIds(
+            self.buffer,
+            self.display_items_offset,
+            DISPLAY_ITEM.size,
+            self.display_item_count,
+        )
+        self.item_variant_ids = RecordIds(
+            self.buffer,
+            self.item_variants_offset,
+            ITEM_VARIANT.size,
+            self.item_variant_count,
+        )
+
+    def string(self, offset, length):
+        if length == NULL:
+            return None
+        start = self.strings_offset + offset
+        return self.buffer[start : start + length].decode("utf-8")
+
+    def display_item_record(self, index):
+        return DISPLAY_ITEM.unpack_from(
+            self.buffer, self.display_items_offset + index * DISPLAY_ITEM.size
+        )
+
+    def item_variant_record(self, index):
+        return ITEM_VARIANT.unpack_from(
+            self.buffer, self.item_variants_offset + index * ITEM_VARIANT.size
+        )
+
+    def variant_indices(self, position, count):
+        return [
+            VARIANT_INDEX.unpack_from(
+                self.buffer, self.variant_indices_offset + i * VARIANT_INDEX.size
+            )[0]
+            for i in range(position, position + count)
+        ]
+
+    def find(self, ids, id):
+        try:
+            id = int(id)
+        except (TypeError, ValueError):
+            return None
+        index = bisect.bisect_left(ids, id)
+        return index if index < len(ids) and ids[index] == id else None
+
+    def display_item_value(self, index, field):
+        id, type, name_offset, name_length, _, _ = self.display_item_record(index)
+        if field == "id":
+            return id
+        if field == "type":
+            return type.decode("ascii")
+        return self.string(name_offset, name_length)
+
+    def item_variant_value(self, index, field):
+        record = self.item_variant_record(index)
+        if field in VARIANT_STRINGS:
+            position = len(VARIANT_COLUMNS) + 2 * VARIANT_STRINGS.index(field)
+            return self.string(record[position], record[position + 1])
+        return record[VARIANT_COLUMNS.index(field)]
+
+    def filter(self, count, value, fields, filter):
+        """
+        Indices of the records matching filter, following
+        utils.schema_utils.resolve_model_with_filters. None when it uses a
+        field or value the snapshot cannot compare, to query the database.
+        """
+        conditions = []
+        for key, expected in (filter or {}).items():
+            if isinstance(expected, list):
+                field, lookup = key.removesuffix("__in"), "in"
+            else:
+                field, _, lookup = key.rpartition("__")
+                if not field or lookup not in LOOKUPS:
+                    field, lookup = key, "exact"
+            if field not in fields or expected is None:
+                return None
+            try:
+                if lookup == "in":
+                    expected = [fields[field](item) for item in expected]
+                else:
+                    expected = fields[field](expected)
+            except (TypeError, ValueError):
+                return None
+            conditions.append((field, LOOKUPS[lookup], expected))
+
+        indices = []
+        for index in range(count):
+            for field, lookup, expected in conditions:
+                current = value(index, field)
+                if current is None or not lookup(current, expected):
+                    break
+            else:
+                indices.append(index)
+        return indices
+
+    def filter_display_items(self, filter):
+        return self.filter(
+            self.display_item_count,
+            self.display_item_value,
+            DISPLAY_ITEM_FILTERS,
+            filter,
+        )
+
+    def filter_item_variants(self, filter):
+        return self.filter(
+            self.item_variant_count,
+            self.item_variant_value,
+            ITEM_VARIANT_FILTERS,
+            filter,
+        )
+
+    def instances(self):
+        return CatalogInstances(self)
+
+
+class CatalogInstances:
+    """
+    Unsaved-looking model instances built from one snapshot, each built once
+    and linked both ways (variant.display_item and display_item.variants)
+    so that graphene resolves any catalog selection without a query.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.display_items = {}
+        self.item_variants = {}
+
+    def display_item(self, index):
+        if index in self.display_items:
+            return self.display_items[index]
+        id, type, name_offset, name_length, position, count = (
+            self.snapshot.display_item_record(index)
+        )
+        display_item = DisplayItem.from_db(
+            DEFAULT_DB_ALIAS,
+            ["id", "type", "name"],
+            [id, type.decode("ascii"), self.snapshot.string(name_offset, name_length)],
+        )
+        self.display_items[index] = display_item
+
+        variants = [
+            self.item_variant(i) for i in self.snapshot.variant_indices(position, count)
+        ]
+        queryset = display_item.variants.get_queryset()
+        queryset._result_cache = variants
+        queryset._prefetch_done = True
+        display_item._prefetched_objects_cache = {"variants": queryset}
+        return display_item
+
+    def item_variant(self, index):
+        if index in self.item_variants:
+            return self.item_variants[index]
+        id, display_item_id, price, show, business, *refs = (
+            self.snapshot.item_variant_record(index)
+        )
+        values = dict(
+            zip(
+                VARIANT_STRINGS,
+                (self.snapshot.string(*refs[i : i + 2]) for i in range(0, 20, 2)),
+            )
+        )
+        values["dimensions"] = json.loads(values["dimensions"])
+        values.update(
+            id=id,
+            display_item_id=display_item_id,
+            price=price,
+            show_in_first_page=show,
+            is_for_business=business,
+        )
+        field_names = [field.attname for field in ItemVariant._meta.concrete_fields]
+        item_variant = ItemVariant.from_db(
+            DEFAULT_DB_ALIAS, field_names, [values[name] for name in field_names]
+        )
+        self.item_variants[index] = item_variant
+
+        display_item = self.display_item(
+            self.snapshot.find(self.snapshot.display_item_ids, display_item_id)
+        )
+        ItemVariant.display_item.field.set_cached_value(item_variant, display_item)
+        return item_variant
+
+
+catalog_snapshot = None
+catalog_snapshot_lock = threading.Lock()
+
+
+def get_catalog_snapshot():
+    """
+    The snapshot of this worker when it matches the current catalog version,
+    None while it is missing or stale. A newer file written by the task is
+    mapped in place of the old one, which stays valid for the requests
+    still reading it.
+    """
+    global catalog_snapshot
+    path = settings.CATALOG_SNAPSHOT_PATH
+    if not path:
+        return None
+    (version,) = get_versions(["catalog"])
+    snapshot = catalog_snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    with catalog_snapshot_lock:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        snapshot = catalog_snapshot
+        if snapshot is None or snapshot.file_id != (stat.st_ino, stat.st_mtime_ns):
+            try:
+                snapshot = catalog_snapshot = CatalogSnapshot(path)
+            except (OSError, ValueError, struct.error):
+                return None
+    return snapshot if snapshot.version == version else None
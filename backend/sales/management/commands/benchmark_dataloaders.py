@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from graphql_jwt.shortcuts import get_token
+from users.models import User
+from admin_dash.schema import schema
+from utils.auth_context import get_auth_context
+
+ORDERS_QUERY = """
+query Orders($perPage: Int) {
+  orders(perPage: $perPage) {
+    items {
+      items {
+        itemVariant {
+          displayItem {
+            name
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+
+class Command(BaseCommand):
+    help = "Counts the SQL queries of a nested orders page for growing page sizes (run after add_fake_data)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--page-sizes", nargs="+", type=int, default=[1, 10, 25, 50]
+        )
+
+    def handle(self, *args, **options):
+        staff = User.objects.filter(is_staff=True).first()
+        if staff is None:
+            self.stderr.write(self.style.ERROR("A staff user is required"))
+            return
+
+        # The resolvers authenticate from the token, like the view does
+        authorization = f"Bearer {get_token(staff)}"
+        counts = []
+        for per_page in options["page_sizes"]:
+            request = RequestFactory().post(
+                "/api/admin_dash/graphql/", HTTP_AUTHORIZATION=authorization
+            )
+            # Only count the queries of the resolvers
+            get_auth_context(request)
+            with CaptureQueriesContext(connection) as queries:
+                result = schema.execute(
+                    ORDERS_QUERY,
+                    context_value=request,
+                    variable_values={"perPage": per_page},
+                )
+            if result.errors:
+                self.stderr.write(self.style.ERROR(str(result.errors)))
+                return
+            counts.append(len(queries))
+            self.stdout.write(f"perPage={per_page}: {len(queries)} queries")
+
+        if len(set(counts)) == 1:
+            self.stdout.write(self.style.SUCCESS("Query count is constant"))
+        else:
+            self.stdout.write(self.style.WARNING("Query count grows with page size"))
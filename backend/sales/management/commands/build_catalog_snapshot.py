@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from sales.catalog_snapshot import write_catalog_snapshot
+
+
+class Command(BaseCommand):
+    help = "Write the catalog snapshot the workers serve the catalog from"
+
+    def handle(self, *args, **options):
+        if not settings.CATALOG_SNAPSHOT_PATH:
+            self.stdout.write(self.style.WARNING("CATALOG_SNAPSHOT_PATH is not set"))
+            return
+        version = write_catalog_snapshot()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote catalog snapshot {version} to {settings.CATALOG_SNAPSHOT_PATH}"
+            )
+        )
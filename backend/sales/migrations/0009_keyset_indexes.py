@@ -0,0 +1,25 @@
+# Generated by Django 4.2.10 on 2026-10-18 08:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0008_alter_displayitem_type_alter_orderitem_type'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(
+                fields=['-creation_date', '-id'], name='order_keyset_idx'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='ordertransaction',
+            index=models.Index(
+                fields=['-creation_date', '-id'], name='transaction_keyset_idx'
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.10 on 2026-10-18 08:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0009_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='itemvariant',
+            index=models.Index(
+                condition=models.Q(('show_in_first_page', True)),
+                fields=['is_for_business', '-id'],
+                name='showcase_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def recompute_order_totals(apps, schema_editor):
+    # Totals are maintained incrementally from now on, start from exact ones
+    Order = apps.get_model('sales', 'Order')
+    OrderItem = apps.get_model('sales', 'OrderItem')
+    totals = (
+        OrderItem.objects.filter(order=OuterRef('pk'))
+        .values('order')
+        .annotate(total=Sum('total_price'))
+        .values('total')
+    )
+    Order.objects.update(total_price=Coalesce(Subquery(totals), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0010_showcase_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(recompute_order_totals, migrations.RunPython.noop),
+    ]
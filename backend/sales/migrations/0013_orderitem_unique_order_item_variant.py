@@ -0,0 +1,43 @@
+# Generated by Django 4.2.10 on 2026-10-18 08:16
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def merge_duplicate_order_items(apps, schema_editor):
+    # Rows of the same variant in one order become a single row holding the
+    # summed quantity, the order totals stay the same
+    OrderItem = apps.get_model('sales', 'OrderItem')
+    duplicates = (
+        OrderItem.objects.values('order', 'item_variant')
+        .annotate(rows=Count('id'))
+        .filter(rows__gt=1)
+    )
+    for duplicate in duplicates:
+        items = list(
+            OrderItem.objects.filter(
+                order=duplicate['order'], item_variant=duplicate['item_variant']
+            ).order_by('id')
+        )
+        kept = items[0]
+        kept.quantity = sum(item.quantity for item in items)
+        kept.total_price = sum(item.total_price for item in items)
+        kept.save(update_fields=['quantity', 'total_price'])
+        OrderItem.objects.filter(pk__in=[item.pk for item in items[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0012_ordernumbercounter'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_order_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='orderitem',
+            constraint=models.UniqueConstraint(
+                fields=('order', 'item_variant'), name='unique_order_item_variant'
+            ),
+        ),
+    ]
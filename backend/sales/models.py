@@ -1,5 +1,8 @@
+from collections import namedtuple
 from itertools import count
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.db.models import BigIntegerField, F, Max, Sum
+from django.db.models.functions import Cast, Substr
 from django.utils import timezone
 from image_optimizer.fields import OptimizedImageField
 
@@ -13,6 +16,57 @@ ITEM_TYPE_CHOICES = [
 ]
 
 
+# Statuses staff can move an order to, by current status
+ORDER_STATUS_TRANSITIONS = {
+    "p": ("a", "d", "c"),
+    "a": ("pp", "c"),
+    "pp": ("pd", "c"),
+    "pd": ("pse", "c"),
+    "pse": ("s", "c"),
+    "s": ("de",),
+}
+
+
+def can_transition_order(from_status, to_status):
+    return to_status in ORDER_STATUS_TRANSITIONS.get(from_status, ())
+
+
+UPFRONT_PAYMENT_DAYS = 7
+CHECK_INTERVAL_DAYS = 30
+
+Installment = namedtuple("Installment", ["amount", "is_check", "due_date"])
+
+
+def installment_schedule(total_price, upfront, checks, due_date, today):
+    """
+    Payment plan of an order: the upfront percent of total_price due
+    UPFRONT_PAYMENT_DAYS after today, the rest split into checks due every
+    CHECK_INTERVAL_DAYS after due_date, the first check taking the remainder
+    of the division. Pure, so it can be previewed without writing rows.
+    """
+    upfront_amount = total_price * upfront // 100
+    schedule = [
+        Installment(
+            upfront_amount, False, today + timezone.timedelta(days=UPFRONT_PAYMENT_DAYS)
+        )
+    ]
+
+    remaining = total_price - upfront_amount
+    if remaining == 0:
+        return schedule
+
+    interval, remainder = divmod(remaining, checks)
+    for i in range(1, checks + 1):
+        schedule.append(
+            Installment(
+                interval + remainder if i == 1 else interval,
+                True,
+                due_date + timezone.timedelta(days=i * CHECK_INTERVAL_DAYS),
+            )
+        )
+    return schedule
+
+
 class OrderTransaction(models.Model):
     title = models.CharField(max_length=128)
     order = models.ForeignKey(
@@ -42,10 +96,19 @@ class OrderTransaction(models.Model):
     )
     description = models.TextField(null=True,blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["-creation_date", "-id"], name="transaction_keyset_idx"
+            )
+        ]
+
     def save(self, *args, **kwargs):
 
         if not self.pk and not self.due_date:
-            self.due_date = timezone.localdate() + timezone.timedelta(days=7)
+            self.due_date = timezone.localdate() + timezone.timedelta(
+                days=UPFRONT_PAYMENT_DAYS
+            )
 
         super().save(*args, **kwargs)
 
@@ -76,10 +139,41 @@ class Order(models.Model):
         default="ps",
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["-creation_date", "-id"], name="order_keyset_idx")
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    @property
+    def changed_fields(self):
+        """
+        Names of the fields whose value differs from the one loaded from (or
+        last saved to) the database. Fields that were not loaded are left out.
+        """
+        loaded = getattr(self, "_loaded_values", {})
+        return [
+            field.name
+            for field in self._meta.concrete_fields
+            if loaded.get(field.attname, models.DEFERRED) is not models.DEFERRED
+            and getattr(self, field.attname) != loaded[field.attname]
+        ]
+
     def save(self, *args, **kwargs):
 
-        if self.pk:
-            self.total_price = self.get_total_price()
+        # total_price is kept up to date by OrderItem with F() updates, never
+        # write back the copy held by this instance
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "total_price"
+            ]
 
         if not self.order_number:
             self.order_number = self.generate_order_number()
@@ -87,28 +181,61 @@ class Order(models.Model):
         if not self.pk and not self.due_date:
             self.due_date = timezone.localdate() + timezone.timedelta(days=25)
 
-        if self.status == "c" and OrderTransaction.objects.filter(order=self).exists():
-            transactions = self.transactions
-            for transaction in transactions:
-                transaction.status = "c"
-                transaction.save()
+        if self.status == "c" and not self._state.adding:
+            self.transactions.exclude(status="c").update(status="c")
         super().save(*args, **kwargs)
+        self._loaded_values = {
+            field.attname: self.__dict__[field.attname]
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+        }
 
     def generate_order_number(self):
-        year = (timezone.now().strftime("%Y%M%D"))[0:4]
-        month = (timezone.now().strftime("%Y%m%D"))[4:6]
-        last_oder = Order.objects.filter(order_number__icontains=f"UST{year}").last()
-        order_no = (last_oder.id + 1) if last_oder is not None else 1
-        return f"UST{year}-{month}{order_no:06d}"
+        now = timezone.now()
+        order_no = OrderNumberCounter.next_value(now.year)
+        return f"UST{now.year}-{now.month:02d}{order_no:06d}"
 
     def get_total_price(self):
-        total_price = sum(item.total_price for item in self.items.all())
-        return total_price
+        # Only needed to repair total_price, which is maintained incrementally
+        return self.items.aggregate(total=Sum("total_price"))["total"] or 0
 
     def __str__(self):
         return self.order_number
 
 
+class OrderNumberCounter(models.Model):
+    """
+    Last order number handed out in a year. The row is locked while it is
+    incremented so concurrent orders never get the same number.
+    """
+
+    year = models.PositiveIntegerField(unique=True)
+    value = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def next_value(cls, year):
+        with transaction.atomic():
+            counter = cls.objects.select_for_update().filter(year=year).first()
+            if counter is None:
+                cls.objects.get_or_create(
+                    year=year, defaults={"value": cls.initial_value(year)}
+                )
+                counter = cls.objects.select_for_update().get(year=year)
+            counter.value += 1
+            counter.save(update_fields=["value"])
+        return counter.value
+
+    @staticmethod
+    def initial_value(year):
+        # Continue after the numbers given before the counter existed, this
+        # scan only runs once a year
+        prefix = f"UST{year}-"
+        last = Order.objects.filter(order_number__startswith=prefix).aggregate(
+            last=Max(Cast(Substr("order_number", len(prefix) + 3), BigIntegerField()))
+        )["last"]
+        return last or 0
+
+
 class OrderItem(models.Model):
     total_price = models.PositiveBigIntegerField()
     order = models.ForeignKey("Order", on_delete=models.CASCADE, related_name="items")
@@ -132,10 +259,131 @@ class OrderItem(models.Model):
         optimized_image_resize_method="cover",
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["order", "item_variant"], name="unique_order_item_variant"
+            )
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    @classmethod
+    def add_to_order(cls, order, item_variant, quantity, description=None):
+        """
+        Adds quantity of item_variant to order with a single INSERT ... ON
+        CONFLICT statement, so concurrent adds sum up instead of losing
+        updates or creating duplicate rows. A new row snapshots the variant,
+        an existing one keeps its snapshot and only grows its quantity. The
+        order total is moved by the same amount in the same transaction.
+        """
+        order_item = cls(
+            order=order,
+            item_variant=item_variant,
+            type=item_variant.display_item.type,
+            name=item_variant.name,
+            dimensions=item_variant.dimensions,
+            price=item_variant.price,
+            description=description,
+            fabric=item_variant.fabric,
+            color=item_variant.color,
+            wood_color=item_variant.wood_color,
+            quantity=quantity,
+            total_price=item_variant.price * quantity,
+            thumbnail=item_variant.thumbnail,
+        )
+
+        db = router.db_for_write(cls)
+        connection = connections[db]
+        qn = connection.ops.quote_name
+        pk = cls._meta.pk
+        fields = [field for field in cls._meta.concrete_fields if field is not pk]
+        table = qn(cls._meta.db_table)
+        columns = ", ".join(qn(field.column) for field in fields)
+        placeholders = ", ".join(["%s"] * len(fields))
+        sql = (
+            f"INSERT INTO {table} ({columns}) VALUES ({placeholders}) "
+            f"ON CONFLICT (order_id, item_variant_id) DO UPDATE SET "
+            f"quantity = {table}.quantity + EXCLUDED.quantity, "
+            f"total_price = {table}.price * ({table}.quantity + EXCLUDED.quantity) "
+            f"RETURNING {qn(pk.column)}, {columns}"
+        )
+        params = [
+            field.get_db_prep_save(getattr(order_item, field.attname), connection)
+            for field in fields
+        ]
+
+        with transaction.atomic(using=db):
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                row = cursor.fetchone()
+            values = [
+                (
+                    field.from_db_value(value, None, connection)
+                    if hasattr(field, "from_db_value")
+                    else value
+                )
+                for field, value in zip([pk] + fields, row)
+            ]
+            order_item = cls.from_db(
+                db, [field.attname for field in [pk] + fields], values
+            )
+            order_item.order = order
+            order_item.add_to_order_total(order.pk, order_item.price * quantity)
+        return order_item
+
+    def get_loaded_total(self):
+        """
+        total_price and order_id as stored in the database before this save.
+        """
+        loaded = getattr(self, "_loaded_values", {})
+        total_price = loaded.get("total_price", models.DEFERRED)
+        order_id = loaded.get("order_id", models.DEFERRED)
+        if total_price is models.DEFERRED or order_id is models.DEFERRED:
+            row = (
+                OrderItem.objects.filter(pk=self.pk)
+                .values_list("total_price", "order_id")
+                .first()
+            )
+            total_price, order_id = row or (0, self.order_id)
+        return total_price, order_id
+
+    def add_to_order_total(self, order_id, delta):
+        if not delta:
+            return
+        Order.objects.filter(pk=order_id).update(total_price=F("total_price") + delta)
+        if order_id == self.order_id and OrderItem.order.is_cached(self):
+            order = self.order
+            order.total_price += delta
+            # The database already holds the new total
+            if "total_price" in getattr(order, "_loaded_values", {}):
+                order._loaded_values["total_price"] = order.total_price
+
     def save(self, *args, **kwargs):
         self.total_price = self.price * self.quantity
 
-        super().save(*args, **kwargs)
+        if self._state.adding:
+            previous_total, previous_order_id = 0, self.order_id
+        else:
+            previous_total, previous_order_id = self.get_loaded_total()
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if previous_order_id != self.order_id:
+                self.add_to_order_total(previous_order_id, -previous_total)
+                self.add_to_order_total(self.order_id, self.total_price)
+            else:
+                self.add_to_order_total(
+                    self.order_id, self.total_price - previous_total
+                )
+        self._loaded_values = {
+            "total_price": self.total_price,
+            "order_id": self.order_id,
+        }
 
     def __str__(self):
         return self.name
@@ -191,3 +439,13 @@ class ItemVariant(models.Model):
         optimized_image_output_size=(1200, 600),
         optimized_image_resize_method="cover",
     )
+
+    class Meta:
+        indexes = [
+            # The homepage showcase only reads the variants marked for it
+            models.Index(
+                fields=["is_for_business", "-id"],
+                condition=models.Q(show_in_first_page=True),
+                name="showcase_idx",
+            )
+        ]
@@ -1,3 +1,4 @@
+import logging
 import re
 import time
 from django.utils import timezone
@@ -5,15 +6,32 @@ import graphene
 from django.contrib.auth import (
     get_user_model,
 )
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from graphene_django import DjangoObjectType
 from django.core.paginator import Paginator
-from users.models import Address, Business
+from graphql import GraphQLError
+from users.models import Address
 from utils.schema_utils import (
     login_required,
     resolve_model_with_filters,
 )
+from utils.dataloaders import load_related, register
+from utils.query_optimizer import optimize_queryset, selects_only
+from utils.result_cache import cached_resolve
+from sales.cart import (
+    add_to_cart,
+    get_cart,
+    remove_from_cart,
+    restore_cart,
+    set_cart_item,
+    take_cart,
+)
+from sales.catalog_snapshot import get_catalog_snapshot
+from sales.tasks import schedule_catalog_snapshot
+from admin_dash.tasks import send_order_status_email
 from sales.models import (
+    installment_schedule,
     ItemVariant,
     Order,
     OrderItem,
@@ -27,11 +45,15 @@ from users.schema import (
     ProvinceType,
     CityType,
 )
-from django.db.models import Count
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 ITEM_TYPE_CHOICES = ["s", "b", "m", "j", "c"]
+CATALOG_MODELS = (DisplayItem, ItemVariant)
+SHOWCASE_SIZE = 4
 # ========================Mutations Start========================
 
 
@@ -40,26 +62,62 @@ class OrderType(DjangoObjectType):
     class Meta:
         model = Order
 
+    def resolve_user(self, info):
+        return load_related(info, self, "user")
+
+    def resolve_address(self, info):
+        return load_related(info, self, "address")
+
+    def resolve_items(self, info):
+        return load_related(info, self, "items")
+
+    def resolve_transactions(self, info):
+        return load_related(info, self, "transactions")
+
 
 class OrderItemType(DjangoObjectType):
     class Meta:
         model = OrderItem
 
+    def resolve_order(self, info):
+        return load_related(info, self, "order")
+
+    def resolve_item_variant(self, info):
+        return load_related(info, self, "item_variant")
+
 
 class DisplayItemType(DjangoObjectType):
     class Meta:
         model = DisplayItem
 
+    def resolve_variants(self, info):
+        return load_related(info, self, "variants")
+
 
 class ItemVariantType(DjangoObjectType):
     class Meta:
         model = ItemVariant
 
+    def resolve_display_item(self, info):
+        return load_related(info, self, "display_item")
+
+    def resolve_order_items(self, info):
+        return load_related(info, self, "order_items")
+
 
 class OrderTransactionType(DjangoObjectType):
     class Meta:
         model = OrderTransaction
 
+    def resolve_order(self, info):
+        return load_related(info, self, "order")
+
+
+class InstallmentType(graphene.ObjectType):
+    amount = graphene.Int()
+    is_check = graphene.Boolean()
+    due_date = graphene.Date()
+
 
 class CreateOrderItemInput(graphene.InputObjectType):
     order = graphene.ID(required=False)
@@ -76,6 +134,8 @@ class CreateTransactionInput(graphene.InputObjectType):
 
 
 class CreateOrderItem(graphene.Mutation):
+    query_budget = 11
+
     class Arguments:
         input = CreateOrderItemInput(required=True)
 
@@ -113,6 +173,15 @@ class CreateOrderItem(graphene.Mutation):
             if errors:
                 return CreateOrderItem(success=False, errors=errors)
 
+            try:
+                item_variant = ItemVariant.objects.select_related("display_item").get(
+                    pk=input.get("item_variant")
+                )
+            except ItemVariant.DoesNotExist:
+                return CreateOrderItem(
+                    success=False, errors="عنوان نمایشی مورد نظر یافت نشد"
+                )
+
             order = input.get("order")
             if order:
                 try:
@@ -126,38 +195,13 @@ class CreateOrderItem(graphene.Mutation):
                     user=info.context.user, due_date=input.get("due_date")
                 )
 
-            try:
-                item_variant = ItemVariant.objects.get(pk=input.get("item_variant"))
-            except DisplayItem.DoesNotExist:
-                return CreateOrderItem(
-                    success=False, errors="عنوان نمایشی مورد نظر یافت نشد"
-                )
-
-            order_item, created = OrderItem.objects.get_or_create(
-                order=order,
-                item_variant=item_variant,
-                name=item_variant.name,
-                dimensions=item_variant.dimensions,
-                fabric=item_variant.fabric,
-                color=item_variant.color,
-                wood_color=item_variant.wood_color,
-                defaults={
-                    "type": item_variant.display_item.type,
-                    "price": item_variant.price,
-                    "thumbnail": item_variant.thumbnail,
-                    "description": input.get("description"),
-                },
+            order_item = OrderItem.add_to_order(
+                order,
+                item_variant,
+                input.get("quantity", 1),
+                input.get("description"),
             )
 
-            if not created:
-                # If the item was retrieved, update its quantity
-                order_item.quantity += input.get("quantity", 1)
-            else:
-                order_item.quantity = input.get("quantity", 1)
-
-            order_item.save()
-            order_item.order.save()
-
             return CreateOrderItem(order_item=order_item, success=True)
         except Exception as e:
             print(e)
@@ -165,6 +209,8 @@ class CreateOrderItem(graphene.Mutation):
 
 
 class CreateTransaction(graphene.Mutation):
+    query_budget = 6
+
     class Arguments:
         input = CreateTransactionInput(required=True)
 
@@ -172,76 +218,76 @@ class CreateTransaction(graphene.Mutation):
     errors = graphene.JSONString()
     success = graphene.Boolean()
 
-    @login_required
-    def mutate(self, info, input):
-        try:
-            user = info.context.user
-            business = Business.objects.filter(user=user).first()
+    @staticmethod
+    def validate_input(input):
+        errors = {}
 
-            upfront = input.get("upfront")
-            checks = input.get("checks")
+        upfront = input.get("upfront")
+        if upfront < 0 or upfront > 100:
+            errors["upfront"] = "درصد پیش پرداخت باید بین 0 تا 100 باشد"
 
-            try:
-                order = Order.objects.get(pk=input.get("order"))
-            except Order.DoesNotExist:
-                return CreateTransaction(
-                    success=False, errors="سفارش مورد نظر یافت نشد"
-                )
+        checks = input.get("checks")
+        if checks < 0:
+            errors["checks"] = "تعداد چک ها نمی تواند منفی باشد"
+        elif checks == 0 and upfront != 100:
+            errors["checks"] = "برای پرداخت باقی مبلغ حداقل یک چک لازم است"
 
-            if order.user != user:
-                return CreateTransaction(
-                    success=False, errors="شما دسترسی به این سفارش را ندارید"
-                )
+        return errors
 
-            order_transactions = []
+    @staticmethod
+    def get_schedule(order, input):
+        return installment_schedule(
+            order.total_price,
+            input.get("upfront"),
+            input.get("checks"),
+            order.due_date,
+            timezone.localdate(),
+        )
 
-            total_price = order.get_total_price()
+    @login_required
+    def mutate(self, info, input):
+        try:
+            errors = CreateTransaction.validate_input(input)
+            if errors:
+                return CreateTransaction(success=False, errors=errors)
 
-            order_transactions.append(
-                OrderTransaction.objects.create(
-                    order=order,
-                    title="فاکتور پرداخت نقدی سفارش شماره " + str(order.order_number),
-                    amount=total_price * (upfront / 100),
-                )
-            )
+            user = info.context.user
 
-            total_price -= int(total_price * (upfront / 100))
-            if total_price == 0:
-                return CreateTransaction(transactions=order_transactions, success=True)
-
-            i = 1
-            interval = (total_price - (total_price % checks)) / checks
-            if total_price % checks != 0:
-                remainder = total_price % checks
-                total_price -= remainder
-
-                order_transactions.append(
-                    OrderTransaction.objects.create(
-                        order=order,
-                        title="فاکتور پرداخت چک سفارش شماره " + str(order.order_number),
-                        amount=((interval) + remainder),
-                        is_check=True,
-                        due_date=order.due_date + timezone.timedelta(days=(i * 30)),
+            with transaction.atomic():
+                try:
+                    order = Order.objects.select_for_update().get(pk=input.get("order"))
+                except Order.DoesNotExist:
+                    return CreateTransaction(
+                        success=False, errors="سفارش مورد نظر یافت نشد"
                     )
-                )
-                i += 1
-                total_price -= interval
-
-            while total_price != 0:
-                order_transactions.append(
-                    OrderTransaction.objects.create(
-                        order=order,
-                        title="فاکتور پرداخت چک سفارش شماره " + str(order.order_number),
-                        amount=interval,
-                        is_check=True,
-                        due_date=order.due_date + timezone.timedelta(days=(i * 30)),
+
+                if order.user_id != user.id:
+                    return CreateTransaction(
+                        success=False, errors="شما دسترسی به این سفارش را ندارید"
                     )
+
+                order_transactions = OrderTransaction.objects.bulk_create(
+                    [
+                        OrderTransaction(
+                            order=order,
+                            title=(
+                                "فاکتور پرداخت چک سفارش شماره "
+                                if installment.is_check
+                                else "فاکتور پرداخت نقدی سفارش شماره "
+                            )
+                            + str(order.order_number),
+                            amount=installment.amount,
+                            is_check=installment.is_check,
+                            due_date=installment.due_date,
+                        )
+                        for installment in CreateTransaction.get_schedule(order, input)
+                    ]
                 )
-                i += 1
-                total_price -= interval
 
-            order.status = "pp"
-            order.save()
+                # Orders paid fully upfront keep their status, as before
+                if len(order_transactions) > 1:
+                    order.status = "pp"
+                    order.save()
 
             return CreateTransaction(transactions=order_transactions, success=True)
         except Exception as e:
@@ -270,6 +316,8 @@ class UpdateOrderInput(graphene.InputObjectType):
 
 
 class UpdateOrderItem(graphene.Mutation):
+    query_budget = 8
+
     class Arguments:
         input = UpdateOrderItemInput(required=True)
 
@@ -301,18 +349,22 @@ class UpdateOrderItem(graphene.Mutation):
             item_variant = input.get("item_variant")
             if item_variant:
                 try:
-                    item_variant = ItemVariant.objects.get(pk=item_variant)
+                    item_variant = ItemVariant.objects.select_related(
+                        "display_item"
+                    ).get(pk=item_variant)
                 except ItemVariant.DoesNotExist:
                     return UpdateOrderItem(
                         success=False, errors="مورد نمایشی مورد نظر یافت نشد"
                     )
 
             try:
-                order_item = OrderItem.objects.get(pk=input.get("id"))
+                order_item = OrderItem.objects.select_related(
+                    "order", "item_variant__display_item"
+                ).get(pk=input.get("id"))
             except OrderItem.DoesNotExist:
                 return UpdateOrderItem(success=False, errors="محصول مورد نظر یافت نشد")
 
-            if order_item.order.user != info.context.user:
+            if order_item.order.user_id != info.context.user.id:
                 return UpdateOrderItem(
                     success=False, errors="شما دسترسی ویرایش این محصول را ندارید"
                 )
@@ -336,6 +388,16 @@ class UpdateOrderItem(graphene.Mutation):
                     success=False, errors="نوع محصول مورد نظر تغییر کرده است"
                 )
 
+            if (
+                item_variant
+                and OrderItem.objects.filter(
+                    order_id=order_item.order_id, item_variant=item_variant
+                ).exists()
+            ):
+                return UpdateOrderItem(
+                    success=False, errors="این مورد نمایشی در سفارش وجود دارد"
+                )
+
             errors = UpdateOrderItem.validate_input(input)
             if errors:
                 return UpdateOrderItem(success=False, errors=errors)
@@ -363,6 +425,8 @@ class UpdateOrderItem(graphene.Mutation):
 
 
 class UpdateOrder(graphene.Mutation):
+    query_budget = 6
+
     class Arguments:
         input = UpdateOrderInput(required=True)
 
@@ -450,6 +514,8 @@ class DeleteOrderInput(graphene.InputObjectType):
 
 
 class DeleteOrderItem(graphene.Mutation):
+    query_budget = 9
+
     class Arguments:
         input = DeleteOrderItemInput(required=True)
 
@@ -492,6 +558,8 @@ class DeleteOrderItem(graphene.Mutation):
 
 
 class DeleteOrder(graphene.Mutation):
+    query_budget = 7
+
     class Arguments:
         input = DeleteOrderInput(required=True)
 
@@ -530,6 +598,274 @@ class DeleteOrder(graphene.Mutation):
 # ========================Delete End========================
 
 
+# ========================Cart Start========================
+
+
+class CartItemType(graphene.ObjectType):
+    item_variant = graphene.Field(ItemVariantType)
+    quantity = graphene.Int()
+    description = graphene.String()
+    total_price = graphene.Int()
+
+
+class CartType(graphene.ObjectType):
+    items = graphene.List(CartItemType)
+    total_price = graphene.Int()
+
+
+def load_cart(info, user):
+    """
+    The draft cart of the user with its item variants, variants deleted since
+    they were added are left out.
+    """
+    cart = get_cart(user.id)
+    item_variants = ItemVariant.objects.in_bulk(list(cart)) if cart else {}
+    register(info, list(item_variants.values()))
+    items = [
+        CartItemType(
+            item_variant=item_variants[item_variant_id],
+            quantity=item["quantity"],
+            description=item["description"],
+            total_price=item_variants[item_variant_id].price * item["quantity"],
+        )
+        for item_variant_id, item in cart.items()
+        if item_variant_id in item_variants
+    ]
+    return CartType(items=items, total_price=sum(item.total_price for item in items))
+
+
+class AddToCartInput(graphene.InputObjectType):
+    item_variant = graphene.ID(required=True)
+    quantity = graphene.Int(required=True)
+    description = graphene.String(required=False)
+
+
+class UpdateCartItemInput(graphene.InputObjectType):
+    item_variant = graphene.ID(required=True)
+    quantity = graphene.Int(required=False)
+    description = graphene.String(required=False)
+
+
+class RemoveFromCartInput(graphene.InputObjectType):
+    item_variant = graphene.ID(required=True)
+
+
+class CheckoutInput(graphene.InputObjectType):
+    address = graphene.ID(required=True)
+    due_date = graphene.Date(required=False)
+
+
+class AddToCart(graphene.Mutation):
+    query_budget = 3
+
+    class Arguments:
+        input = AddToCartInput(required=True)
+
+    cart = graphene.Field(CartType)
+    errors = graphene.JSONString()
+    success = graphene.Boolean()
+
+    @staticmethod
+    def validate_input(input):
+        errors = CreateOrderItem.validate_input(input)
+
+        quantity = input.get("quantity")
+        if quantity is not None and quantity < 1:
+            errors["quantity"] = "تعداد باید بزرگتر از صفر باشد"
+
+        return errors
+
+    @login_required
+    def mutate(self, info, input):
+        try:
+            errors = AddToCart.validate_input(input)
+            if errors:
+                return AddToCart(success=False, errors=errors)
+
+            item_variant = input.get("item_variant")
+            if not ItemVariant.objects.filter(pk=item_variant).exists():
+                return AddToCart(success=False, errors="محصول مورد نظر یافت نشد")
+
+            add_to_cart(
+                info.context.user.id,
+                int(item_variant),
+                input.get("quantity"),
+                input.get("description"),
+            )
+
+            return AddToCart(cart=load_cart(info, info.context.user), success=True)
+        except Exception:
+            logger.exception("AddToCart failed for user %s", info.context.user.id)
+            return AddToCart(success=False, errors="خطایی رخ داده است")
+
+
+class UpdateCartItem(graphene.Mutation):
+    query_budget = 2
+
+    class Arguments:
+        input = UpdateCartItemInput(required=True)
+
+    cart = graphene.Field(CartType)
+    errors = graphene.JSONString()
+    success = graphene.Boolean()
+
+    @login_required
+    def mutate(self, info, input):
+        try:
+            errors = AddToCart.validate_input(input)
+            if errors:
+                return UpdateCartItem(success=False, errors=errors)
+
+            user = info.context.user
+            item_variant = int(input.get("item_variant"))
+            if item_variant not in get_cart(user.id):
+                return UpdateCartItem(
+                    success=False, errors="محصول مورد نظر در سبد خرید نیست"
+                )
+
+            set_cart_item(
+                user.id,
+                item_variant,
+                quantity=input.get("quantity"),
+                description=input.get("description"),
+            )
+
+            return UpdateCartItem(cart=load_cart(info, user), success=True)
+        except Exception:
+            logger.exception("UpdateCartItem failed for user %s", info.context.user.id)
+            return UpdateCartItem(success=False, errors="خطایی رخ داده است")
+
+
+class RemoveFromCart(graphene.Mutation):
+    query_budget = 2
+
+    class Arguments:
+        input = RemoveFromCartInput(required=True)
+
+    cart = graphene.Field(CartType)
+    errors = graphene.JSONString()
+    success = graphene.Boolean()
+
+    @login_required
+    def mutate(self, info, input):
+        try:
+            user = info.context.user
+            remove_from_cart(user.id, int(input.get("item_variant")))
+            return RemoveFromCart(cart=load_cart(info, user), success=True)
+        except Exception:
+            logger.exception("RemoveFromCart failed for user %s", info.context.user.id)
+            return RemoveFromCart(success=False, errors="خطایی رخ داده است")
+
+
+class Checkout(graphene.Mutation):
+    query_budget = 12
+
+    class Arguments:
+        input = CheckoutInput(required=True)
+
+    order = graphene.Field(OrderType)
+    errors = graphene.JSONString()
+    success = graphene.Boolean()
+
+    @staticmethod
+    def validate_input(user, input):
+        errors = {}
+
+        due_date = input.get("due_date")
+        if due_date:
+            if due_date < timezone.localdate() + timezone.timedelta(days=15):
+                errors["due_date"] = "تاریخ تحویل باید دیرتر از 15 روز آینده باشد"
+
+        address = None
+        try:
+            address = Address.objects.get(pk=input.get("address"))
+            if address.user_id != user.id:
+                errors["address"] = "شما دسترسی این آدرس را ندارید"
+        except Address.DoesNotExist:
+            errors["address"] = "آدرس انتخاب شده یافت نشد"
+
+        return address, errors
+
+    @login_required
+    def mutate(self, info, input):
+        try:
+            user = info.context.user
+            address, errors = Checkout.validate_input(user, input)
+            if errors:
+                return Checkout(success=False, errors=errors)
+
+            cart = take_cart(user.id)
+            if not cart:
+                return Checkout(success=False, errors="سبد خرید شما خالی است")
+            try:
+                item_variants = ItemVariant.objects.select_related(
+                    "display_item"
+                ).in_bulk(list(cart))
+                missing = [id for id in cart if id not in item_variants]
+                if missing:
+                    # Removed from the catalog, the rest of the cart is kept
+                    restore_cart(
+                        user.id,
+                        {id: item for id, item in cart.items() if id in item_variants},
+                    )
+                    return Checkout(
+                        success=False,
+                        errors={
+                            "item_variants": "برخی از محصولات سبد خرید دیگر موجود نیستند",
+                            "missing": missing,
+                        },
+                    )
+
+                order_items = []
+                for item_variant_id, item in cart.items():
+                    item_variant = item_variants[item_variant_id]
+                    order_items.append(
+                        OrderItem(
+                            item_variant=item_variant,
+                            type=item_variant.display_item.type,
+                            name=item_variant.name,
+                            dimensions=item_variant.dimensions,
+                            price=item_variant.price,
+                            total_price=item_variant.price * item["quantity"],
+                            quantity=item["quantity"],
+                            description=item["description"],
+                            fabric=item_variant.fabric,
+                            color=item_variant.color,
+                            wood_color=item_variant.wood_color,
+                            thumbnail=item_variant.thumbnail,
+                        )
+                    )
+
+                # The order is written with its final total, so OrderItem.save
+                # and its total updates are skipped. The status signal ignores
+                # created orders, the submitted email is queued here
+                with transaction.atomic():
+                    order = Order.objects.create(
+                        user=user,
+                        address=address,
+                        due_date=input.get("due_date"),
+                        status="p",
+                        total_price=sum(item.total_price for item in order_items),
+                    )
+                    for order_item in order_items:
+                        order_item.order = order
+                    OrderItem.objects.bulk_create(order_items)
+                    transaction.on_commit(
+                        lambda: send_order_status_email.delay(order.id, order.status)
+                    )
+            except Exception:
+                restore_cart(user.id, cart)
+                raise
+
+            return Checkout(order=order, success=True)
+        except Exception:
+            logger.exception("Checkout failed for user %s", info.context.user.id)
+            return Checkout(success=False, errors="خطایی رخ داده است")
+
+
+# ========================Cart End========================
+
+
 class Mutation(graphene.ObjectType):
     create_order_item = CreateOrderItem.Field()
     create_transaction = CreateTransaction.Field()
@@ -537,6 +873,10 @@ class Mutation(graphene.ObjectType):
     update_order = UpdateOrder.Field()
     delete_order_item = DeleteOrderItem.Field()
     delete_order = DeleteOrder.Field()
+    add_to_cart = AddToCart.Field()
+    update_cart_item = UpdateCartItem.Field()
+    remove_from_cart = RemoveFromCart.Field()
+    checkout = Checkout.Field()
 
 
 # ========================Mutations End========================
@@ -597,6 +937,35 @@ class PaginatedTransaction(graphene.ObjectType):
     total_items = graphene.Int()
 
 
+def is_business_segment(info):
+    context = info.context
+    if not hasattr(context, "is_business_segment"):
+        user = context.user
+        context.is_business_segment = user.is_authenticated and user.is_business()
+    return context.is_business_segment
+
+
+def resolve_catalog(info, name, args, tags, model, build, field_name=None, read=None):
+    """
+    Serve a catalog resolver from the catalog snapshot through read, or from
+    the result cache keyed by the customer segment as well. Selections that
+    reach orders or users are not cached since the catalog signals do not
+    invalidate them. read may return None to fall back to the cache.
+    """
+    if not selects_only(info, model, CATALOG_MODELS, field_name):
+        return build()
+    if read is not None:
+        snapshot = get_catalog_snapshot()
+        if snapshot is None:
+            schedule_catalog_snapshot()
+        else:
+            result = read(snapshot)
+            if result is not None:
+                return result
+    segment = "business" if is_business_segment(info) else "retail"
+    return cached_resolve(info, name, {**args, "segment": segment}, tags, build)
+
+
 class Query(graphene.ObjectType):
     display_items = graphene.Field(
         PaginatedDisplayItem,
@@ -622,29 +991,99 @@ class Query(graphene.ObjectType):
     item_variants = graphene.List(ItemVariantType, filter=ItemVariantFilterInput())
     item_variant = graphene.Field(ItemVariantType, id=graphene.ID(required=True))
     showcase = graphene.List(ItemVariantType)
+    cart = graphene.Field(CartType)
+    installment_plan = graphene.List(
+        InstallmentType,
+        order=graphene.ID(required=True),
+        upfront=graphene.Int(required=True),
+        checks=graphene.Int(required=True),
+    )
+
+    query_budgets = {
+        "display_items": 3,
+        "display_item": 2,
+        "orders": 5,
+        "order": 4,
+        "transactions": 3,
+        "transaction": 3,
+        "item_variants": 2,
+        "item_variant": 2,
+        "showcase": 2,
+        "cart": 2,
+        "installment_plan": 2,
+    }
 
     def resolve_display_items(self, info, page=1, per_page=12, filter={}):
-        display_items = resolve_model_with_filters(DisplayItem, filter)
-        paginator = Paginator(display_items, per_page)
-        paginated_qs = paginator.page(page)
-        return PaginatedDisplayItem(
-            items=paginated_qs.object_list,
-            total_pages=paginator.num_pages,
-            total_items=paginator.count,
+        def build():
+            display_items = optimize_queryset(
+                resolve_model_with_filters(DisplayItem, filter), info, "items"
+            )
+            paginator = Paginator(display_items, per_page)
+            paginated_qs = paginator.page(page)
+            return PaginatedDisplayItem(
+                items=list(paginated_qs.object_list),
+                total_pages=paginator.num_pages,
+                total_items=paginator.count,
+            )
+
+        def read(snapshot):
+            indices = snapshot.filter_display_items(filter)
+            if indices is None:
+                return None
+            instances = snapshot.instances()
+            paginator = Paginator(indices, per_page)
+            paginated = paginator.page(page)
+            return PaginatedDisplayItem(
+                items=[instances.display_item(i) for i in paginated.object_list],
+                total_pages=paginator.num_pages,
+                total_items=paginator.count,
+            )
+
+        result = resolve_catalog(
+            info,
+            "display_items",
+            {"page": page, "per_page": per_page, "filter": filter},
+            ["catalog"],
+            DisplayItem,
+            build,
+            "items",
+            read,
         )
+        register(info, result.items)
+        return result
 
     def resolve_display_item(self, info, id):
-        return get_object_or_404(DisplayItem, pk=id)
+        def read(snapshot):
+            # Missing ids fall back to the database for its 404
+            index = snapshot.find(snapshot.display_item_ids, id)
+            if index is None:
+                return None
+            return snapshot.instances().display_item(index)
+
+        return resolve_catalog(
+            info,
+            "display_item",
+            {"id": id},
+            [f"display_item_{id}"],
+            DisplayItem,
+            lambda: get_object_or_404(
+                optimize_queryset(DisplayItem.objects.all(), info), pk=id
+            ),
+            read=read,
+        )
 
     @login_required
-    def resolve_orders(self, info, page=1, per_page=10, filter={}):
+    def resolve_orders(self, info, page=1, per_page=10, filter=None):
+        filter = dict(filter or {})
         filter["user"] = info.context.user
         print(filter)
-        orders = resolve_model_with_filters(Order, filter)
+        orders = optimize_queryset(
+            resolve_model_with_filters(Order, filter), info, "items"
+        )
         paginator = Paginator(orders, per_page)
         paginated_qs = paginator.page(page)
         return PaginatedOrder(
-            items=paginated_qs.object_list,
+            items=register(info, paginated_qs.object_list),
             total_pages=paginator.num_pages,
             total_items=paginator.count,
         )
@@ -654,13 +1093,16 @@ class Query(graphene.ObjectType):
         return get_object_or_404(Order, pk=id, user=info.context.user)
 
     @login_required
-    def resolve_transactions(self, info, page=1, per_page=10, filter={}):
+    def resolve_transactions(self, info, page=1, per_page=10, filter=None):
+        filter = dict(filter or {})
         filter["order__user"] = info.context.user
-        transactions = resolve_model_with_filters(OrderTransaction, filter)
+        transactions = optimize_queryset(
+            resolve_model_with_filters(OrderTransaction, filter), info, "items"
+        )
         paginator = Paginator(transactions, per_page)
         paginated_qs = paginator.page(page)
         return PaginatedTransaction(
-            items=paginated_qs.object_list,
+            items=register(info, paginated_qs.object_list),
             total_pages=paginator.num_pages,
             total_items=paginator.count,
         )
@@ -669,28 +1111,119 @@ class Query(graphene.ObjectType):
     def resolve_transaction(self, info, id):
         return get_object_or_404(OrderTransaction, pk=id, order__user=info.context.user)
 
-    def resolve_item_variants(self, info, filter={}):
-        user = info.context.user
-        if user.is_authenticated:
-            filter["is_for_business"] = user.is_business()
-        item_variants = resolve_model_with_filters(ItemVariant, filter)
-        return item_variants
+    @login_required
+    def resolve_cart(self, info):
+        return load_cart(info, info.context.user)
+
+    @login_required
+    def resolve_installment_plan(self, info, order, upfront, checks):
+        # Preview of CreateTransaction, nothing is written
+        input = {"upfront": upfront, "checks": checks}
+        errors = CreateTransaction.validate_input(input)
+        if errors:
+            raise GraphQLError(next(iter(errors.values())))
+        order = get_object_or_404(
+            Order.objects.only("total_price", "due_date"),
+            pk=order,
+            user=info.context.user,
+        )
+        return CreateTransaction.get_schedule(order, input)
+
+    def resolve_item_variants(self, info, filter=None):
+        filter = dict(filter or {})
+        if info.context.user.is_authenticated:
+            filter["is_for_business"] = is_business_segment(info)
+
+        def build():
+            return list(
+                optimize_queryset(resolve_model_with_filters(ItemVariant, filter), info)
+            )
+
+        def read(snapshot):
+            indices = snapshot.filter_item_variants(filter)
+            if indices is None:
+                return None
+            instances = snapshot.instances()
+            return [instances.item_variant(i) for i in indices]
+
+        item_variants = resolve_catalog(
+            info,
+            "item_variants",
+            {"filter": filter},
+            ["catalog"],
+            ItemVariant,
+            build,
+            read=read,
+        )
+        return register(info, item_variants)
 
     def resolve_item_variant(self, info, id):
-        return get_object_or_404(ItemVariant, pk=id)
+        def read(snapshot):
+            index = snapshot.find(snapshot.item_variant_ids, id)
+            if index is None:
+                return None
+            return snapshot.instances().item_variant(index)
+
+        return resolve_catalog(
+            info,
+            "item_variant",
+            {"id": id},
+            [f"item_variant_{id}"],
+            ItemVariant,
+            lambda: get_object_or_404(
+                optimize_queryset(ItemVariant.objects.all(), info), pk=id
+            ),
+            read=read,
+        )
 
     def resolve_showcase(self, info):
-        user = info.context.user
-        showcases = []
-        for type in ITEM_TYPE_CHOICES:
-            item_variant = ItemVariant.objects.filter(
-                display_item__type=type[0],
-                show_in_first_page=True,
-                is_for_business=user.is_business() if user.is_authenticated else False,
-            ).order_by("-id")[:4]
-            for item in item_variant:
-                showcases.append(item)
-        return showcases
+        is_for_business = is_business_segment(info)
+
+        def build():
+            # Latest SHOWCASE_SIZE variants of every type in a single query
+            showcases = (
+                optimize_queryset(
+                    ItemVariant.objects.filter(
+                        display_item__type__in=ITEM_TYPE_CHOICES,
+                        show_in_first_page=True,
+                        is_for_business=is_for_business,
+                    ),
+                    info,
+                )
+                .annotate(
+                    item_type=F("display_item__type"),
+                    type_rank=Window(
+                        RowNumber(),
+                        partition_by=F("display_item__type"),
+                        order_by=F("id").desc(),
+                    ),
+                )
+                .filter(type_rank__lte=SHOWCASE_SIZE)
+            )
+            return sorted(
+                showcases,
+                key=lambda item: (ITEM_TYPE_CHOICES.index(item.item_type), -item.id),
+            )
+
+        def read(snapshot):
+            instances = snapshot.instances()
+            showcases = {type: [] for type in ITEM_TYPE_CHOICES}
+            # Newest first, the records are sorted by id
+            for index in reversed(
+                snapshot.filter_item_variants(
+                    {"show_in_first_page": True, "is_for_business": is_for_business}
+                )
+            ):
+                item = instances.item_variant(index)
+                showcase = showcases.get(item.display_item.type)
+                if showcase is not None and len(showcase) < SHOWCASE_SIZE:
+                    showcase.append(item)
+            return [item for type in ITEM_TYPE_CHOICES for item in showcases[type]]
+
+        showcases = resolve_catalog(
+            info, "showcase", {}, ["catalog"], ItemVariant, build, read=read
+        )
+        return register(info, showcases)
 
 
 # ========================Queries End========================
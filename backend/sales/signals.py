@@ -0,0 +1,61 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from sales.models import DisplayItem, ItemVariant, Order, OrderItem
+from sales.tasks import schedule_catalog_snapshot
+from utils.result_cache import invalidate
+
+
+@receiver([post_save, post_delete], sender=ItemVariant)
+def invalidate_item_variant(sender, instance, **kwargs):
+    """
+    Drop the cached catalog results showing this variant, including image
+    uploads which save the variant as well. The versions change on commit,
+    so results rebuilt meanwhile from the old rows stay under the old ones.
+    """
+    tags = [
+        "catalog",
+        f"item_variant_{instance.pk}",
+        f"display_item_{instance.display_item_id}",
+    ]
+    transaction.on_commit(lambda: invalidate(*tags))
+    transaction.on_commit(schedule_catalog_snapshot)
+
+
+@receiver([post_save, post_delete], sender=DisplayItem)
+def invalidate_display_item(sender, instance, **kwargs):
+    """
+    Drop the cached catalog results showing this display item, the variants
+    embed it through their display_item field. Like for the variants, the
+    versions change on commit.
+    """
+    variant_tags = [
+        f"item_variant_{pk}"
+        for pk in ItemVariant.objects.filter(display_item_id=instance.pk).values_list(
+            "pk", flat=True
+        )
+    ]
+    tags = ["catalog", f"display_item_{instance.pk}", *variant_tags]
+    transaction.on_commit(lambda: invalidate(*tags))
+    transaction.on_commit(schedule_catalog_snapshot)
+
+
+def deleted_with_order(origin):
+    return isinstance(origin, Order) or getattr(origin, "model", None) is Order
+
+
+@receiver(pre_delete, sender=OrderItem)
+def remember_order_item_total(sender, instance, origin=None, **kwargs):
+    """
+    Read the stored total while the row still exists, for order items
+    deleted one by one as well as through querysets and the admin actions.
+    """
+    if not deleted_with_order(origin):
+        instance._deleted_total = instance.get_loaded_total()
+
+
+@receiver(post_delete, sender=OrderItem)
+def subtract_order_item_total(sender, instance, **kwargs):
+    total_price, order_id = getattr(instance, "_deleted_total", (0, None))
+    if order_id is not None:
+        instance.add_to_order_total(order_id, -total_price)
@@ -0,0 +1,31 @@
+# Import necessary modules
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from sales.catalog_snapshot import write_catalog_snapshot
+import logging
+
+# Get logger instance for this module
+logger = logging.getLogger(__name__)
+
+CATALOG_SNAPSHOT_PENDING_KEY = "catalog_snapshot_pending"
+
+
+def schedule_catalog_snapshot():
+    """
+    Queue a rebuild of the catalog snapshot unless one is already queued,
+    so a burst of catalog changes is written once.
+    """
+    if not settings.CATALOG_SNAPSHOT_PATH:
+        return
+    delay = settings.CATALOG_SNAPSHOT_DELAY
+    if cache.add(CATALOG_SNAPSHOT_PENDING_KEY, 1, timeout=delay + 60):
+        build_catalog_snapshot.apply_async(countdown=delay)
+
+
+@shared_task(bind=True)
+def build_catalog_snapshot(self):
+    # Changes from now on queue another rebuild
+    cache.delete(CATALOG_SNAPSHOT_PENDING_KEY)
+    version = write_catalog_snapshot()
+    logger.info(f"Wrote catalog snapshot {version}")
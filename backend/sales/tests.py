@@ -1,3 +1,919 @@
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from datetime import date
+from types import SimpleNamespace
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import (
+    Client,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from graphql import FragmentDefinitionNode, parse
+from graphql_jwt.shortcuts import get_token
+from sales.cart import add_to_cart, get_cart, restore_cart, take_cart
+from sales.catalog_snapshot import write_catalog_snapshot
+from sales.models import (
+    DisplayItem,
+    ItemVariant,
+    Order,
+    OrderItem,
+    OrderNumberCounter,
+    OrderTransaction,
+    installment_schedule,
+)
+from sales.schema import SHOWCASE_SIZE, schema
+from users.models import Business
+from utils import test_utils
+from utils.dataloaders import load_related, register
+from utils.query_optimizer import optimize_queryset
+from utils.result_cache import cached_result, get_versions, invalidate
+from utils.test_utils import create_item_variant, create_user, execute_graphql
 
-# Create your tests here.
+
+class OrderNumberTests(TestCase):
+    def test_numbers_are_sequential_within_a_year(self):
+        user = create_user("1000")
+        now = timezone.now()
+        numbers = [Order.objects.create(user=user).order_number for _ in range(3)]
+        self.assertEqual(
+            numbers,
+            [f"UST{now.year}-{now.month:02d}{n:06d}" for n in range(1, 4)],
+        )
+
+    def test_counter_continues_after_existing_numbers(self):
+        user = create_user("1001")
+        year = timezone.now().year
+        Order.objects.create(user=user, order_number=f"UST{year}-01000041")
+        OrderNumberCounter.objects.all().delete()
+        order = Order.objects.create(user=user)
+        self.assertTrue(order.order_number.endswith("000042"))
+
+
+class OrderTotalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("3000")
+        display_item = DisplayItem.objects.create(type="s", name="مبل")
+        cls.item_variants = [
+            create_item_variant(display_item, name=f"مبل {i}", price=1000 * (i + 1))
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.order = Order.objects.create(user=self.user)
+        for item_variant in self.item_variants:
+            OrderItem.add_to_order(self.order, item_variant, 1)
+
+    def assertTotal(self, order, total):
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, total)
+        self.assertEqual(
+            sum(item.total_price for item in order.items.all()), order.total_price
+        )
+
+    def test_save_moves_the_total(self):
+        order_item = self.order.items.get(item_variant=self.item_variants[1])
+        order_item.quantity = 4
+        order_item.save()
+        self.assertTotal(self.order, 12000)
+
+        other = Order.objects.create(user=self.user)
+        order_item.order = other
+        order_item.save()
+        self.assertTotal(self.order, 4000)
+        self.assertTotal(other, 8000)
+
+    def test_delete_subtracts_the_item(self):
+        self.order.items.get(item_variant=self.item_variants[0]).delete()
+        self.assertTotal(self.order, 5000)
+
+        # Deferred totals are read before the row goes away
+        self.order.items.only("id").get(item_variant=self.item_variants[1]).delete()
+        self.assertTotal(self.order, 3000)
+
+    def test_queryset_delete_subtracts_the_items(self):
+        self.order.items.filter(price__lte=2000).delete()
+        self.assertTotal(self.order, 3000)
+        OrderItem.objects.filter(order=self.order).delete()
+        self.assertTotal(self.order, 0)
+
+    def test_order_delete(self):
+        # The items go with their order, whose total is not updated first
+        with CaptureQueriesContext(connection) as queries:
+            self.order.delete()
+        self.assertFalse(
+            [query for query in queries if query["sql"].startswith("UPDATE")]
+        )
+        self.assertFalse(OrderItem.objects.filter(order_id=self.order.id).exists())
+
+
+class AddToOrderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("3100")
+        cls.item_variant = create_item_variant(price=1500)
+
+    def test_same_variant_is_merged(self):
+        order = Order.objects.create(user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            first = OrderItem.add_to_order(order, self.item_variant, 1, "اول")
+        # The upsert and the order total update
+        self.assertEqual(
+            [
+                query["sql"].split()[0]
+                for query in queries
+                if "SAVEPOINT" not in query["sql"]
+            ],
+            ["INSERT", "UPDATE"],
+        )
+        self.assertEqual(order.total_price, 1500)
+
+        # The row keeps its snapshot, only the quantity grows
+        ItemVariant.objects.filter(pk=self.item_variant.pk).update(price=9999)
+        self.item_variant.refresh_from_db()
+        second = OrderItem.add_to_order(order, self.item_variant, 2, "دوم")
+
+        self.assertEqual(second.pk, first.pk)
+        self.assertEqual(
+            (second.quantity, second.price, second.total_price, second.description),
+            (3, 1500, 4500, "اول"),
+        )
+        self.assertEqual(order.total_price, 4500)
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, 4500)
+        self.assertEqual(order.items.count(), 1)
+
+    def test_variants_of_other_orders_are_separate(self):
+        orders = [Order.objects.create(user=self.user) for _ in range(2)]
+        for order in orders:
+            OrderItem.add_to_order(order, self.item_variant, 2)
+        self.assertEqual(
+            list(
+                OrderItem.objects.filter(order__in=orders).values_list(
+                    "quantity", flat=True
+                )
+            ),
+            [2, 2],
+        )
+
+
+@unittest.skipUnless(
+    connection.vendor == "postgresql", "row locks need a concurrent database"
+)
+# Commits run their callbacks, do not queue catalog snapshot rebuilds
+@override_settings(CATALOG_SNAPSHOT_PATH="")
+class OrderNumberConcurrencyTests(TransactionTestCase):
+    calls = 200
+    workers = 20
+
+    def test_parallel_create_order_item(self):
+        user = create_user("2000")
+        item_variant = create_item_variant()
+        token = get_token(user)
+        query = """
+            mutation ($input: CreateOrderItemInput!) {
+                createOrderItem(input: $input) {
+                    success
+                    orderItem { order { orderNumber } }
+                }
+            }
+        """
+
+        def create_order_item(_):
+            try:
+                response = Client().post(
+                    "/api/sales/graphql/",
+                    json.dumps(
+                        {
+                            "query": query,
+                            "variables": {
+                                "input": {"itemVariant": item_variant.id, "quantity": 1}
+                            },
+                        }
+                    ),
+                    content_type="application/json",
+                    HTTP_AUTHORIZATION=f"Bearer {token}",
+                )
+                return response.json()["data"]["createOrderItem"]
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(create_order_item, range(self.calls)))
+
+        self.assertTrue(all(result["success"] for result in results))
+        numbers = {result["orderItem"]["order"]["orderNumber"] for result in results}
+        self.assertEqual(len(numbers), self.calls)
+        self.assertEqual(Order.objects.filter(user=user).count(), self.calls)
+        self.assertEqual(
+            OrderNumberCounter.objects.get(year=timezone.now().year).value,
+            self.calls,
+        )
+
+
+class ResultCacheTests(TestCase):
+    def test_invalidate_changes_the_version(self):
+        (version,) = get_versions(["test_tag"])
+        self.assertEqual(get_versions(["test_tag"]), [version])
+        invalidate("test_tag")
+        self.assertNotEqual(get_versions(["test_tag"]), [version])
+
+    @override_settings(RESULT_CACHE_LOCK_TIMEOUT=5)
+    def test_one_caller_builds_a_missing_key(self):
+        key = f"result_cache_test_{time.time_ns()}"
+        self.addCleanup(cache.delete, key)
+        builds = []
+
+        def build():
+            builds.append(1)
+            time.sleep(0.2)
+            return "value"
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            values = list(executor.map(lambda _: cached_result(key, build), range(5)))
+        self.assertEqual(values, ["value"] * 5)
+        self.assertEqual(len(builds), 1)
+
+
+@override_settings(CATALOG_SNAPSHOT_PATH="")
+class CatalogCacheTests(TestCase):
+    QUERY = "{ itemVariants { id } }"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = test_utils.SeedData()
+        cls.business_variant = create_item_variant(
+            cls.data.display_items[0], name="ویژه شرکت", is_for_business=True
+        )
+
+    def item_variant_ids(self, user=None):
+        result = execute_graphql("/api/sales/graphql/", self.QUERY, user=user)
+        return {int(item["id"]) for item in result["data"]["itemVariants"]}
+
+    def test_segment_does_not_leak_between_requests(self):
+        retail = self.item_variant_ids(self.data.customer)
+        self.assertNotIn(self.business_variant.id, retail)
+        self.assertIn(self.business_variant.id, self.item_variant_ids())
+        self.assertEqual(
+            self.item_variant_ids(self.data.business_user), {self.business_variant.id}
+        )
+
+    def test_versions_change_on_commit(self):
+        item_variant = self.data.item_variants[0]
+        tags = ["catalog", f"item_variant_{item_variant.pk}"]
+        before = get_versions(tags)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                item_variant.price = 2000
+                item_variant.save()
+                self.data.display_items[0].save()
+                # A miss rebuilt now reads the uncommitted rows
+                self.assertEqual(get_versions(tags), before)
+        after = get_versions(tags)
+        self.assertNotEqual(after[0], before[0])
+        self.assertNotEqual(after[1], before[1])
+
+    def test_catalog_change_invalidates_cached_lists(self):
+        before = self.item_variant_ids()
+        with self.captureOnCommitCallbacks(execute=True):
+            item_variant = create_item_variant(self.data.display_items[1])
+        self.assertEqual(self.item_variant_ids(), before | {item_variant.id})
+
+
+class CartTests(TestCase):
+    CART = "cart { totalPrice items { quantity description itemVariant { id } } }"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = test_utils.SeedData()
+
+    def setUp(self):
+        self.user = self.data.customer
+        take_cart(self.user.id)
+        self.addCleanup(take_cart, self.user.id)
+
+    def execute(self, query, variables=None):
+        result = execute_graphql("/api/sales/graphql/", query, variables, self.user)
+        self.assertNotIn("errors", result)
+        return result["data"]
+
+    def add(self, item_variant, quantity, description=None):
+        return self.execute(
+            "mutation ($input: AddToCartInput!) { addToCart(input: $input) { %s } }"
+            % self.CART,
+            {
+                "input": {
+                    "itemVariant": item_variant.id,
+                    "quantity": quantity,
+                    "description": description,
+                }
+            },
+        )["addToCart"]["cart"]
+
+    def checkout(self):
+        return self.execute(
+            """mutation ($input: CheckoutInput!) { checkout(input: $input) {
+                success errors order { id status totalPrice items { name quantity } }
+            } }""",
+            {"input": {"address": self.data.addresses[0].id}},
+        )["checkout"]
+
+    def test_add_update_remove(self):
+        first, second = self.data.item_variants[:2]
+        self.add(first, 1, "رنگ روشن")
+        cart = self.add(first, 2)
+        self.assertEqual(
+            cart["items"],
+            [
+                {
+                    "quantity": 3,
+                    "description": "رنگ روشن",
+                    "itemVariant": {"id": str(first.id)},
+                }
+            ],
+        )
+        self.add(second, 1)
+
+        cart = self.execute(
+            """mutation ($input: UpdateCartItemInput!) {
+                updateCartItem(input: $input) { %s }
+            }""" % self.CART,
+            {"input": {"itemVariant": second.id, "quantity": 4}},
+        )["updateCartItem"]["cart"]
+        self.assertEqual(cart["totalPrice"], 7 * 1000)
+
+        cart = self.execute(
+            """mutation ($input: RemoveFromCartInput!) {
+                removeFromCart(input: $input) { %s }
+            }""" % self.CART,
+            {"input": {"itemVariant": first.id}},
+        )["removeFromCart"]["cart"]
+        self.assertEqual([item["quantity"] for item in cart["items"]], [4])
+
+    def test_checkout(self):
+        self.add(self.data.item_variants[0], 2)
+        self.add(self.data.item_variants[1], 1)
+        with mock.patch("sales.schema.send_order_status_email") as send_email:
+            with self.captureOnCommitCallbacks(execute=True):
+                result = self.checkout()
+
+        self.assertTrue(result["success"])
+        order = result["order"]
+        self.assertEqual(order["status"], "P")
+        self.assertEqual(order["totalPrice"], 3000)
+        self.assertEqual(sorted(item["quantity"] for item in order["items"]), [1, 2])
+        self.assertEqual(Order.objects.get(pk=order["id"]).total_price, 3000)
+        send_email.delay.assert_called_once_with(int(order["id"]), "p")
+        self.assertEqual(get_cart(self.user.id), {})
+
+        result = self.checkout()
+        self.assertFalse(result["success"])
+
+    def test_checkout_with_deleted_item_variant(self):
+        kept = self.data.item_variants[0]
+        deleted = create_item_variant(self.data.display_items[0], name="حذف شده")
+        self.add(kept, 1)
+        self.add(deleted, 1)
+        deleted_id = deleted.id
+        deleted.delete()
+
+        orders = Order.objects.count()
+        result = self.checkout()
+        self.assertFalse(result["success"])
+        self.assertEqual(json.loads(result["errors"])["missing"], [deleted_id])
+        self.assertEqual(Order.objects.count(), orders)
+        self.assertEqual(list(get_cart(self.user.id)), [kept.id])
+
+    @mock.patch("sales.schema.take_cart", side_effect=RuntimeError("broken"))
+    def test_checkout_logs_failures(self, take_cart):
+        with self.assertLogs("sales.schema", "ERROR") as logs:
+            checkout = self.checkout()
+        self.assertFalse(checkout["success"])
+        self.assertIn("RuntimeError: broken", logs.output[0])
+
+    def test_take_cart_leaves_later_items(self):
+        first, second = self.data.item_variants[:2]
+        add_to_cart(self.user.id, first.id, 2, "توضیح")
+        cart = take_cart(self.user.id)
+        add_to_cart(self.user.id, first.id, 1)
+        add_to_cart(self.user.id, second.id, 1)
+        self.assertEqual(cart, {first.id: {"quantity": 2, "description": "توضیح"}})
+
+        restore_cart(self.user.id, cart)
+        self.assertEqual(
+            get_cart(self.user.id),
+            {
+                first.id: {"quantity": 3, "description": "توضیح"},
+                second.id: {"quantity": 1, "description": None},
+            },
+        )
+
+
+class CatalogSnapshotTests(TestCase):
+    CATALOG_QUERY = """
+    query ($filter: ItemVariantFilterInput, $id: ID!) {
+        displayItems(filter: {type: ["s", "m"]}, perPage: 1, page: 2) {
+            totalPages totalItems
+            items { id name type variants { id name displayItem { name } } }
+        }
+        displayItem(id: $id) { name variants { name price } }
+        itemVariants(filter: $filter) {
+            id name price dimensions description fabric color woodColor thumbnail
+            displayItem { name variants { name } }
+        }
+        showcase { id name displayItem { type } }
+    }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = test_utils.SeedData()
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = f"{directory}/catalog.snapshot"
+        settings = override_settings(CATALOG_SNAPSHOT_PATH=self.path)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        write_catalog_snapshot()
+
+    def execute(self, variables):
+        response = Client().post(
+            "/api/sales/graphql/",
+            json.dumps({"query": self.CATALOG_QUERY, "variables": variables}),
+            content_type="application/json",
+        )
+        result = response.json()
+        self.assertNotIn("errors", result)
+        return result["data"]
+
+    def test_matches_database(self):
+        for variables in [
+            {"id": self.data.display_items[0].id},
+            {
+                "id": self.data.display_items[1].id,
+                "filter": {
+                    "name_Icontains": "مورد",
+                    "price_Lte": 1000,
+                    "color": "سبز",
+                },
+            },
+            {"id": self.data.display_items[2].id, "filter": {"price_Gte": 2000}},
+        ]:
+            with self.assertNumQueries(0):
+                from_snapshot = self.execute(variables)
+            with self.settings(CATALOG_SNAPSHOT_PATH=""):
+                from_database = self.execute(variables)
+            self.assertEqual(from_snapshot, from_database)
+
+    @mock.patch("sales.schema.schedule_catalog_snapshot")
+    def test_stale_snapshot_is_not_served(self, schedule_catalog_snapshot):
+        variables = {"id": self.data.display_items[0].id}
+        item_variant = self.data.item_variants[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            item_variant.price = 5000
+            item_variant.save()
+
+        prices = [item["price"] for item in self.execute(variables)["itemVariants"]]
+        self.assertIn(5000, prices)
+        schedule_catalog_snapshot.assert_called()
+
+        # The rebuilt file replaces the mapped one
+        write_catalog_snapshot()
+        with self.assertNumQueries(0):
+            data = self.execute(variables)
+        self.assertIn(5000, [item["price"] for item in data["itemVariants"]])
+
+    def test_order_items_read_database(self):
+        # Only catalog selections are served from the snapshot
+        response = Client().post(
+            "/api/sales/graphql/",
+            json.dumps({"query": "{ itemVariants { name orderItems { id } } }"}),
+            content_type="application/json",
+        )
+        self.assertNotIn("errors", response.json())
+        self.assertTrue(
+            any(item["orderItems"] for item in response.json()["data"]["itemVariants"])
+        )
+
+
+class RelationLoaderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("loader")
+        display_item = DisplayItem.objects.create(type="s", name="مبل بارگذاری")
+        for i in range(3):
+            order = Order.objects.create(user=cls.user)
+            OrderItem.add_to_order(
+                order, create_item_variant(display_item, name=f"مبل {i}"), 1
+            )
+
+    def test_siblings_are_loaded_together(self):
+        info = SimpleNamespace(context=SimpleNamespace())
+        orders = register(info, Order.objects.all())
+        with self.assertNumQueries(1):
+            items = [load_related(info, order, "items") for order in orders]
+        self.assertEqual([len(order_items) for order_items in items], [1, 1, 1])
+
+        # The items one batch loaded are siblings in turn
+        with self.assertNumQueries(1):
+            item_variants = [
+                load_related(info, order_items[0], "item_variant")
+                for order_items in items
+            ]
+        self.assertEqual(len({item_variant.id for item_variant in item_variants}), 3)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(load_related(info, orders[0], "items"), items[0])
+
+    def test_missing_one_to_one_is_none(self):
+        info = SimpleNamespace(context=SimpleNamespace())
+        self.assertIsNone(load_related(info, self.user, "business"))
+
+
+class BenchmarkDataloadersTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = test_utils.SeedData()
+
+    def test_reports_query_counts(self):
+        stdout, stderr = StringIO(), StringIO()
+        call_command(
+            "benchmark_dataloaders",
+            "--page-sizes",
+            "1",
+            "3",
+            stdout=stdout,
+            stderr=stderr,
+        )
+        self.assertEqual(stderr.getvalue(), "")
+        lines = stdout.getvalue().splitlines()
+        self.assertRegex(lines[0], r"^perPage=1: \d+ queries$")
+        self.assertRegex(lines[1], r"^perPage=3: \d+ queries$")
+        self.assertEqual(lines[2], "Query count is constant")
+
+
+class QueryOptimizerTests(SimpleTestCase):
+    def optimize(self, query):
+        document = parse(query)
+        info = SimpleNamespace(
+            field_nodes=[document.definitions[0].selection_set.selections[0]],
+            fragments={
+                definition.name.value: definition
+                for definition in document.definitions
+                if isinstance(definition, FragmentDefinitionNode)
+            },
+        )
+        return optimize_queryset(Order.objects.all(), info)
+
+    def test_relations_follow_the_selection(self):
+        queryset = self.optimize(
+            "{ orders { orderNumber address { title } items { name } } }"
+        )
+        self.assertEqual(queryset.query.select_related, {"address": {}})
+        (items,) = queryset._prefetch_related_lookups
+        self.assertEqual(items.prefetch_through, "items")
+
+    def test_fragments_are_followed(self):
+        queryset = self.optimize("""query { orders { ...OrderFields } }
+            fragment OrderFields on OrderType {
+                ... on OrderType { status user { username } }
+            }""")
+        self.assertEqual(queryset.query.select_related, {"user": {}})
+        columns, _ = queryset.query.deferred_loading
+        self.assertLessEqual({"status", "user__username"}, columns)
+
+    def test_only_selected_columns_are_loaded(self):
+        queryset = self.optimize(
+            "{ orders { orderNumber address { title } items { name } } }"
+        )
+        columns, defer = queryset.query.deferred_loading
+        self.assertFalse(defer)
+        self.assertLessEqual({"id", "order_number", "user", "address__title"}, columns)
+        self.assertNotIn("total_price", columns)
+
+        # Prefetched rows keep their foreign keys to be matched to the orders
+        (items,) = queryset._prefetch_related_lookups
+        self.assertEqual(
+            items.queryset.query.deferred_loading,
+            ({"id", "order", "item_variant", "name"}, False),
+        )
+
+    def test_fields_not_on_the_model_load_every_column(self):
+        queryset = self.optimize("{ orders { orderNumber isLate } }")
+        self.assertEqual(queryset.query.deferred_loading, (frozenset(), True))
+
+
+@override_settings(CATALOG_SNAPSHOT_PATH="")
+class ShowcaseTests(TestCase):
+    QUERY = "{ showcase { id displayItem { type } } }"
+
+    @classmethod
+    def setUpTestData(cls):
+        sofa = DisplayItem.objects.create(type="s", name="مبل ویترین")
+        bed = DisplayItem.objects.create(type="b", name="تخت ویترین")
+        cls.sofas = [
+            create_item_variant(sofa, name=f"مبل {i}", show_in_first_page=True)
+            for i in range(SHOWCASE_SIZE + 1)
+        ]
+        cls.beds = [
+            create_item_variant(bed, name=f"تخت {i}", show_in_first_page=True)
+            for i in range(2)
+        ]
+        create_item_variant(sofa, name="مبل پنهان")
+        cls.business_sofa = create_item_variant(
+            sofa, name="مبل شرکتی", show_in_first_page=True, is_for_business=True
+        )
+        cls.business_user = create_user("showcase_business")
+        Business.objects.create(
+            user=cls.business_user,
+            name="شرکت ویترین",
+            owner_first_name="نام",
+            owner_last_name="نام خانوادگی",
+            owner_phone_number="+989120000002",
+            is_confirmed=True,
+        )
+
+    def setUp(self):
+        # Cached showcases of other tests were never invalidated, nothing
+        # commits in a TestCase
+        invalidate("catalog")
+
+    def showcase(self, user=None):
+        result = execute_graphql("/api/sales/graphql/", self.QUERY, user=user)
+        return [int(item["id"]) for item in result["data"]["showcase"]]
+
+    def test_latest_variants_of_each_type(self):
+        expected = [item_variant.id for item_variant in self.sofas[:0:-1]]
+        expected += [item_variant.id for item_variant in reversed(self.beds)]
+        self.assertEqual(self.showcase(), expected)
+
+    def test_business_segment(self):
+        self.assertEqual(self.showcase(self.business_user), [self.business_sofa.id])
+
+
+class InstallmentScheduleTests(SimpleTestCase):
+    def test_checks_share_the_rest(self):
+        schedule = installment_schedule(
+            1000, 30, 3, date(2026, 1, 10), date(2026, 1, 1)
+        )
+        self.assertEqual(
+            schedule,
+            [
+                (300, False, date(2026, 1, 8)),
+                (234, True, date(2026, 2, 9)),
+                (233, True, date(2026, 3, 11)),
+                (233, True, date(2026, 4, 10)),
+            ],
+        )
+
+    def test_full_upfront_has_no_checks(self):
+        schedule = installment_schedule(
+            1000, 100, 0, date(2026, 1, 10), date(2026, 1, 1)
+        )
+        self.assertEqual(schedule, [(1000, False, date(2026, 1, 8))])
+
+
+class SalesQueryBudgetTests(test_utils.GraphQLBudgetTestCase):
+    url = "/api/sales/graphql/"
+    schema = schema
+
+    def test_display_items(self):
+        self.execute(
+            "{ displayItems(perPage: 10) { items { name variants { name } } totalItems } }"
+        )
+
+    def test_display_item(self):
+        self.execute(
+            "query ($id: ID!) { displayItem(id: $id) { name variants { name } } }",
+            {"id": self.data.display_items[0].id},
+        )
+
+    def test_item_variants(self):
+        self.execute("{ itemVariants { name displayItem { name } } }")
+
+    def test_item_variants_of_a_customer(self):
+        data = self.execute(
+            "{ itemVariants { name displayItem { name } } }", user=self.data.customer
+        )
+        self.assertEqual(len(data["itemVariants"]), len(self.data.item_variants))
+
+    def test_item_variants_with_order_items(self):
+        data = self.execute("{ itemVariants { name orderItems { quantity } } }")
+        self.assertTrue(any(item["orderItems"] for item in data["itemVariants"]))
+
+    def test_item_variant(self):
+        self.execute(
+            "query ($id: ID!) { itemVariant(id: $id) { name displayItem { name } } }",
+            {"id": self.data.item_variants[0].id},
+        )
+
+    def test_item_variant_of_a_customer(self):
+        data = self.execute(
+            "query ($id: ID!) { itemVariant(id: $id) { name displayItem { name } } }",
+            {"id": self.data.item_variants[0].id},
+            user=self.data.customer,
+        )
+        self.assertEqual(data["itemVariant"]["name"], self.data.item_variants[0].name)
+
+    def test_item_variant_with_order_items(self):
+        data = self.execute(
+            "query ($id: ID!) { itemVariant(id: $id) { name orderItems { quantity } } }",
+            {"id": self.data.item_variants[0].id},
+        )
+        self.assertEqual(data["itemVariant"]["orderItems"], [{"quantity": 2}])
+
+    def test_showcase(self):
+        self.execute(
+            "{ showcase { name displayItem { type } } }", user=self.data.customer
+        )
+
+    def test_orders(self):
+        self.execute(
+            """{ orders { totalItems items {
+                orderNumber address { title }
+                items { name itemVariant { name displayItem { name } } }
+                transactions { amount }
+            } } }""",
+            user=self.data.customer,
+        )
+
+    def test_order(self):
+        self.execute(
+            """query ($id: ID!) { order(id: $id) {
+                orderNumber items { name } transactions { amount }
+            } }""",
+            {"id": self.data.orders[0].id},
+            user=self.data.customer,
+        )
+
+    def test_transactions(self):
+        self.execute(
+            "{ transactions { items { amount order { orderNumber } } } }",
+            user=self.data.customer,
+        )
+
+    def test_transaction(self):
+        self.execute(
+            "query ($id: ID!) { transaction(id: $id) { amount order { orderNumber } } }",
+            {"id": self.data.orders[0].transactions.first().id},
+            user=self.data.customer,
+        )
+
+    def test_installment_plan(self):
+        order = self.data.orders[0]
+        transactions = OrderTransaction.objects.count()
+        data = self.execute(
+            """query ($order: ID!) {
+                installmentPlan(order: $order, upfront: 30, checks: 3) {
+                    amount isCheck dueDate
+                }
+            }""",
+            {"order": order.id},
+            user=self.data.customer,
+        )
+        plan = data["installmentPlan"]
+        self.assertEqual([item["isCheck"] for item in plan], [False, True, True, True])
+        self.assertEqual(sum(item["amount"] for item in plan), order.total_price)
+        # A preview, nothing is written
+        self.assertEqual(OrderTransaction.objects.count(), transactions)
+
+    def test_create_order_item(self):
+        data = self.execute(
+            """mutation ($input: CreateOrderItemInput!) {
+                createOrderItem(input: $input) { success orderItem { quantity } }
+            }""",
+            {
+                "input": {
+                    "order": self.data.orders[0].id,
+                    "itemVariant": self.data.item_variants[0].id,
+                    "quantity": 1,
+                }
+            },
+            user=self.data.customer,
+        )
+        self.assertTrue(data["createOrderItem"]["success"])
+
+    def test_create_order_item_in_new_order(self):
+        data = self.execute(
+            """mutation ($input: CreateOrderItemInput!) {
+                createOrderItem(input: $input) { success orderItem { order { orderNumber } } }
+            }""",
+            {"input": {"itemVariant": self.data.item_variants[0].id, "quantity": 1}},
+            user=self.data.customer,
+        )
+        self.assertTrue(data["createOrderItem"]["success"])
+
+    def test_create_transaction(self):
+        data = self.execute(
+            """mutation ($input: CreateTransactionInput!) {
+                createTransaction(input: $input) { success transactions { amount } }
+            }""",
+            {"input": {"order": self.data.orders[0].id, "upfront": 30, "checks": 3}},
+            user=self.data.customer,
+        )
+        self.assertTrue(data["createTransaction"]["success"])
+
+    def test_update_order_item(self):
+        data = self.execute(
+            """mutation ($input: UpdateOrderItemInput!) {
+                updateOrderItem(input: $input) { success }
+            }""",
+            {
+                "input": {
+                    "id": self.data.orders[0].items.first().id,
+                    "itemVariant": create_item_variant(
+                        self.data.display_items[0], name="مبل دیگر"
+                    ).id,
+                    "quantity": 5,
+                }
+            },
+            user=self.data.customer,
+        )
+        self.assertTrue(data["updateOrderItem"]["success"])
+
+    def test_update_order(self):
+        data = self.execute(
+            """mutation ($input: UpdateOrderInput!) {
+                updateOrder(input: $input) { success }
+            }""",
+            {
+                "input": {
+                    "id": self.data.orders[0].id,
+                    "status": "p",
+                    "address": self.data.addresses[0].id,
+                }
+            },
+            user=self.data.customer,
+        )
+        self.assertTrue(data["updateOrder"]["success"])
+
+    def test_delete_order_item(self):
+        data = self.execute(
+            """mutation ($input: DeleteOrderItemInput!) {
+                deleteOrderItem(input: $input) { success }
+            }""",
+            {"input": {"id": self.data.orders[0].items.first().id}},
+            user=self.data.customer,
+        )
+        self.assertTrue(data["deleteOrderItem"]["success"])
+
+    def test_delete_order(self):
+        data = self.execute(
+            """mutation ($input: DeleteOrderInput!) {
+                deleteOrder(input: $input) { success }
+            }""",
+            {"input": {"id": self.data.orders[0].id}},
+            user=self.data.customer,
+        )
+        self.assertTrue(data["deleteOrder"]["success"])
+
+    def test_cart(self):
+        cart = "cart { totalPrice items { quantity itemVariant { name } } }"
+        for item_variant in self.data.item_variants[:3]:
+            data = self.execute(
+                """mutation ($input: AddToCartInput!) {
+                    addToCart(input: $input) { success %s }
+                }""" % cart,
+                {"input": {"itemVariant": item_variant.id, "quantity": 1}},
+                user=self.data.customer,
+            )
+            self.assertTrue(data["addToCart"]["success"])
+
+        self.execute(
+            """mutation ($input: UpdateCartItemInput!) {
+                updateCartItem(input: $input) { success %s }
+            }""" % cart,
+            {"input": {"itemVariant": self.data.item_variants[0].id, "quantity": 3}},
+            user=self.data.customer,
+        )
+        self.execute(
+            """mutation ($input: RemoveFromCartInput!) {
+                removeFromCart(input: $input) { success %s }
+            }""" % cart,
+            {"input": {"itemVariant": self.data.item_variants[1].id}},
+            user=self.data.customer,
+        )
+        self.execute("{ %s }" % cart, user=self.data.customer)
+
+        data = self.execute(
+            """mutation ($input: CheckoutInput!) {
+                checkout(input: $input) { success order { totalPrice items { name } } }
+            }""",
+            {"input": {"address": self.data.addresses[0].id}},
+            user=self.data.customer,
+        )
+        self.assertEqual(data["checkout"]["order"]["totalPrice"], 4000)
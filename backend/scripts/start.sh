@@ -17,4 +17,6 @@ python manage.py add_cities
 
 python manage.py custom_superuser
 
+python manage.py build_catalog_snapshot
+
 uwsgi --ini ./uwsgi.ini
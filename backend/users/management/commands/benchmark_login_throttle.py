@@ -0,0 +1,108 @@
+import time
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from users.schema import schema
+from utils.login_throttle import unlock_login
+
+LOGIN_MUTATION = """
+mutation Login($username: String!, $password: String!) {
+  login(username: $username, password: $password) {
+    success
+    errors
+    retryAfter
+  }
+}
+"""
+WRONG_PASSWORD_ERROR = "نام کاربری یا رمز عبور اشتباه است"
+
+
+class Command(BaseCommand):
+    help = (
+        "Times wrong-password logins from a few addresses with and without the "
+        "login throttle, and the logins of a real user made meanwhile"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target", default="admin")
+        parser.add_argument("--attempts", type=int, default=200)
+        parser.add_argument("--ips", type=int, default=4)
+        parser.add_argument("--username", help="User logging in during the attack")
+        parser.add_argument("--password")
+        parser.add_argument(
+            "--every",
+            type=int,
+            default=20,
+            help="Attempts between two logins of --username",
+        )
+
+    def login(self, username, password, ip):
+        request = RequestFactory().post("/api/users/graphql/", REMOTE_ADDR=ip)
+        request.user = AnonymousUser()
+        start = time.perf_counter()
+        result = schema.execute(
+            LOGIN_MUTATION,
+            context_value=request,
+            variable_values={"username": username, "password": password},
+        )
+        elapsed = time.perf_counter() - start
+        if result.errors:
+            raise RuntimeError(result.errors)
+        return result.data["login"], elapsed
+
+    def run(self, options):
+        ips = [f"198.51.100.{i + 1}" for i in range(options["ips"])]
+        subjects = [("username", options["target"])] + [("ip", ip) for ip in ips]
+        if options["username"]:
+            subjects += [("username", options["username"]), ("ip", "198.51.100.200")]
+        for kind, identifier in subjects:
+            unlock_login(kind, identifier)
+
+        hashed = 0
+        attack_time = 0
+        user_times = []
+        try:
+            for i in range(options["attempts"]):
+                data, elapsed = self.login(
+                    options["target"], f"wrong-{i}", ips[i % len(ips)]
+                )
+                attack_time += elapsed
+                if data["errors"] == WRONG_PASSWORD_ERROR:
+                    hashed += 1
+                if options["username"] and i % options["every"] == 0:
+                    data, elapsed = self.login(
+                        options["username"], options["password"], "198.51.100.200"
+                    )
+                    if not data["success"]:
+                        self.stderr.write(self.style.ERROR("The user could not log in"))
+                        return
+                    user_times.append(elapsed)
+        finally:
+            for kind, identifier in subjects:
+                unlock_login(kind, identifier)
+
+        self.stdout.write(
+            f"  {options['attempts'] / attack_time:.0f} attempts/s, "
+            f"{hashed} hashed, {options['attempts'] - hashed} rejected early"
+        )
+        if user_times:
+            self.stdout.write(
+                f"  user login: {sum(user_times) / len(user_times) * 1000:.1f} ms "
+                f"mean over {len(user_times)}"
+            )
+        return options["attempts"] / attack_time
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS("Without the throttle"))
+        with override_settings(
+            LOGIN_THROTTLE_USERNAME_LIMIT=options["attempts"] + 1,
+            LOGIN_THROTTLE_IP_LIMIT=options["attempts"] + 1,
+        ):
+            unthrottled = self.run(options)
+        self.stdout.write(self.style.SUCCESS("With the throttle"))
+        throttled = self.run(options)
+        if unthrottled and throttled:
+            self.stdout.write(
+                f"A worker handles {throttled / unthrottled:.1f}x the attempts"
+            )
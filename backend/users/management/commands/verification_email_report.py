@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from utils.email_verification import get_email_send_report
+
+
+class Command(BaseCommand):
+    help = "Print the verification and OTP emails sent and suppressed by the cooldown"
+
+    def handle(self, *args, **options):
+        for template, counts in sorted(get_email_send_report().items()):
+            self.stdout.write(self.style.SUCCESS(template))
+            for outcome, count in counts.items():
+                self.stdout.write(f"  {outcome}: {count}")
@@ -44,13 +44,18 @@ class User(AbstractUser):
 
     objects = UserManager()
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=["-date_joined", "-id"], name="user_keyset_idx")
+        ]
+
     def __str__(self):
         return self.username
 
     def is_business(self):
+        # The reverse relation is cached on the instance, misses included
         try:
-            business = Business.objects.get(user=self)
-            return business.is_confirmed
+            return self.business.is_confirmed
         except Business.DoesNotExist:
             return False
 
@@ -1,28 +1,42 @@
 from hmac import compare_digest
 from typing import Required
 from django.utils import timezone
+import math
 import re
 import graphene
 from django.contrib.auth import (
     authenticate,
 )
+from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from graphene_django import DjangoObjectType
+from graphql import GraphQLError
 from graphql_jwt.shortcuts import get_token
-import redis
 from utils.validation_utils import is_persian_string
+from main.geo_index import get_geo_index
 from main.models import (
-    BurnedTokens,
     Cities,
     Provinces,
 )
 from utils.schema_utils import (
     login_required,
 )
+from utils.auth_context import get_auth_context
+from utils.dataloaders import load_related, register
+from utils.token_revocation import revoke_token
 from users.tasks import (
     send_code_email,
 )
-from utils.email_verification import generate_verification_code
+from utils.login_throttle import (
+    get_client_ip,
+    login_retry_after,
+    record_login_failure,
+    record_login_success,
+)
+from utils.email_verification import (
+    check_verification_code,
+    issue_verification_code,
+)
 from users.models import (
     Address,
     User,
@@ -31,38 +45,79 @@ from users.models import (
 
 
 def send_email(user, template):
-    send_code_email.delay(
-        user.get_full_name(),
-        user.email,
-        generate_verification_code(user.email),
-        template,
-    )
+    """
+    Email a new code to the user, unless the cooldown kept the previous one.
+    Returns whether an email was queued.
+    """
+    code = issue_verification_code(user.email, template)
+    if code is None:
+        return False
+    send_code_email.delay(user.get_full_name(), user.email, code, template)
+    return True
 
 
 class UserType(DjangoObjectType):
     class Meta:
         model = User
 
+    def resolve_business(self, info):
+        return load_related(info, self, "business")
+
+    def resolve_addresses(self, info):
+        return load_related(info, self, "addresses")
+
+    def resolve_order_set(self, info):
+        return load_related(info, self, "order_set")
+
 
 class BusinessType(DjangoObjectType):
     class Meta:
         model = Business
 
+    def resolve_user(self, info):
+        return load_related(info, self, "user")
+
 
 class ProvinceType(DjangoObjectType):
     class Meta:
         model = Provinces
 
+    def resolve_cities_set(self, info):
+        return load_related(info, self, "cities_set")
+
 
 class CityType(DjangoObjectType):
     class Meta:
         model = Cities
 
+    def resolve_province(self, info):
+        return load_related(info, self, "province")
+
+
+class ProvinceEntryType(graphene.ObjectType):
+    id = graphene.ID(required=True)
+    name = graphene.String(required=True)
+
+
+class CityEntryType(graphene.ObjectType):
+    id = graphene.ID(required=True)
+    name = graphene.String(required=True)
+    province_id = graphene.ID(required=True)
+
 
 class AddressType(DjangoObjectType):
     class Meta:
         model = Address
 
+    def resolve_user(self, info):
+        return load_related(info, self, "user")
+
+    def resolve_province(self, info):
+        return load_related(info, self, "province")
+
+    def resolve_city(self, info):
+        return load_related(info, self, "city")
+
 
 # ========================Mutations Start========================
 
@@ -98,6 +153,8 @@ class AddressInput(graphene.InputObjectType):
 
 
 class CreateUser(graphene.Mutation):
+    query_budget = 4
+
     class Arguments:
         user_data = UserInput(required=True)
         business_data = BusinessInput()
@@ -111,7 +168,27 @@ class CreateUser(graphene.Mutation):
         errors = {}
 
         username = user_data.get("username")
-        if User.objects.filter(username=username).exists():
+        phone_number = user_data.get("phone_number")
+        landline_number = user_data.get("landline_number")
+        email = user_data.get("email")
+
+        # One query for the four uniqueness checks
+        taken = {
+            "username": set(),
+            "phone_number": set(),
+            "landline_number": set(),
+            "email": set(),
+        }
+        for row in User.objects.filter(
+            Q(username=username)
+            | Q(phone_number=phone_number)
+            | Q(landline_number=landline_number)
+            | Q(email=email)
+        ).values(*taken):
+            for field, value in row.items():
+                taken[field].add(value)
+
+        if username in taken["username"]:
             errors["username"] = "نام کاربری وارد شده در سیستم وجود دارد"
         elif not re.match("^[a-zA-Z][a-zA-Z0-9_]{4,20}$", username):
             errors["username"] = "نام کاربری معتبر نمیباشد"
@@ -131,20 +208,17 @@ class CreateUser(graphene.Mutation):
         elif not re.search("[_@$]", password1):
             errors["password1"] = "رمز عبور باید حداقل شامل یک علامت (@, $, _) باشد"
 
-        phone_number = user_data.get("phone_number")
-        if User.objects.filter(phone_number=phone_number).exists():
+        if phone_number in taken["phone_number"]:
             errors["phone_number"] = "شماره تلفن وارد شده در سیستم وجود دارد"
         elif not re.match(r"^\+\d{9,15}$", phone_number):
             errors["phone_number"] = "شماره تلفن معتبر نمیباشد"
 
-        landline_number = user_data.get("landline_number")
-        if User.objects.filter(landline_number=landline_number).exists():
+        if landline_number in taken["landline_number"]:
             errors["landline_number"] = "شماره ثابت وارد شده در سیستم وجود دارد"
         elif not re.match(r"^\+\d{9,15}$", landline_number):
             errors["landline_number"] = "شماره ثابت معتبر نمیباشد"
 
-        email = user_data.get("email")
-        if User.objects.filter(email=email).exists():
+        if email in taken["email"]:
             errors["email"] = "ایمیل وارد شده در سیستم وجود دارد"
 
         first_name = user_data.get("first_name")
@@ -158,7 +232,9 @@ class CreateUser(graphene.Mutation):
         birthdate = user_data.get("birthdate")
         if birthdate >= timezone.localdate():
             errors["birthdate"] = "تاریخ تولد باید گذشته باشد"
-        elif birthdate > (timezone.localdate() - timezone.timedelta(days=(365.25 * 18))):
+        elif birthdate > (
+            timezone.localdate() - timezone.timedelta(days=(365.25 * 18))
+        ):
             errors["birthdate"] = "شما حداقل باید 18 سال سن داشته باشید"
 
         return errors
@@ -180,9 +256,7 @@ class CreateUser(graphene.Mutation):
                             success=False, errors=business_errors, redirect_url="/auth/"
                         )
                     else:
-                        business = Business.objects.create(user=user, **business_data)
-                        business.save()
-                user.save()
+                        Business.objects.create(user=user, **business_data)
                 send_email(user, "verification")
                 return CreateUser(
                     success=True,
@@ -199,6 +273,8 @@ class CreateUser(graphene.Mutation):
 
 
 class CreateBusiness(graphene.Mutation):
+    query_budget = 3
+
     class Arguments:
         business_data = BusinessInput(required=True)
 
@@ -241,10 +317,7 @@ class CreateBusiness(graphene.Mutation):
                     redirect_url=f"/users/{info.context.user.get_username()}",
                 )
             else:
-                business = Business.objects.create(
-                    user=info.context.user, **business_data
-                )
-                business.save()
+                Business.objects.create(user=info.context.user, **business_data)
                 return CreateBusiness(
                     success=True,
                     errors=None,
@@ -260,6 +333,8 @@ class CreateBusiness(graphene.Mutation):
 
 
 class CreateAddress(graphene.Mutation):
+    query_budget = 3
+
     class Arguments:
         input = AddressInput(required=True)
 
@@ -278,17 +353,19 @@ class CreateAddress(graphene.Mutation):
         elif Address.objects.filter(user=user, title=title).exists():
             errors["title"] = "عنوان ادرس تکراری است"
 
+        index = get_geo_index()
+
         # Validate province
-        try:
-            Provinces.objects.get(name=input.get("province"))
-        except Provinces.DoesNotExist:
+        province = index.province(input.get("province"))
+        if province is None:
             errors["province"] = "استان مورد نظر در سیستم وجود ندارد"
 
-        # Validate city
-        try:
-            Cities.objects.get(name=input.get("city"))
-        except Cities.DoesNotExist:
-            errors["city"] = "شهر مورد نظر در سیستم وجود ندارد"
+        # Validate city, city names are only unique within a province
+        city = None
+        if province is not None:
+            city = index.city(province.id, input.get("city"))
+            if city is None:
+                errors["city"] = "شهر مورد نظر در این استان وجود ندارد"
 
         # Validate address
         address = input.get("address")
@@ -301,24 +378,25 @@ class CreateAddress(graphene.Mutation):
         if len(postal_code) != 10 or not postal_code.isdigit():
             errors["postal_code"] = "کد پستی معتبر نمیباشد"
 
-        return errors
+        return province, city, errors
 
     @login_required
     def mutate(self, info, input):
         try:
-            errors = CreateAddress.validate_input(info.context.user, input)
+            province, city, errors = CreateAddress.validate_input(
+                info.context.user, input
+            )
             if errors:
                 return CreateAddress(success=False, errors=errors)
 
             address = Address.objects.create(
                 user=info.context.user,
                 title=input.title,
-                province=Provinces.objects.get(name=input.province),
-                city=Cities.objects.get(name=input.city),
+                province_id=province.id,
+                city_id=city.id,
                 address=input.address,
                 postal_code=input.postal_code,
             )
-            address.save()
             return CreateAddress(address=address, success=True)
         except Exception as e:
             print(e)
@@ -363,6 +441,8 @@ class UpdateAddressInput(graphene.InputObjectType):
 
 
 class UpdateUser(graphene.Mutation):
+    query_budget = 9
+
     class Arguments:
         user_data = UpdateUserInput()
         business_data = UpdateBusinessInput()
@@ -564,8 +644,8 @@ class UpdateUser(graphene.Mutation):
                         or username_changed
                         or password_changed
                     ):
-                        token = info.context.headers.get("Authorization")
-                        BurnedTokens.objects.create(token=token)
+                        auth_context = get_auth_context(info.context)
+                        revoke_token(auth_context.token, auth_context.payload["exp"])
                         return UpdateUser(
                             success=True,
                             errors=None,
@@ -612,10 +692,11 @@ class UpdateUser(graphene.Mutation):
 
 
 class UpdateAddress(graphene.Mutation):
+    query_budget = 4
 
     success = graphene.Boolean()
     errors = graphene.JSONString()
-    address = AddressType()
+    address = graphene.Field(AddressType)
 
     class Arguments:
         input = UpdateAddressInput(required=True)
@@ -635,23 +716,28 @@ class UpdateAddress(graphene.Mutation):
             else:
                 address.title = title
 
+        index = get_geo_index()
+
         # Validate province
-        province = input.get("province")
-        if province:
-            try:
-                province = Provinces.objects.get(name=province)
-                address.province = province
-            except Provinces.DoesNotExist:
+        province = index.provinces.get(address.province_id)
+        if input.get("province"):
+            province = index.province(input.get("province"))
+            if province is None:
                 errors["province"] = "استان مورد نظر در سیستم وجود ندارد"
-
-        # Validate city
-        city = input.get("city")
-        if city:
-            try:
-                city = Cities.objects.get(name=city)
-                address.city = city
-            except Cities.DoesNotExist:
-                errors["city"] = "شهر مورد نظر در سیستم وجود ندارد"
+            else:
+                address.province_id = province.id
+
+        # Validate city, it has to be in the province of the address
+        if province is not None and (input.get("city") or input.get("province")):
+            city = index.city(
+                province.id,
+                input.get("city")
+                or getattr(index.cities.get(address.city_id), "name", None),
+            )
+            if city is None:
+                errors["city"] = "شهر مورد نظر در این استان وجود ندارد"
+            else:
+                address.city_id = city.id
 
         # Validate address
         address_text = input.get("address")
@@ -687,7 +773,7 @@ class UpdateAddress(graphene.Mutation):
                     errors="آدرس مورد نظر در سیستم وجود ندارد",
                 )
 
-            if address.user != user:
+            if address.user_id != user.id:
                 return UpdateAddress(
                     success=False,
                     errors="شما اجازه دسترسی به این آدرس را ندارید",
@@ -720,6 +806,8 @@ class UpdateAddress(graphene.Mutation):
 
 
 class DeleteAddress(graphene.Mutation):
+    query_budget = 5
+
     class Arguments:
         address_id = graphene.ID(required=True)
 
@@ -754,10 +842,10 @@ class DeleteAddress(graphene.Mutation):
 
 # ========================Verification Start========================
 
-r = redis.StrictRedis(host="redis", port=6379, db=0)
-
 
 class VerifyEmail(graphene.Mutation):
+    query_budget = 2
+
     success = graphene.Boolean()
     errors = graphene.String()
     redirect_url = graphene.String()
@@ -774,11 +862,9 @@ class VerifyEmail(graphene.Mutation):
                 user = get_object_or_404(
                     User, username=info.context.headers.get("username")
                 )
-            stored_code = r.get(f"verification_code_{user.email}")
-            if stored_code and stored_code.decode("utf-8") == code:
+            if check_verification_code(user.email, code):
                 user.is_fully_authenticated = True
                 user.save()
-                r.delete(f"verification_code_{user.email}")
                 token = get_token(user)
                 return VerifyEmail(
                     success=True,
@@ -809,6 +895,7 @@ class VerifyEmail(graphene.Mutation):
 
 
 class ResendEmail(graphene.Mutation):
+    query_budget = 1
 
     success = graphene.Boolean()
     errors = graphene.String()
@@ -824,10 +911,11 @@ class ResendEmail(graphene.Mutation):
                 user = get_object_or_404(
                     User, username=info.context.headers.get("username")
                 )
-            send_email(
-                user,
-                email_type,
-            )
+            if not send_email(user, email_type):
+                return ResendEmail(
+                    success=False,
+                    errors="کد قبلی هنوز معتبر است، لطفا ایمیل خود را بررسی کنید",
+                )
             return ResendEmail(success=True, errors=None)
         except Exception as e:
             print(e)
@@ -835,6 +923,8 @@ class ResendEmail(graphene.Mutation):
 
 
 class Login(graphene.Mutation):
+    query_budget = 1
+
     class Arguments:
         username = graphene.String(required=True)
         password = graphene.String(required=True)
@@ -843,19 +933,12 @@ class Login(graphene.Mutation):
     success = graphene.Boolean()
     errors = graphene.String()
     redirect_url = graphene.String()
+    retry_after = graphene.Int()
 
     def mutate(self, info, username, password):
         try:
             sender = info.context.user
-            try:
-                token = BurnedTokens.objects.get(
-                    token=info.context.headers.get("Authorization")
-                )
-                token = False
-            except BurnedTokens.DoesNotExist:
-                token = True
-
-            if sender.is_authenticated and token:
+            if sender.is_authenticated:
                 return Login(
                     success=False,
                     token=None,
@@ -863,15 +946,32 @@ class Login(graphene.Mutation):
                     errors="شما قبلا وارد شده اید",
                 )
 
+            # Checked before authenticate(), whose password hashing is what
+            # a brute force would tie the workers up with
+            ip = get_client_ip(info.context)
+            retry_after = login_retry_after(username, ip)
+            if retry_after:
+                return Login(
+                    token=None,
+                    success=False,
+                    redirect_url="/auth/",
+                    errors="تعداد تلاش های ناموفق زیاد است، لطفا بعدا دوباره تلاش کنید",
+                    retry_after=math.ceil(retry_after),
+                )
+
             user = authenticate(username=username, password=password)
             if user is None:
+                retry_after = record_login_failure(username, ip)
                 return Login(
                     token=None,
                     success=False,
                     redirect_url="/auth/",
                     errors="نام کاربری یا رمز عبور اشتباه است",
+                    retry_after=math.ceil(retry_after) or None,
                 )
-            elif user is not None and not user.is_fully_authenticated:
+
+            record_login_success(username)
+            if not user.is_fully_authenticated:
                 send_email(
                     user,
                     "verification",
@@ -898,25 +998,20 @@ class Login(graphene.Mutation):
 
 
 class OtpLoginRequest(graphene.Mutation):
+    query_budget = 1
+
     class Arguments:
         email = graphene.String(required=True)
 
     success = graphene.Boolean()
     redirect_url = graphene.String()
     errors = graphene.String()
+    messages = graphene.String()
 
     def mutate(self, info, email):
         try:
             sender = info.context.user
-            try:
-                token = BurnedTokens.objects.get(
-                    token=info.context.headers.get("Authorization")
-                )
-                token = False
-            except BurnedTokens.DoesNotExist:
-                token = True
-
-            if sender.is_authenticated and token:
+            if sender.is_authenticated:
                 return OtpLoginRequest(
                     success=False,
                     redirect_url="/",
@@ -942,11 +1037,18 @@ class OtpLoginRequest(graphene.Mutation):
                     errors="ایمیل شما تایید نشده است",
                 )
 
-            send_email(
-                user,
-                "otp",
+            if not send_email(user, "otp"):
+                # The code emailed a moment ago still works
+                return OtpLoginRequest(
+                    success=True,
+                    redirect_url=f"/auth/otp-login/",
+                    messages="کد قبلی هنوز معتبر است، لطفا ایمیل خود را بررسی کنید",
+                )
+            return OtpLoginRequest(
+                success=True,
+                redirect_url=f"/auth/otp-login/",
+                messages="کد ورود به ایمیل شما ارسال شد",
             )
-            return OtpLoginRequest(success=True, redirect_url=f"/auth/otp-login/")
         except Exception as e:
             print(e)
             return OtpLoginRequest(
@@ -956,10 +1058,9 @@ class OtpLoginRequest(graphene.Mutation):
             )
 
 
-r = redis.StrictRedis(host="redis", port=6379, db=0)
-
-
 class OtpLogin(graphene.Mutation):
+    query_budget = 1
+
     success = graphene.Boolean()
     errors = graphene.String()
     redirect_url = graphene.String()
@@ -971,9 +1072,7 @@ class OtpLogin(graphene.Mutation):
     def mutate(self, info, code):
         try:
             user = get_object_or_404(User, email=info.context.headers.get("email"))
-            stored_code = r.get(f"verification_code_{user.email}")
-            if stored_code and stored_code.decode("utf-8") == code:
-                r.delete(f"verification_code_{user.email}")
+            if check_verification_code(user.email, code):
                 token = get_token(user)
                 return OtpLogin(
                     success=True,
@@ -998,6 +1097,8 @@ class OtpLogin(graphene.Mutation):
 
 
 class Logout(graphene.Mutation):
+    query_budget = 1
+
     success = graphene.Boolean()
     redirect_url = graphene.String()
 
@@ -1005,8 +1106,8 @@ class Logout(graphene.Mutation):
     @login_required
     def mutate(self, info):
         try:
-            token = info.context.headers.get("Authorization")
-            BurnedTokens.objects.create(token=token)
+            auth_context = get_auth_context(info.context)
+            revoke_token(auth_context.token, auth_context.payload["exp"])
             return Logout(success=True, redirect_url="/")
         except Exception as e:
             print(e)
@@ -1041,6 +1142,24 @@ class Query(graphene.ObjectType):
     current_user = graphene.Field(UserType)
     addresses = graphene.List(AddressType)
     address = graphene.Field(AddressType, id=graphene.String())
+    provinces = graphene.List(graphene.NonNull(ProvinceEntryType))
+    cities_by_province = graphene.List(
+        graphene.NonNull(CityEntryType), province=graphene.ID(required=True)
+    )
+
+    query_budgets = {
+        "current_user": 2,
+        "addresses": 4,
+        "address": 3,
+        "provinces": 0,
+        "cities_by_province": 0,
+    }
+
+    # Versions of the fields served with ETags, see utils.graphql_etag
+    etags = {
+        "provinces": lambda: get_geo_index().version,
+        "cities_by_province": lambda: get_geo_index().version,
+    }
 
     @login_required
     def resolve_current_user(self, info):
@@ -1050,12 +1169,22 @@ class Query(graphene.ObjectType):
     @login_required
     def resolve_addresses(self, info):
         sender = info.context.user
-        return Address.objects.filter(user=sender)
-    
+        return register(info, Address.objects.filter(user=sender))
+
     @login_required
     def resolve_address(self, info, id):
         return get_object_or_404(Address, id=id, user=info.context.user)
 
+    def resolve_provinces(self, info):
+        return list(get_geo_index().provinces.values())
+
+    def resolve_cities_by_province(self, info, province):
+        index = get_geo_index()
+        if not province.isdigit() or int(province) not in index.provinces:
+            raise GraphQLError("استان مورد نظر در سیستم وجود ندارد")
+        return index.cities_of(int(province))
+
+
 # ========================Queries End========================
 
 schema = graphene.Schema(query=Query, mutation=Mutation)
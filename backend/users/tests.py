@@ -1,3 +1,576 @@
-from django.test import TestCase
+import json
+import time
+import uuid
+from unittest import mock
+from django.conf import settings
+from django.db import connection
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from graphql_jwt.shortcuts import get_token
+from users.models import Address, User
+from users.schema import schema, send_email
+from utils import test_utils
+from utils.email_verification import (
+    check_verification_code,
+    get_email_send_report,
+    issue_verification_code,
+    verification_code_key,
+)
+from utils.login_throttle import (
+    LOGIN_LOCKOUTS_KEY,
+    get_login_lockouts,
+    login_retry_after,
+    record_login_failure,
+    record_login_success,
+    unlock_login,
+)
+from utils import token_revocation
+from utils.redis_pool import get_redis
+from utils.token_revocation import (
+    REVOKED_TOKEN_PREFIX,
+    REVOKED_TOKENS_INDEX,
+    BloomFilter,
+    is_token_revoked,
+    revoke_token,
+    token_digest,
+)
 
-# Create your tests here.
+
+@override_settings(VERIFICATION_CODE_MAX_ATTEMPTS=3, VERIFICATION_EMAIL_COOLDOWN=0)
+class VerificationCodeTests(SimpleTestCase):
+    email = "code@example.com"
+
+    def setUp(self):
+        get_redis().delete(verification_code_key(self.email))
+
+    def test_code_is_consumed(self):
+        code = issue_verification_code(self.email, "verification")
+        self.assertTrue(check_verification_code(self.email, code))
+        self.assertFalse(check_verification_code(self.email, code))
+
+    def test_code_is_dropped_after_max_attempts(self):
+        code = issue_verification_code(self.email, "verification")
+        wrong = "1" if code[0] != "1" else "2"
+        for _ in range(2):
+            self.assertFalse(check_verification_code(self.email, wrong * 6))
+        self.assertTrue(check_verification_code(self.email, code))
+
+        code = issue_verification_code(self.email, "verification")
+        for _ in range(3):
+            self.assertFalse(check_verification_code(self.email, wrong * 6))
+        self.assertFalse(check_verification_code(self.email, code))
+
+    def test_new_code_resets_attempts(self):
+        issue_verification_code(self.email, "verification")
+        for _ in range(2):
+            self.assertFalse(check_verification_code(self.email, "abcdef"))
+        code = issue_verification_code(self.email, "verification")
+        for _ in range(2):
+            self.assertFalse(check_verification_code(self.email, "abcdef"))
+        self.assertTrue(check_verification_code(self.email, code))
+
+
+@override_settings(VERIFICATION_EMAIL_COOLDOWN=60)
+class VerificationEmailCooldownTests(SimpleTestCase):
+    email = "cooldown@example.com"
+
+    def setUp(self):
+        get_redis().delete(verification_code_key(self.email))
+
+    def test_code_is_reused_within_cooldown(self):
+        report = get_email_send_report().get("verification", {})
+        code = issue_verification_code(self.email, "verification")
+        self.assertIsNotNone(code)
+        self.assertIsNone(issue_verification_code(self.email, "verification"))
+        self.assertIsNone(issue_verification_code(self.email, "otp"))
+        self.assertTrue(check_verification_code(self.email, code))
+
+        counts = get_email_send_report()["verification"]
+        self.assertEqual(counts["sent"], report.get("sent", 0) + 1)
+        self.assertEqual(counts["suppressed"], report.get("suppressed", 0) + 1)
+
+    def test_new_code_after_consumed_or_cooldown(self):
+        code = issue_verification_code(self.email, "otp")
+        self.assertTrue(check_verification_code(self.email, code))
+        self.assertIsNotNone(issue_verification_code(self.email, "otp"))
+        with override_settings(VERIFICATION_EMAIL_COOLDOWN=0):
+            self.assertIsNotNone(issue_verification_code(self.email, "otp"))
+
+    @mock.patch("users.schema.send_code_email")
+    def test_send_email_queues_one_task(self, send_code_email):
+        user = User(username="cooldown", email=self.email)
+        for _ in range(3):
+            send_email(user, "verification")
+        send_code_email.delay.assert_called_once()
+        code = send_code_email.delay.call_args.args[2]
+        self.assertTrue(check_verification_code(self.email, code))
+
+
+@override_settings(VERIFICATION_EMAIL_COOLDOWN=60)
+@mock.patch("users.schema.send_code_email")
+class CooldownResponseTests(TestCase):
+    url = "/api/users/graphql/"
+
+    def setUp(self):
+        self.user = test_utils.create_user("cooldown")
+        get_redis().delete(verification_code_key(self.user.email))
+        self.addCleanup(get_redis().delete, verification_code_key(self.user.email))
+
+    def test_resend_email_within_cooldown(self, send_code_email):
+        query = 'mutation { resendEmail(emailType: "verification") { success errors } }'
+        first = test_utils.execute_graphql(self.url, query, HTTP_EMAIL=self.user.email)[
+            "data"
+        ]["resendEmail"]
+        second = test_utils.execute_graphql(
+            self.url, query, HTTP_EMAIL=self.user.email
+        )["data"]["resendEmail"]
+        self.assertEqual(first, {"success": True, "errors": None})
+        self.assertFalse(second["success"])
+        self.assertNotEqual(second["errors"], "خطایی رخ داده است")
+        send_code_email.delay.assert_called_once()
+
+    def test_otp_login_request_within_cooldown(self, send_code_email):
+        query = """mutation ($email: String!) {
+            otpLoginRequest(email: $email) { success redirectUrl messages }
+        }"""
+        first, second = (
+            test_utils.execute_graphql(self.url, query, {"email": self.user.email})[
+                "data"
+            ]["otpLoginRequest"]
+            for _ in range(2)
+        )
+        # Both go on to enter the code, only the first one is new
+        self.assertTrue(first["success"] and second["success"])
+        self.assertEqual(first["redirectUrl"], second["redirectUrl"])
+        self.assertNotEqual(first["messages"], second["messages"])
+        send_code_email.delay.assert_called_once()
+        code = send_code_email.delay.call_args.args[2]
+        self.assertTrue(check_verification_code(self.user.email, code))
+
+
+@override_settings(
+    LOGIN_THROTTLE_USERNAME_LIMIT=3,
+    LOGIN_THROTTLE_IP_LIMIT=5,
+    LOGIN_THROTTLE_LOCKOUT=30,
+    LOGIN_THROTTLE_MAX_LOCKOUT=100,
+)
+class LoginThrottleTests(SimpleTestCase):
+    ip = "192.0.2.10"
+
+    def setUp(self):
+        for kind, identifier in (("ip", self.ip), ("username", "a"), ("username", "b")):
+            unlock_login(kind, identifier)
+            self.addCleanup(unlock_login, kind, identifier)
+
+    def test_username_lockout_backs_off(self):
+        for _ in range(2):
+            self.assertEqual(record_login_failure("a", self.ip), 0)
+        self.assertEqual(login_retry_after("a", self.ip), 0)
+        self.assertEqual(record_login_failure("a", self.ip), 30)
+        self.assertAlmostEqual(login_retry_after("a", self.ip), 30, delta=1)
+        self.assertEqual(login_retry_after("b", "192.0.2.11"), 0)
+
+        # The next lockouts double up to the maximum
+        for duration in (60, 100):
+            record_login_failure("a", "192.0.2.11")
+            record_login_failure("a", "192.0.2.12")
+            self.assertEqual(record_login_failure("a", "192.0.2.13"), duration)
+        for ip in ("192.0.2.11", "192.0.2.12", "192.0.2.13"):
+            unlock_login("ip", ip)
+
+        lockouts = {
+            (lockout["kind"], lockout["identifier"]): lockout
+            for lockout in get_login_lockouts()
+        }
+        self.assertEqual(lockouts[("username", "a")]["level"], 3)
+
+    def test_ip_lockout(self):
+        for i in range(4):
+            self.assertEqual(record_login_failure(f"user{i}", self.ip), 0)
+        self.assertEqual(record_login_failure("b", self.ip), 30)
+        self.assertGreater(login_retry_after("someone", self.ip), 0)
+        for i in range(4):
+            unlock_login("username", f"user{i}")
+
+    def test_ended_lockouts_are_pruned(self):
+        get_redis().zadd(LOGIN_LOCKOUTS_KEY, {"username:ended": 1})
+        record_login_failure("a", self.ip)
+        self.assertIsNone(get_redis().zscore(LOGIN_LOCKOUTS_KEY, "username:ended"))
+
+    def test_success_forgets_username_failures(self):
+        for _ in range(2):
+            record_login_failure("a", self.ip)
+        record_login_success("a")
+        for _ in range(2):
+            self.assertEqual(record_login_failure("a", self.ip), 0)
+
+
+class TokenRevocationTests(SimpleTestCase):
+    def revoke(self, token, exp):
+        digest = token_digest(token)
+        self.addCleanup(get_redis().delete, f"{REVOKED_TOKEN_PREFIX}{digest}")
+        self.addCleanup(get_redis().zrem, REVOKED_TOKENS_INDEX, digest)
+        return revoke_token(token, exp)
+
+    def test_token_is_revoked_until_it_expires(self):
+        token = uuid.uuid4().hex
+        self.assertTrue(self.revoke(token, time.time() + 60))
+        self.assertTrue(is_token_revoked(token))
+        self.assertTrue(is_token_revoked(f"Bearer {token}"))
+        self.assertFalse(is_token_revoked(uuid.uuid4().hex))
+
+        expired = uuid.uuid4().hex
+        self.assertFalse(self.revoke(expired, time.time() - 1))
+        self.assertFalse(is_token_revoked(expired))
+
+    @override_settings(REVOKED_TOKENS_BLOOM_FILTER=True)
+    def test_bloom_filter_sees_tokens_revoked_by_this_worker(self):
+        token_revocation.get_bloom_filter()
+        token = uuid.uuid4().hex
+        self.revoke(token, time.time() + 60)
+        self.assertIn(token_digest(token), token_revocation.get_bloom_filter())
+        self.assertTrue(is_token_revoked(token))
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom_filter = BloomFilter(100, 0.01)
+        digests = [token_digest(str(i)) for i in range(100)]
+        for digest in digests[:50]:
+            bloom_filter.add(digest)
+        self.assertTrue(all(digest in bloom_filter for digest in digests[:50]))
+        self.assertLess(sum(digest in bloom_filter for digest in digests[50:]), 5)
+
+
+class AuthContextTests(TestCase):
+    url = "/api/users/graphql/"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = test_utils.SeedData()
+
+    def execute(self, query, token):
+        return test_utils.execute_graphql(
+            self.url, query, HTTP_AUTHORIZATION=f"Bearer {token}"
+        )
+
+    def test_user_is_loaded_once_per_request(self):
+        token = get_token(self.data.customer)
+        with CaptureQueriesContext(connection) as queries:
+            result = self.execute(
+                "{ currentUser { username } addresses { title } }", token
+            )
+        self.assertEqual(result["data"]["currentUser"], {"username": "customer"})
+        self.assertEqual(len(result["data"]["addresses"]), 3)
+        user_queries = [
+            query["sql"] for query in queries if 'FROM "users_user"' in query["sql"]
+        ]
+        self.assertEqual(len(user_queries), 1)
+
+    def test_business_is_loaded_with_the_user(self):
+        token = get_token(self.data.business_user)
+        with CaptureQueriesContext(connection) as queries:
+            result = self.execute("{ currentUser { business { name } } }", token)
+        self.assertEqual(result["data"]["currentUser"], {"business": {"name": "شرکت"}})
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"users_business"', queries[0]["sql"])
+
+    def test_revoked_token_is_anonymous(self):
+        token = get_token(test_utils.create_user("revoked"))
+        digest = token_digest(token)
+        self.addCleanup(get_redis().delete, f"{REVOKED_TOKEN_PREFIX}{digest}")
+        self.addCleanup(get_redis().zrem, REVOKED_TOKENS_INDEX, digest)
+
+        result = self.execute("mutation { logout { success } }", token)
+        self.assertTrue(result["data"]["logout"]["success"])
+        result = self.execute("{ currentUser { username } }", token)
+        self.assertEqual(
+            result["errors"][0]["message"], "شما وارد حساب کاربری خود نشده اید"
+        )
+
+    def test_invalid_token_fails(self):
+        result = self.execute("{ provinces { name } }", "not-a-token")
+        self.assertIn("errors", result)
+
+
+class UsersQueryBudgetTests(test_utils.GraphQLBudgetTestCase):
+    url = "/api/users/graphql/"
+    schema = schema
+
+    user_data = {
+        "username": "new_user",
+        "firstName": "نام",
+        "lastName": "نام خانوادگی",
+        "password1": "Password_1",
+        "password2": "Password_1",
+        "phoneNumber": "+989121234567",
+        "landlineNumber": "+982112345678",
+        "email": "new_user@example.com",
+        "birthdate": "1990-01-01",
+    }
+    business_data = {
+        "name": "شرکت جدید",
+        "ownerFirstName": "نام",
+        "ownerLastName": "نام خانوادگی",
+        "ownerPhoneNumber": "+989120000001",
+    }
+
+    def setUp(self):
+        # Verification emails go through Redis and Celery
+        patcher = mock.patch("users.schema.send_email")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_current_user(self):
+        self.execute(
+            "{ currentUser { username business { name } addresses { title } } }",
+            user=self.data.business_user,
+        )
+
+    def test_addresses(self):
+        self.execute(
+            "{ addresses { title province { name } city { name } } }",
+            user=self.data.customer,
+        )
+
+    def test_address(self):
+        self.execute(
+            "query ($id: String!) { address(id: $id) { title city { name } } }",
+            {"id": str(self.data.addresses[0].id)},
+            user=self.data.customer,
+        )
+
+    def test_create_user(self):
+        data = self.execute(
+            """mutation ($user: UserInput!, $business: BusinessInput) {
+                createUser(userData: $user, businessData: $business) { success }
+            }""",
+            {"user": self.user_data, "business": self.business_data},
+        )
+        self.assertTrue(data["createUser"]["success"])
+        self.assertTrue(User.objects.filter(business__name="شرکت جدید").exists())
+
+    def test_create_business(self):
+        data = self.execute(
+            """mutation ($business: BusinessInput!) {
+                createBusiness(businessData: $business) { success }
+            }""",
+            {"business": self.business_data},
+            user=self.data.customer,
+        )
+        self.assertTrue(data["createBusiness"]["success"])
+
+    def test_create_address(self):
+        data = self.execute(
+            """mutation ($input: AddressInput!) {
+                createAddress(input: $input) { success address { title } }
+            }""",
+            {
+                "input": {
+                    "title": "خانه",
+                    "province": self.data.provinces[0].name,
+                    "city": self.data.cities[0].name,
+                    "address": "خیابان دوم",
+                    "postalCode": "1234567890",
+                }
+            },
+            user=self.data.customer,
+        )
+        self.assertTrue(data["createAddress"]["success"])
+
+    def test_create_address_city_of_another_province(self):
+        data = self.execute(
+            """mutation ($input: AddressInput!) {
+                createAddress(input: $input) { success errors }
+            }""",
+            {
+                "input": {
+                    "title": "خانه",
+                    "province": self.data.provinces[0].name,
+                    "city": self.data.cities[2].name,
+                    "address": "خیابان دوم",
+                    "postalCode": "1234567890",
+                }
+            },
+            user=self.data.customer,
+        )
+        self.assertFalse(data["createAddress"]["success"])
+        self.assertIn("city", data["createAddress"]["errors"])
+
+    def test_update_user(self):
+        data = self.execute(
+            """mutation ($user: UpdateUserInput, $business: UpdateBusinessInput) {
+                updateUser(userData: $user, businessData: $business) { success }
+            }""",
+            {"user": {"firstName": "نام دیگر"}, "business": {"name": "شرکت دیگر"}},
+            user=self.data.business_user,
+        )
+        self.assertTrue(data["updateUser"]["success"])
+
+    def test_update_address(self):
+        data = self.execute(
+            """mutation ($input: UpdateAddressInput!) {
+                updateAddress(input: $input) { success }
+            }""",
+            {
+                "input": {
+                    "id": self.data.addresses[0].id,
+                    "title": "محل کار",
+                    "city": self.data.cities[1].name,
+                }
+            },
+            user=self.data.customer,
+        )
+        self.assertTrue(data["updateAddress"]["success"])
+
+    def test_update_address_province(self):
+        # The current city of the address is not in the new province
+        data = self.execute(
+            """mutation ($input: UpdateAddressInput!) {
+                updateAddress(input: $input) { success errors }
+            }""",
+            {
+                "input": {
+                    "id": self.data.addresses[0].id,
+                    "province": self.data.provinces[1].name,
+                }
+            },
+            user=self.data.customer,
+        )
+        self.assertFalse(data["updateAddress"]["success"])
+        self.assertIn("city", data["updateAddress"]["errors"])
+
+        data = self.execute(
+            """mutation ($input: UpdateAddressInput!) {
+                updateAddress(input: $input) { success address { city { name } } }
+            }""",
+            {
+                "input": {
+                    "id": self.data.addresses[0].id,
+                    "province": self.data.provinces[1].name,
+                    "city": self.data.cities[2].name,
+                }
+            },
+            user=self.data.customer,
+        )
+        self.assertEqual(
+            data["updateAddress"]["address"]["city"]["name"], self.data.cities[2].name
+        )
+
+    def test_delete_address(self):
+        address = Address.objects.create(
+            user=self.data.customer,
+            title="موقت",
+            province=self.data.provinces[0],
+            city=self.data.cities[0],
+            address="خیابان سوم",
+            postal_code="1234567890",
+        )
+        data = self.execute(
+            "mutation ($id: ID!) { deleteAddress(addressId: $id) { success } }",
+            {"id": address.id},
+            user=self.data.customer,
+        )
+        self.assertTrue(data["deleteAddress"]["success"])
+
+    def test_login(self):
+        data = self.execute("""mutation {
+                login(username: "customer", password: "password") { success token }
+            }""")
+        self.assertTrue(data["login"]["success"])
+
+    @override_settings(LOGIN_THROTTLE_USERNAME_LIMIT=2)
+    def test_login_lockout(self):
+        self.addCleanup(unlock_login, "username", "customer")
+        self.addCleanup(unlock_login, "ip", "192.0.2.20")
+        query = """mutation ($password: String!) {
+            login(username: "customer", password: $password) {
+                success token retryAfter
+            }
+        }"""
+        data = self.execute(query, {"password": "wrong"}, REMOTE_ADDR="192.0.2.20")
+        self.assertIsNone(data["login"]["retryAfter"])
+        data = self.execute(query, {"password": "wrong"}, REMOTE_ADDR="192.0.2.20")
+        self.assertEqual(data["login"]["retryAfter"], settings.LOGIN_THROTTLE_LOCKOUT)
+
+        # Rejected without checking the password
+        with mock.patch("users.schema.authenticate") as authenticate:
+            data = self.execute(
+                query, {"password": "password"}, REMOTE_ADDR="192.0.2.20"
+            )
+        authenticate.assert_not_called()
+        self.assertFalse(data["login"]["success"])
+        self.assertIsNone(data["login"]["token"])
+        self.assertGreater(data["login"]["retryAfter"], 0)
+
+    def test_otp_login_request(self):
+        data = self.execute("""mutation {
+                otpLoginRequest(email: "customer@example.com") { success }
+            }""")
+        self.assertTrue(data["otpLoginRequest"]["success"])
+
+    def test_otp_login(self):
+        get_redis().delete(verification_code_key("customer@example.com"))
+        code = issue_verification_code("customer@example.com", "otp")
+        data = self.execute(
+            "mutation ($code: String!) { otpLogin(code: $code) { success } }",
+            {"code": code},
+            HTTP_EMAIL="customer@example.com",
+        )
+        self.assertTrue(data["otpLogin"]["success"])
+
+    def test_verify_email(self):
+        get_redis().delete(verification_code_key("customer@example.com"))
+        code = issue_verification_code("customer@example.com", "verification")
+        data = self.execute(
+            "mutation ($code: String!) { verifyEmail(code: $code) { success } }",
+            {"code": code},
+            HTTP_EMAIL="customer@example.com",
+        )
+        self.assertTrue(data["verifyEmail"]["success"])
+
+    def test_resend_email(self):
+        data = self.execute(
+            'mutation { resendEmail(emailType: "verification") { success } }',
+            HTTP_EMAIL="customer@example.com",
+        )
+        self.assertTrue(data["resendEmail"]["success"])
+
+    def test_logout(self):
+        # The token is revoked, keep it away from the other tests
+        user = test_utils.create_user("leaving")
+        data = self.execute("mutation { logout { success } }", user=user)
+        self.assertTrue(data["logout"]["success"])
+
+    def test_provinces(self):
+        data = self.execute("{ provinces { id name } }")
+        self.assertEqual(
+            [province["name"] for province in data["provinces"]],
+            [province.name for province in self.data.provinces],
+        )
+
+    def test_cities_by_province(self):
+        data = self.execute(
+            "query ($id: ID!) { citiesByProvince(province: $id) { name provinceId } }",
+            {"id": self.data.provinces[1].id},
+        )
+        self.assertEqual(
+            [city["name"] for city in data["citiesByProvince"]],
+            [city.name for city in self.data.cities[2:]],
+        )
+
+    def test_provinces_etag(self):
+        params = {
+            "query": "query ($id: ID!) { citiesByProvince(province: $id) { name } }",
+            "variables": json.dumps({"id": self.data.provinces[0].id}),
+        }
+        response = Client().get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        with self.assertNumQueries(0):
+            response = Client().get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        params["variables"] = json.dumps({"id": self.data.provinces[1].id})
+        response = Client().get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
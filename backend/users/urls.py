@@ -1,13 +1,19 @@
 from django.urls import path
 from django.views.decorators.csrf import csrf_exempt
-from graphene_django.views import GraphQLView
 from graphql_jwt.decorators import jwt_cookie
+from utils.graphql_view import CachedGraphQLView
 from users.schema import schema
 
 urlpatterns = [
     path(
         "graphql/",
-        jwt_cookie(csrf_exempt(GraphQLView.as_view(graphiql=False,schema=schema))),
+        jwt_cookie(
+            csrf_exempt(
+                CachedGraphQLView.as_view(
+                    graphiql=False, schema=schema, endpoint="users"
+                )
+            )
+        ),
         name="graphql",
     ),
 ]
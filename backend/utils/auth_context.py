@@ -0,0 +1,79 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.settings import jwt_settings
+from graphql_jwt.utils import get_http_authorization, get_payload
+from utils.token_revocation import is_token_revoked
+
+
+def get_user_by_payload(payload):
+    """
+    Like graphql_jwt's, but loads the business along with the user so that
+    is_business() and the business rank cost no further queries.
+    """
+    username = jwt_settings.JWT_PAYLOAD_GET_USERNAME_HANDLER(payload)
+    if not username:
+        raise JSONWebTokenError("Invalid payload")
+
+    User = get_user_model()
+    user = (
+        User._default_manager.select_related("business")
+        .filter(**{User.USERNAME_FIELD: username})
+        .first()
+    )
+    if user is not None and not user.is_active:
+        raise JSONWebTokenError("User is disabled")
+    return user
+
+
+class AuthContext:
+    """
+    Authentication state of one request: the token is decoded, checked
+    against the revoked tokens and resolved to its user once, then shared by
+    the graphene middleware, the auth decorators and the resolvers.
+    """
+
+    def __init__(self, request):
+        self.token = get_http_authorization(request)
+        self.payload = None
+        self.revoked = False
+        self.error = None
+        self.user = AnonymousUser()
+
+        if not self.token:
+            return
+        try:
+            self.payload = get_payload(self.token, request)
+            self.revoked = is_token_revoked(self.token)
+            if not self.revoked:
+                self.user = get_user_by_payload(self.payload) or AnonymousUser()
+        except JSONWebTokenError as e:
+            self.error = e
+
+    @property
+    def is_valid(self):
+        return self.error is None and not self.revoked
+
+
+def get_auth_context(request):
+    auth_context = getattr(request, "auth_context", None)
+    if auth_context is None:
+        auth_context = AuthContext(request)
+        request.auth_context = auth_context
+    return auth_context
+
+
+class AuthContextMiddleware:
+    """
+    Graphene middleware replacing graphql_jwt's JSONWebTokenMiddleware, which
+    authenticates again for every root field. Revoked tokens resolve to an
+    anonymous user, invalid or expired ones fail the root fields as before.
+    """
+
+    def resolve(self, next, root, info, **kwargs):
+        if info.path.prev is None:
+            auth_context = get_auth_context(info.context)
+            if auth_context.error is not None:
+                raise auth_context.error
+            info.context.user = auth_context.user
+        return next(root, info, **kwargs)
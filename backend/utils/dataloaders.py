@@ -0,0 +1,97 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Manager, prefetch_related_objects
+
+
+class RelationLoader:
+    """
+    Batches one relation (forward FK, reverse FK or one-to-one) of one model.
+    The first lookup loads the relation for the instance and all its siblings
+    with a single IN (...) query.
+    """
+
+    def __init__(self, loaders, model, relation):
+        self.loaders = loaders
+        self.model = model
+        self.relation = relation
+        self.loaded = set()
+
+    def load(self, instance):
+        if id(instance) not in self.loaded:
+            batch = [
+                obj
+                for obj in self.loaders.siblings(instance)
+                if id(obj) not in self.loaded
+            ]
+            prefetch_related_objects(batch, self.relation)
+            self.loaded.update(id(obj) for obj in batch)
+            self.loaders.register(
+                [related for obj in batch for related in self.related_list(obj)]
+            )
+        return self.value(instance)
+
+    def value(self, instance):
+        try:
+            value = getattr(instance, self.relation)
+        except ObjectDoesNotExist:
+            return None
+        if isinstance(value, Manager):
+            return list(value.all())
+        return value
+
+    def related_list(self, instance):
+        value = self.value(instance)
+        if value is None:
+            return []
+        if isinstance(value, list):
+            return value
+        return [value]
+
+
+class Loaders:
+    """
+    Per-request registry of the sibling groups handed to graphene (a page of
+    results, or everything one batch loaded) and of the relation loaders
+    built on top of them.
+    """
+
+    def __init__(self):
+        self.groups = {}
+        self.relations = {}
+
+    def register(self, instances):
+        # Instances are tracked by identity: the same row may be loaded with
+        # different columns by different parts of the query.
+        instances = list(instances)
+        for instance in instances:
+            self.groups.setdefault(id(instance), instances)
+        return instances
+
+    def siblings(self, instance):
+        return self.groups.get(id(instance)) or self.register([instance])
+
+    def relation(self, model, relation):
+        key = (model, relation)
+        if key not in self.relations:
+            self.relations[key] = RelationLoader(self, model, relation)
+        return self.relations[key]
+
+
+def get_loaders(info):
+    context = info.context
+    loaders = getattr(context, "loaders", None)
+    if loaders is None:
+        loaders = Loaders()
+        context.loaders = loaders
+    return loaders
+
+
+def register(info, instances):
+    """
+    Mark instances returned by a top level resolver as siblings so that their
+    relations are loaded together.
+    """
+    return get_loaders(info).register(instances)
+
+
+def load_related(info, instance, relation):
+    return get_loaders(info).relation(type(instance), relation).load(instance)
@@ -1,20 +1,105 @@
-# utils.py
-import random
+import secrets
 import string
-import redis
-from django.utils import timezone
+from django.conf import settings
+from utils.redis_pool import get_redis
 
-r = redis.StrictRedis(host="redis", port=6379, db=0)
+VERIFICATION_CODE_PREFIX = "verification_code_"
+VERIFICATION_EMAIL_COUNTERS_KEY = "verification_email_sends"
 
+# The value is "<code>:<failed attempts>". A right code is consumed, a wrong
+# one counts an attempt and the code is dropped after the last allowed one.
+CHECK_CODE_SCRIPT = """
+local value = redis.call('GET', KEYS[1])
+if not value then
+    return 0
+end
+local separator = string.find(value, ':', 1, true)
+local code = string.sub(value, 1, separator - 1)
+if code == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+local attempts = tonumber(string.sub(value, separator + 1)) + 1
+if attempts >= tonumber(ARGV[2]) then
+    redis.call('DEL', KEYS[1])
+else
+    redis.call('SET', KEYS[1], code .. ':' .. attempts, 'KEEPTTL')
+end
+return 0
+"""
 
-def generate_verification_code(user_email):
-    if r.get(f"verification_code_{user_email}"):
-        r.delete(f"verification_code_{user_email}")
-    code = "".join(random.choices(string.digits, k=6))
-    expiry_time = timezone.now() + timezone.timedelta(
-        minutes=5
-    )  # Code is valid for 5 minutes
-    r.set(f"verification_code_{user_email}", code)
-    r.expireat(f"verification_code_{user_email}", expiry_time)
+# A code issued less than the cooldown ago (its remaining lifetime is above
+# ARGV[3] milliseconds) is reused and nothing is sent, otherwise a new one is
+# stored. Either way the outcome is counted per template in one hash.
+ISSUE_CODE_SCRIPT = """
+local ttl = redis.call('PTTL', KEYS[1])
+if ttl > tonumber(ARGV[3]) then
+    redis.call('HINCRBY', KEYS[2], ARGV[4] .. ':suppressed', 1)
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1] .. ':0', 'EX', ARGV[2])
+redis.call('HINCRBY', KEYS[2], ARGV[4] .. ':sent', 1)
+return 1
+"""
 
-    return code
+check_code_script = None
+issue_code_script = None
+
+
+def verification_code_key(email):
+    return f"{VERIFICATION_CODE_PREFIX}{email}"
+
+
+def new_code():
+    return "".join(secrets.choice(string.digits) for _ in range(6))
+
+
+def issue_verification_code(email, template):
+    """
+    Code to email to the address, or None when one was issued less than
+    VERIFICATION_EMAIL_COOLDOWN seconds ago: that email is on its way and
+    its code is still valid, so no other is sent. A new code replaces the
+    previous one and its failed attempts, valid for
+    VERIFICATION_CODE_TIMEOUT seconds.
+    """
+    global issue_code_script
+    if issue_code_script is None:
+        issue_code_script = get_redis().register_script(ISSUE_CODE_SCRIPT)
+    code = new_code()
+    timeout = settings.VERIFICATION_CODE_TIMEOUT
+    cooldown = min(settings.VERIFICATION_EMAIL_COOLDOWN, timeout)
+    issued = issue_code_script(
+        keys=[verification_code_key(email), VERIFICATION_EMAIL_COUNTERS_KEY],
+        args=[code, timeout, (timeout - cooldown) * 1000, template],
+        client=get_redis(),
+    )
+    return code if issued else None
+
+
+def get_email_send_report():
+    """Emails sent and suppressed by the cooldown, by template."""
+    report = {}
+    for field, count in get_redis().hgetall(VERIFICATION_EMAIL_COUNTERS_KEY).items():
+        template, _, outcome = field.decode().rpartition(":")
+        report.setdefault(template, {"sent": 0, "suppressed": 0})[outcome] = int(count)
+    return report
+
+
+def check_verification_code(email, code):
+    """
+    Whether code is the current code of the email, consuming it if so. One
+    round trip: the comparison, the consumption and the attempt counting
+    run in a single script.
+    """
+    global check_code_script
+    if check_code_script is None:
+        check_code_script = get_redis().register_script(CHECK_CODE_SCRIPT)
+    if not code or ":" in code:
+        return False
+    return bool(
+        check_code_script(
+            keys=[verification_code_key(email)],
+            args=[code, settings.VERIFICATION_CODE_MAX_ATTEMPTS],
+            client=get_redis(),
+        )
+    )
@@ -0,0 +1,144 @@
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from graphql import (
+    FieldNode,
+    FragmentSpreadNode,
+    GraphQLList,
+    GraphQLObjectType,
+    InlineFragmentNode,
+    OperationType,
+    get_named_type,
+    get_nullable_type,
+    value_from_ast_untyped,
+)
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE_ARGUMENTS = ("perPage", "first")
+COST_BUCKETS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def get_page_size(field_node, variables):
+    for argument in field_node.arguments:
+        if argument.name.value in PAGE_SIZE_ARGUMENTS:
+            value = value_from_ast_untyped(argument.value, variables)
+            if isinstance(value, int):
+                return max(value, 0)
+    return None
+
+
+def selection_cost(schema, parent_type, selection_set, fragments, variables, page_size):
+    """
+    Every object field weighs 1 and scalars are free. A list multiplies the
+    cost of its items by the page size argument of its parent field or, when
+    there is none, by GRAPHQL_DEFAULT_LIST_SIZE.
+    """
+    cost = 0
+    for selection in selection_set.selections:
+        if isinstance(selection, InlineFragmentNode):
+            fragment_type = parent_type
+            if selection.type_condition:
+                fragment_type = schema.get_type(selection.type_condition.name.value)
+            cost += selection_cost(
+                schema,
+                fragment_type,
+                selection.selection_set,
+                fragments,
+                variables,
+                page_size,
+            )
+            continue
+
+        if isinstance(selection, FragmentSpreadNode):
+            fragment = fragments.get(selection.name.value)
+            if fragment is None:
+                continue
+            cost += selection_cost(
+                schema,
+                schema.get_type(fragment.type_condition.name.value),
+                fragment.selection_set,
+                fragments,
+                variables,
+                page_size,
+            )
+            continue
+
+        if not isinstance(selection, FieldNode) or selection.selection_set is None:
+            continue
+        field = getattr(parent_type, "fields", {}).get(selection.name.value)
+        if field is None:
+            continue
+
+        field_type = get_nullable_type(field.type)
+        named_type = get_named_type(field_type)
+        if isinstance(field_type, GraphQLList):
+            multiplier = (
+                page_size
+                if page_size is not None
+                else settings.GRAPHQL_DEFAULT_LIST_SIZE
+            )
+        else:
+            multiplier = 1
+
+        children = 0
+        if isinstance(named_type, GraphQLObjectType):
+            children = selection_cost(
+                schema,
+                named_type,
+                selection.selection_set,
+                fragments,
+                variables,
+                get_page_size(selection, variables),
+            )
+        cost += multiplier * (1 + children)
+    return cost
+
+
+def operation_cost(schema, document, operation_name, variables):
+    fragments = {}
+    operation = None
+    for definition in document.definitions:
+        if definition.kind == "fragment_definition":
+            fragments[definition.name.value] = definition
+        elif definition.kind == "operation_definition":
+            name = definition.name.value if definition.name else None
+            if operation is None or name == operation_name:
+                operation = definition
+    if operation is None:
+        return 0
+
+    root_type = (
+        schema.mutation_type
+        if operation.operation == OperationType.MUTATION
+        else schema.query_type
+    )
+    return selection_cost(
+        schema, root_type, operation.selection_set, fragments, variables or {}, None
+    )
+
+
+def record_cost(endpoint, cost, limit):
+    bucket = next((bound for bound in COST_BUCKETS if cost <= bound), "inf")
+    keys = [f"graphql_cost_{endpoint}_{bucket}"]
+    if cost > limit:
+        keys.append(f"graphql_cost_{endpoint}_rejected")
+        logger.warning(
+            f"Rejected GraphQL operation on {endpoint}: cost {cost} > {limit}"
+        )
+    try:
+        for key in keys:
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, 1, timeout=None)
+    except Exception as e:
+        # Metrics must never fail the request
+        logger.error(f"Could not record GraphQL cost on {endpoint}: {e}")
+
+
+def get_cost_report(endpoint):
+    keys = [f"graphql_cost_{endpoint}_{bound}" for bound in COST_BUCKETS]
+    keys += [f"graphql_cost_{endpoint}_inf", f"graphql_cost_{endpoint}_rejected"]
+    values = cache.get_many(keys)
+    return {key.rsplit("_", 1)[1]: values.get(key, 0) for key in keys}
@@ -0,0 +1,41 @@
+import hashlib
+import json
+from graphene.utils.str_converters import to_snake_case
+from graphql import FragmentDefinitionNode, OperationType, get_operation_ast
+from utils.query_budget import root_field_names
+
+
+def operation_etag(schema, document, key, operation_name, variables):
+    """
+    ETag of a query whose root fields all have an entry in the etags of the
+    Query class: a callable returning a version that changes whenever the
+    data of the field does. None for any other operation, which is then
+    served without one.
+    """
+    operation_ast = get_operation_ast(document, operation_name)
+    if operation_ast is None or operation_ast.operation != OperationType.QUERY:
+        return None
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions
+        if isinstance(definition, FragmentDefinitionNode)
+    }
+    etags = getattr(schema.query, "etags", {})
+    versions = []
+    for name in root_field_names(operation_ast.selection_set, fragments):
+        version = etags.get(to_snake_case(name))
+        if version is None:
+            return None
+        versions.append(version())
+
+    digest = hashlib.sha256(
+        "|".join(
+            [
+                key,
+                operation_name or "",
+                json.dumps(variables, sort_keys=True, default=str),
+                *versions,
+            ]
+        ).encode("utf-8")
+    ).hexdigest()
+    return f'"{digest}"'
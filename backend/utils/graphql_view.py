@@ -0,0 +1,292 @@
+import hashlib
+import json
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.http import HttpResponseNotAllowed
+from django.http.response import HttpResponseBadRequest
+from django.utils.cache import get_conditional_response, patch_cache_control
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.views import GraphQLView, HttpError
+from graphql import (
+    ExecutionResult,
+    OperationType,
+    execute,
+    get_operation_ast,
+    parse,
+    validate_schema,
+)
+from graphql.error import GraphQLError
+from graphql.validation import validate
+from utils.graphql_cost import operation_cost, record_cost
+from utils.graphql_etag import operation_etag
+from utils.query_budget import operation_budget, query_budget
+
+PERSISTED_QUERY_PREFIX = "persisted_query_"
+
+
+class DocumentCache:
+    """
+    LRU of parsed and validated documents of one schema, keyed by the sha256
+    of the query text (the same hash persisted queries are sent with).
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def set(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+
+document_caches = {}
+
+
+def get_document_cache(schema):
+    if schema not in document_caches:
+        document_caches[schema] = DocumentCache(settings.GRAPHQL_DOCUMENT_CACHE_SIZE)
+    return document_caches[schema]
+
+
+def hash_query(query):
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+def get_persisted_query(sha256_hash):
+    return cache.get(f"{PERSISTED_QUERY_PREFIX}{sha256_hash}")
+
+
+def register_persisted_query(query, timeout=None):
+    """
+    Store query under its hash. Queries registered by clients expire after
+    GRAPHQL_PERSISTED_QUERY_TIMEOUT, only the management command keeps them.
+    """
+    sha256_hash = hash_query(query)
+    cache.set(f"{PERSISTED_QUERY_PREFIX}{sha256_hash}", query, timeout=timeout)
+    return sha256_hash
+
+
+def get_persisted_hash(request, data):
+    extensions = request.GET.get("extensions") or data.get("extensions")
+    if not extensions:
+        return None
+    if isinstance(extensions, str):
+        try:
+            extensions = json.loads(extensions)
+        except ValueError:
+            raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+    if not isinstance(extensions, dict):
+        raise HttpError(HttpResponseBadRequest("Extensions must be an object."))
+    persisted_query = extensions.get("persistedQuery") or {}
+    if not isinstance(persisted_query, dict):
+        raise HttpError(HttpResponseBadRequest("persistedQuery must be an object."))
+    return persisted_query.get("sha256Hash")
+
+
+def persisted_query_error(message):
+    return ExecutionResult(
+        data=None, errors=[GraphQLError(message, extensions={"code": message})]
+    )
+
+
+class CachedGraphQLView(GraphQLView):
+    """
+    GraphQLView that parses and validates each distinct document once per
+    worker and supports Automatic Persisted Queries. With
+    GRAPHQL_PERSISTED_QUERIES_ONLY only registered hashes are executed.
+    When an endpoint name is given, operations costing more than its entry in
+    GRAPHQL_COST_LIMITS are rejected before execution. The SQL queries of
+    each operation are checked against the budgets declared by the schema,
+    see utils.query_budget. GET queries of fields declaring a version get an
+    ETag and are answered with 304 Not Modified before execution when the
+    client already has it, see utils.graphql_etag.
+    """
+
+    endpoint = None
+
+    def __init__(self, endpoint=None, **kwargs):
+        super().__init__(**kwargs)
+        self.endpoint = endpoint or self.endpoint
+
+    def get_etag(self, request):
+        try:
+            data = self.parse_body(request)
+            query, variables, operation_name, _ = self.get_graphql_params(request, data)
+        except HttpError:
+            return None
+        sha256_hash = get_persisted_hash(request, data)
+        if not query and not sha256_hash:
+            return None
+
+        entry, error_result = self.get_document(request, data, query)
+        if error_result is not None or entry[1]:
+            return None
+        return operation_etag(
+            self.schema,
+            entry[0],
+            sha256_hash or hash_query(query),
+            operation_name,
+            variables,
+        )
+
+    def dispatch(self, request, *args, **kwargs):
+        etag = None
+        if request.method.lower() == "get" and not self.batch:
+            etag = self.get_etag(request)
+            if etag is not None:
+                not_modified = get_conditional_response(request, etag=etag)
+                if not_modified is not None:
+                    return not_modified
+
+        response = super().dispatch(request, *args, **kwargs)
+        if etag is not None and response.status_code == 200:
+            response["ETag"] = etag
+            patch_cache_control(response, no_cache=True)
+        return response
+
+    def get_document(self, request, data, query):
+        sha256_hash = get_persisted_hash(request, data)
+        if query and sha256_hash and hash_query(query) != sha256_hash:
+            return None, persisted_query_error("PersistedQueryHashMismatch")
+
+        key = sha256_hash or hash_query(query)
+        document_cache = get_document_cache(self.schema)
+        entry = document_cache.get(key)
+        if entry is not None:
+            return entry, None
+
+        registered = False
+        if settings.GRAPHQL_PERSISTED_QUERIES_ONLY or not query:
+            persisted_query = get_persisted_query(key)
+            if persisted_query is None:
+                if query:
+                    return None, persisted_query_error("PersistedQueryNotAllowed")
+                return None, persisted_query_error("PersistedQueryNotFound")
+            query = persisted_query
+            registered = True
+
+        try:
+            document = parse(query)
+        except Exception as e:
+            return None, ExecutionResult(errors=[e])
+
+        validation_errors = validate(
+            self.schema.graphql_schema,
+            document,
+            self.validation_rules,
+            graphene_settings.MAX_VALIDATION_ERRORS,
+        )
+        if sha256_hash and not registered and not validation_errors:
+            register_persisted_query(
+                query, timeout=settings.GRAPHQL_PERSISTED_QUERY_TIMEOUT
+            )
+
+        entry = (document, validation_errors)
+        document_cache.set(key, entry)
+        return entry, None
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        if not query and not get_persisted_hash(request, data):
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        schema = self.schema.graphql_schema
+
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return ExecutionResult(data=None, errors=schema_validation_errors)
+
+        entry, error_result = self.get_document(request, data, query)
+        if error_result is not None:
+            return error_result
+        document, validation_errors = entry
+
+        operation_ast = get_operation_ast(document, operation_name)
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None
+
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        if validation_errors:
+            return ExecutionResult(data=None, errors=validation_errors)
+
+        if self.endpoint:
+            limit = settings.GRAPHQL_COST_LIMITS[self.endpoint]
+            cost = operation_cost(schema, document, operation_name, variables)
+            record_cost(self.endpoint, cost, limit)
+            if cost > limit:
+                return ExecutionResult(
+                    data=None,
+                    errors=[
+                        GraphQLError(
+                            "درخواست شما بیش از حد سنگین است",
+                            extensions={
+                                "code": "QueryTooExpensive",
+                                "cost": cost,
+                                "limit": limit,
+                            },
+                        )
+                    ],
+                )
+
+        budget, fields = operation_budget(self.schema, document, operation_name)
+        label = f"{self.endpoint or 'graphql'} {', '.join(fields)}"
+        with query_budget(budget, label):
+            try:
+                execute_options = {
+                    "root_value": self.get_root_value(request),
+                    "context_value": self.get_context(request),
+                    "variable_values": variables,
+                    "operation_name": operation_name,
+                    "middleware": self.get_middleware(request),
+                }
+                if self.execution_context_class:
+                    execute_options["execution_context_class"] = (
+                        self.execution_context_class
+                    )
+
+                if (
+                    operation_ast is not None
+                    and operation_ast.operation == OperationType.MUTATION
+                    and (
+                        graphene_settings.ATOMIC_MUTATIONS is True
+                        or connection.settings_dict.get("ATOMIC_MUTATIONS", False)
+                        is True
+                    )
+                ):
+                    with transaction.atomic():
+                        result = execute(schema, document, **execute_options)
+                        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                            transaction.set_rollback(True)
+                    return result
+
+                return execute(schema, document, **execute_options)
+            except Exception as e:
+                return ExecutionResult(errors=[e])
@@ -0,0 +1,153 @@
+import time
+import uuid
+from datetime import datetime, timezone
+from django.conf import settings
+from utils.redis_pool import get_redis
+
+LOGIN_FAILURES_PREFIX = "login_failures_"
+LOGIN_LOCKOUT_PREFIX = "login_lockout_"
+LOGIN_LOCKOUT_LEVEL_PREFIX = "login_lockout_level_"
+LOGIN_LOCKOUTS_KEY = "login_lockouts"
+LOCKOUT_KINDS = ("username", "ip")
+
+# KEYS are the failures, lockout and level keys of the username then of the
+# ip, and the index of the current lockouts. The failure is added to the
+# sliding window of each; a window reaching its limit is cleared and locks
+# its subject out for base * 2 ^ (lockouts in the last LEVEL seconds - 1),
+# capped at max. Lockouts over are pruned from the index, which expires
+# once the last one is. Returns the longest lockout started, in milliseconds.
+RECORD_FAILURE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local base = tonumber(ARGV[3])
+local max = tonumber(ARGV[4])
+local retry_after = 0
+for i = 0, 1 do
+    local failures = KEYS[i * 3 + 1]
+    local lockout = KEYS[i * 3 + 2]
+    local level = KEYS[i * 3 + 3]
+    redis.call('ZREMRANGEBYSCORE', failures, '-inf', now - window)
+    redis.call('ZADD', failures, now, ARGV[6])
+    redis.call('PEXPIRE', failures, window)
+    if redis.call('ZCARD', failures) >= tonumber(ARGV[7 + i * 2]) then
+        local count = redis.call('INCR', level)
+        redis.call('EXPIRE', level, ARGV[5])
+        local duration = math.floor(math.min(base * 2 ^ (count - 1), max))
+        redis.call('SET', lockout, count, 'PX', duration)
+        redis.call('ZADD', KEYS[7], now + duration, ARGV[8 + i * 2])
+        redis.call('DEL', failures)
+        retry_after = math.max(retry_after, duration)
+    end
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[7], '-inf', now)
+if retry_after > 0 then
+    redis.call('PEXPIRE', KEYS[7], max)
+end
+return retry_after
+"""
+
+record_failure_script = None
+
+
+def subject(kind, identifier):
+    return f"{kind}:{identifier}"
+
+
+def subject_keys(kind, identifier):
+    name = subject(kind, identifier)
+    return [
+        f"{LOGIN_FAILURES_PREFIX}{name}",
+        f"{LOGIN_LOCKOUT_PREFIX}{name}",
+        f"{LOGIN_LOCKOUT_LEVEL_PREFIX}{name}",
+    ]
+
+
+def get_client_ip(request):
+    """
+    Address of the client, from the request header named by
+    LOGIN_THROTTLE_IP_HEADER (REMOTE_ADDR, which nginx sets through uwsgi).
+    """
+    value = request.META.get(settings.LOGIN_THROTTLE_IP_HEADER, "")
+    return value.split(",")[0].strip() or "unknown"
+
+
+def login_retry_after(username, ip):
+    """
+    Seconds until the username and the ip may try to log in again, 0 when
+    neither is locked out. One round trip and no hashing, so rejected
+    attempts cost next to nothing.
+    """
+    pipe = get_redis().pipeline(transaction=False)
+    for kind, identifier in (("username", username), ("ip", ip)):
+        pipe.pttl(subject_keys(kind, identifier)[1])
+    return max(0, *pipe.execute()) / 1000
+
+
+def record_login_failure(username, ip):
+    """
+    Count a wrong password for the username and the ip. Returns the seconds
+    of the lockout it started, 0 when it started none.
+    """
+    global record_failure_script
+    if record_failure_script is None:
+        record_failure_script = get_redis().register_script(RECORD_FAILURE_SCRIPT)
+    retry_after = record_failure_script(
+        keys=[
+            *subject_keys("username", username),
+            *subject_keys("ip", ip),
+            LOGIN_LOCKOUTS_KEY,
+        ],
+        args=[
+            int(time.time() * 1000),
+            settings.LOGIN_THROTTLE_WINDOW * 1000,
+            settings.LOGIN_THROTTLE_LOCKOUT * 1000,
+            settings.LOGIN_THROTTLE_MAX_LOCKOUT * 1000,
+            settings.LOGIN_THROTTLE_LEVEL_TIMEOUT,
+            uuid.uuid4().hex,
+            settings.LOGIN_THROTTLE_USERNAME_LIMIT,
+            subject("username", username),
+            settings.LOGIN_THROTTLE_IP_LIMIT,
+            subject("ip", ip),
+        ],
+        client=get_redis(),
+    )
+    return retry_after / 1000
+
+
+def record_login_success(username):
+    """Forget the failures of the username, not those of the ip."""
+    get_redis().delete(*subject_keys("username", username))
+
+
+def get_login_lockouts():
+    """Current lockouts as dicts, the one ending first first."""
+    redis = get_redis()
+    now = time.time() * 1000
+    redis.zremrangebyscore(LOGIN_LOCKOUTS_KEY, "-inf", now)
+    entries = redis.zrange(LOGIN_LOCKOUTS_KEY, 0, -1, withscores=True)
+    if not entries:
+        return []
+    names = [name.decode() for name, _ in entries]
+    levels = redis.mget(f"{LOGIN_LOCKOUT_PREFIX}{name}" for name in names)
+    lockouts = []
+    for name, (_, until), level in zip(names, entries, levels):
+        # Lifted by unlock_login() in between
+        if level is None:
+            continue
+        kind, _, identifier = name.partition(":")
+        lockouts.append(
+            {
+                "kind": kind,
+                "identifier": identifier,
+                "level": int(level),
+                "locked_until": datetime.fromtimestamp(until / 1000, timezone.utc),
+            }
+        )
+    return lockouts
+
+
+def unlock_login(kind, identifier):
+    """Lift the lockout of a username or an ip and reset its backoff."""
+    redis = get_redis()
+    redis.delete(*subject_keys(kind, identifier))
+    redis.zrem(LOGIN_LOCKOUTS_KEY, subject(kind, identifier))
@@ -0,0 +1,153 @@
+import base64
+import hashlib
+import json
+import math
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router
+from django.db.models import Q
+from graphql import GraphQLError
+
+
+def encode_cursor(instance, ordering):
+    values = [
+        instance._meta.get_field(name.lstrip("-")).value_to_string(instance)
+        for name in ordering
+    ]
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(model, cursor, ordering):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise ValueError
+        return [
+            model._meta.get_field(name.lstrip("-")).to_python(value)
+            for name, value in zip(ordering, values)
+        ]
+    except Exception:
+        raise GraphQLError("مکان نمای صفحه نامعتبر است")
+
+
+def keyset_filter(ordering, values):
+    """
+    Rows strictly after the given values of the ordering, e.g. for
+    ("-creation_date", "-id"): creation_date < d OR (creation_date = d AND id < i).
+    """
+    condition = Q()
+    equal = {}
+    for name, value in zip(ordering, values):
+        field_name = name.lstrip("-")
+        lookup = "lt" if name.startswith("-") else "gt"
+        condition |= Q(**equal, **{f"{field_name}__{lookup}": value})
+        equal[field_name] = value
+    return condition
+
+
+def paginate_keyset(queryset, ordering, first=None, after=None):
+    """
+    Page of queryset ordered by ordering (which must end with a unique field)
+    starting after the cursor. Returns the items, the cursor of the last item
+    and whether more items follow. first is capped at GRAPHQL_MAX_PAGE_SIZE.
+    """
+    if first is None:
+        first = settings.GRAPHQL_DEFAULT_PAGE_SIZE
+    if first < 1:
+        raise GraphQLError("تعداد آیتم های صفحه باید بیشتر از صفر باشد")
+    first = min(first, settings.GRAPHQL_MAX_PAGE_SIZE)
+
+    # The cursor is built from the ordering fields, keep them loaded when the
+    # optimizer projected the columns
+    names = [name.lstrip("-") for name in ordering]
+    fields, defer = queryset.query.deferred_loading
+    if fields and not defer:
+        queryset = queryset.only(*fields, *names)
+
+    queryset = queryset.order_by(*ordering)
+    if after:
+        values = decode_cursor(queryset.model, after, ordering)
+        queryset = queryset.filter(keyset_filter(ordering, values))
+
+    items = list(queryset[: first + 1])
+    has_next_page = len(items) > first
+    items = items[:first]
+    end_cursor = encode_cursor(items[-1], ordering) if items else None
+    return items, end_cursor, has_next_page
+
+
+table_estimates = {}
+
+
+def table_estimate(model):
+    """
+    Row count Postgres keeps for the table of model in pg_class.reltuples,
+    read at most once per GRAPHQL_COUNT_CACHE_TIMEOUT by each worker. None on
+    other databases or when the table was never analyzed.
+    """
+    db = router.db_for_read(model)
+    connection = connections[db]
+    if connection.vendor != "postgresql":
+        return None
+
+    key = (db, model._meta.db_table)
+    expires, estimate = table_estimates.get(key, (0, None))
+    if time.monotonic() < expires:
+        return estimate
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+            [model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    estimate = int(row[0]) if row and row[0] >= 0 else None
+    table_estimates[key] = (
+        time.monotonic() + settings.GRAPHQL_COUNT_CACHE_TIMEOUT,
+        estimate,
+    )
+    return estimate
+
+
+def cached_count(queryset):
+    sql, params = queryset.order_by().query.sql_with_params()
+    digest = hashlib.sha256(f"{sql}|{params}".encode("utf-8")).hexdigest()
+    key = f"count_{queryset.model._meta.db_table}_{digest}"
+    count = cache.get(key)
+    if count is not None:
+        return count, True
+    count = queryset.count()
+    cache.set(key, count, timeout=settings.GRAPHQL_COUNT_CACHE_TIMEOUT)
+    return count, False
+
+
+def count_queryset(queryset):
+    """
+    Returns the number of rows of queryset and whether it is an estimate.
+    Tables expected to be smaller than GRAPHQL_EXACT_COUNT_THRESHOLD are
+    counted exactly with a single COUNT(*). Larger tables use the planner
+    estimate when unfiltered, and a count cached for
+    GRAPHQL_COUNT_CACHE_TIMEOUT when filtered.
+    """
+    estimate = table_estimate(queryset.model)
+    if estimate is None or estimate < settings.GRAPHQL_EXACT_COUNT_THRESHOLD:
+        return queryset.count(), False
+    if not queryset.query.where:
+        return estimate, True
+    return cached_count(queryset)
+
+
+def paginate(queryset, page, per_page):
+    """
+    Page/perPage pagination without Paginator, which needs an exact count to
+    validate the page number. Returns the items, the total pages, the total
+    items and whether the totals are estimated.
+    """
+    if page < 1 or per_page < 1:
+        raise GraphQLError("شماره و اندازه صفحه باید بیشتر از صفر باشند")
+    total_items, is_estimate = count_queryset(queryset)
+    offset = (page - 1) * per_page
+    items = list(queryset[offset : offset + per_page])
+    total_pages = max(math.ceil(total_items / per_page), 1)
+    return items, total_pages, total_items, is_estimate
@@ -0,0 +1,98 @@
+import logging
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connection
+from graphene.utils.str_converters import to_snake_case
+from graphql import (
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    InlineFragmentNode,
+    OperationType,
+    get_operation_ast,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def root_field_names(selection_set, fragments):
+    names = []
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            names.append(selection.name.value)
+        elif isinstance(selection, InlineFragmentNode):
+            names.extend(root_field_names(selection.selection_set, fragments))
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = fragments.get(selection.name.value)
+            if fragment is not None:
+                names.extend(root_field_names(fragment.selection_set, fragments))
+    return names
+
+
+def field_budget(schema, operation, name):
+    """
+    Maximum number of SQL queries of a root field of the graphene schema:
+    the query_budget of its mutation class, or its entry in the
+    query_budgets of the Query class. None when none is declared.
+    """
+    if operation == OperationType.MUTATION:
+        field = schema.mutation._meta.fields.get(name) if schema.mutation else None
+        return getattr(field.type, "query_budget", None) if field else None
+    return getattr(schema.query, "query_budgets", {}).get(name)
+
+
+def operation_budget(schema, document, operation_name):
+    """
+    Root fields of the operation and the sum of their budgets (introspection
+    fields are free). The budget is None when one of them has none.
+    """
+    operation_ast = get_operation_ast(document, operation_name)
+    if operation_ast is None or operation_ast.operation == OperationType.SUBSCRIPTION:
+        return None, []
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions
+        if isinstance(definition, FragmentDefinitionNode)
+    }
+    names = root_field_names(operation_ast.selection_set, fragments)
+    budget = 0
+    for name in names:
+        if name.startswith("__"):
+            continue
+        cost = field_budget(schema, operation_ast.operation, to_snake_case(name))
+        if cost is None:
+            return None, names
+        budget += cost
+    return budget, names
+
+
+@contextmanager
+def query_budget(budget, label):
+    """
+    Counts the queries run inside the block and, when there are more than
+    budget, raises QueryBudgetExceeded or logs a warning depending on
+    GRAPHQL_QUERY_BUDGET_ACTION ("raise", "log" or empty to disable).
+    """
+    action = settings.GRAPHQL_QUERY_BUDGET_ACTION
+    if not action or budget is None:
+        yield
+        return
+
+    queries = []
+
+    def count_query(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count_query):
+        yield
+
+    if len(queries) > budget:
+        message = f"{label} ran {len(queries)} queries, its budget is {budget}"
+        if action == "raise":
+            raise QueryBudgetExceeded("\n".join([message, *queries]))
+        logger.warning(message)
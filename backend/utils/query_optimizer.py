@@ -0,0 +1,161 @@
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+
+def collect_fields(info, nodes):
+    """
+    Flatten the selection sets of the given nodes into their field nodes,
+    following inline fragments and named fragment spreads.
+    """
+    fields = []
+    for node in nodes:
+        if node.selection_set is None:
+            continue
+        for selection in node.selection_set.selections:
+            if isinstance(selection, FieldNode):
+                fields.append(selection)
+            elif isinstance(selection, InlineFragmentNode):
+                fields.extend(collect_fields(info, [selection]))
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = info.fragments[selection.name.value]
+                fields.extend(collect_fields(info, [fragment]))
+    return fields
+
+
+def group_fields(fields):
+    grouped = {}
+    for node in fields:
+        grouped.setdefault(to_snake_case(node.name.value), []).append(node)
+    return grouped
+
+
+def get_relations(model):
+    relations = {}
+    for field in model._meta.get_fields():
+        if not field.is_relation or field.related_model is None:
+            continue
+        if field.auto_created and not field.concrete:
+            relations[field.get_accessor_name()] = field
+        else:
+            relations[field.name] = field
+    return relations
+
+
+def get_columns(model, names):
+    """
+    Columns needed to serve the selected field names: the primary key, every
+    foreign key id (relations are loaded from them) and the selected scalars.
+    Returns None when a selected name is not backed by the model, in which
+    case the model is loaded in full.
+    """
+    columns = {model._meta.pk.name}
+    concrete = set()
+    for field in model._meta.concrete_fields:
+        if field.is_relation:
+            columns.add(field.name)
+        else:
+            concrete.add(field.name)
+    relations = get_relations(model)
+    for name in names:
+        if name in concrete:
+            columns.add(name)
+        elif name not in relations and not name.startswith("__"):
+            return None
+    return columns
+
+
+def collect_lookups(info, model, fields, prefix, select, prefetch, only):
+    """
+    Fill select, prefetch and only for the given fields of model. Returns
+    False when the columns of this model or a select_related one cannot be
+    projected.
+    """
+    grouped = group_fields(fields)
+    columns = get_columns(model, grouped)
+    projectable = columns is not None
+    if projectable:
+        only.extend(prefix + column for column in columns)
+
+    relations = get_relations(model)
+    for name, nodes in grouped.items():
+        field = relations.get(name)
+        children = collect_fields(info, nodes)
+        if field is None or not children:
+            continue
+
+        lookup = prefix + name
+        if field.many_to_one or field.one_to_one:
+            select.append(lookup)
+            projectable &= collect_lookups(
+                info,
+                field.related_model,
+                children,
+                lookup + "__",
+                select,
+                prefetch,
+                only,
+            )
+        else:
+            queryset = apply_selections(
+                field.related_model._default_manager.all(), info, children
+            )
+            prefetch.append(Prefetch(lookup, queryset=queryset))
+
+    return projectable
+
+
+def apply_selections(queryset, info, fields):
+    select = []
+    prefetch = []
+    only = []
+    projectable = collect_lookups(
+        info, queryset.model, fields, "", select, prefetch, only
+    )
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    if projectable and fields:
+        queryset = queryset.only(*only)
+    return queryset
+
+
+def optimize_queryset(queryset, info, field_name=None):
+    """
+    Apply the select_related/prefetch_related and the .only() column list the
+    current selection set needs.
+    Pass field_name when the queryset feeds a sub field of the resolved one,
+    e.g. "items" for the paginated types.
+    """
+    fields = collect_fields(info, info.field_nodes)
+    if field_name:
+        fields = collect_fields(info, group_fields(fields).get(field_name, []))
+    return apply_selections(queryset, info, fields)
+
+
+def selects_only(info, model, models, field_name=None):
+    """
+    Whether the selection set only reaches the given models through the
+    relations of model, e.g. to tell if a result can be cached and
+    invalidated by changes to those models alone.
+    """
+    fields = collect_fields(info, info.field_nodes)
+    if field_name:
+        fields = collect_fields(info, group_fields(fields).get(field_name, []))
+    return reaches_only(info, model, fields, models)
+
+
+def reaches_only(info, model, fields, models):
+    relations = get_relations(model)
+    for name, nodes in group_fields(fields).items():
+        field = relations.get(name)
+        if field is None:
+            continue
+        if field.related_model not in models:
+            return False
+        if not reaches_only(
+            info, field.related_model, collect_fields(info, nodes), models
+        ):
+            return False
+    return True
@@ -0,0 +1,20 @@
+import redis
+from django.conf import settings
+
+connection_pool = None
+
+
+def get_redis():
+    """
+    Client on the connection pool shared by the whole process, configured by
+    REDIS_URL, REDIS_MAX_CONNECTIONS and REDIS_SOCKET_TIMEOUT.
+    """
+    global connection_pool
+    if connection_pool is None:
+        connection_pool = redis.ConnectionPool.from_url(
+            settings.REDIS_URL,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        )
+    return redis.Redis(connection_pool=connection_pool)
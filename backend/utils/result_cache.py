@@ -0,0 +1,89 @@
+import hashlib
+import json
+import time
+from django.conf import settings
+from django.core.cache import cache
+from graphql import print_ast
+
+RESULT_CACHE_PREFIX = "result_cache_"
+LOCK_POLL_INTERVAL = 0.05
+
+
+def version_key(tag):
+    return f"{RESULT_CACHE_PREFIX}version_{tag}"
+
+
+def get_versions(tags):
+    """
+    Current version of each tag. Missing versions (never set or evicted) are
+    created fresh, so entries stored under an older version are never read.
+    """
+    keys = [version_key(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def invalidate(*tags):
+    cache.set_many({version_key(tag): time.time_ns() for tag in tags}, timeout=None)
+
+
+def selection_hash(info):
+    """
+    Hash of the selection set (and the fragments and variables it may use),
+    since the cached instances carry the relations prefetched for it.
+    """
+    parts = [print_ast(node) for node in info.field_nodes]
+    parts += [print_ast(info.fragments[name]) for name in sorted(info.fragments)]
+    parts.append(json.dumps(info.variable_values, sort_keys=True, default=str))
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def cached_result(key, build, timeout=None):
+    """
+    Return the cached value of key or build and store it. Only one caller
+    builds a missing key at a time; the others wait for its result for up to
+    RESULT_CACHE_LOCK_TIMEOUT seconds before building it themselves.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock = f"{key}_lock"
+    lock_timeout = settings.RESULT_CACHE_LOCK_TIMEOUT
+    deadline = time.monotonic() + lock_timeout
+    while not cache.add(lock, 1, timeout=lock_timeout):
+        if time.monotonic() > deadline:
+            return build()
+        time.sleep(LOCK_POLL_INTERVAL)
+        value = cache.get(key)
+        if value is not None:
+            return value
+
+    try:
+        value = build()
+        cache.set(
+            key,
+            value,
+            timeout=settings.RESULT_CACHE_TIMEOUT if timeout is None else timeout,
+        )
+    finally:
+        cache.delete(lock)
+    return value
+
+
+def cached_resolve(info, name, args, tags, build):
+    """
+    Cache the result of a resolver, keyed by its name, its normalized
+    arguments, the selection set and the versions of the given tags.
+    Calling invalidate() with one of the tags drops the entry.
+    """
+    normalized = json.dumps(args, sort_keys=True, default=str)
+    versions = ",".join(str(version) for version in get_versions(tags))
+    digest = hashlib.sha256(
+        f"{name}|{normalized}|{versions}|{selection_hash(info)}".encode("utf-8")
+    ).hexdigest()
+    return cached_result(f"{RESULT_CACHE_PREFIX}{name}_{digest}", build)
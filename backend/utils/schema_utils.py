@@ -1,11 +1,7 @@
-from django.shortcuts import get_object_or_404
 from graphql import GraphQLError
-from main.models import BurnedTokens
 from django.http import JsonResponse
 from functools import wraps
-import jwt
-from django.conf import settings
-from users.models import User
+from utils.auth_context import get_auth_context
 
 
 def main():
@@ -60,14 +56,8 @@ def resolve_model_with_filters(model_class, filter_input=None):
 
 def login_required(func):
     def wrapper(root, info, *args, **kwargs):
-        user = info.context.user
-        token = info.context.headers.get("Authorization")
-        try:
-            BurnedTokens.objects.get(token=token)
-            token = False
-        except BurnedTokens.DoesNotExist:
-            token = True
-        if user.is_authenticated and token:
+        user = get_auth_context(info.context).user
+        if user.is_authenticated:
             return func(root, info, *args, **kwargs)
         else:
             raise GraphQLError("شما وارد حساب کاربری خود نشده اید")
@@ -77,15 +67,8 @@ def login_required(func):
 
 def staff_member_required(func):
     def wrapper(root, info, *args, **kwargs):
-        user = info.context.user
-        token = info.context.headers.get("Authorization")
-        try:
-            BurnedTokens.objects.get(token=token)
-            token = False
-        except BurnedTokens.DoesNotExist:
-            token = True
-
-        if user.is_authenticated and user.is_staff and token:
+        user = get_auth_context(info.context).user
+        if user.is_authenticated and user.is_staff:
             return func(root, info, *args, **kwargs)
         else:
             raise GraphQLError("شما دسترسی انجام این عملیات را ندارید")
@@ -96,19 +79,10 @@ def staff_member_required(func):
 def django_staff_member_required(view_func):
     @wraps(view_func)
     def _wrapped_view(request, *args, **kwargs):
-        token = request.headers.get("Authorization")
-
-        try:
-            BurnedTokens.objects.get(token=token)
-            token_valid = False
-        except BurnedTokens.DoesNotExist:
-            token_valid = True
-
-        if token_valid:
-            if token.startswith('Bearer '):
-                token = token.split(' ')[1]
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-            user = get_object_or_404(User, username=payload["username"])
+        auth_context = get_auth_context(request)
+
+        if auth_context.is_valid:
+            user = auth_context.user
             if user.is_authenticated and user.is_staff:
                 return view_func(request, *args, **kwargs)
             else:
@@ -134,19 +108,10 @@ def django_staff_member_required(view_func):
 def django_login_required(view_func):
     @wraps(view_func)
     def _wrapped_view(request, *args, **kwargs):
-        token = request.headers.get("Authorization")
-
-        try:
-            BurnedTokens.objects.get(token=token)
-            token_valid = False
-        except BurnedTokens.DoesNotExist:
-            token_valid = True
-
-        if token_valid:
-            if token.startswith("Bearer "):
-                token = token.split(" ")[1]
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-            user = get_object_or_404(User, username=payload["username"])
+        auth_context = get_auth_context(request)
+
+        if auth_context.is_valid:
+            user = auth_context.user
             if user.is_authenticated:
                 return view_func(request, *args, **kwargs)
             else:
@@ -0,0 +1,158 @@
+import json
+from django.test import Client, TestCase, override_settings
+from graphene.utils.str_converters import to_snake_case
+from graphql_jwt.shortcuts import get_token
+from main.geo_index import get_geo_index, invalidate_geo_index
+from main.models import Cities, Provinces
+from sales.models import (
+    DisplayItem,
+    ItemVariant,
+    Order,
+    OrderItem,
+    OrderTransaction,
+)
+from users.models import Address, Business, User
+
+
+def create_user(username, **extra_fields):
+    return User.objects.create_user(
+        username=username,
+        email=f"{username}@example.com",
+        password="password",
+        first_name="نام",
+        last_name="نام خانوادگی",
+        phone_number=f"0912{username}",
+        landline_number=f"021{username}",
+        birthdate="1990-01-01",
+        is_fully_authenticated=True,
+        **extra_fields,
+    )
+
+
+def create_item_variant(
+    display_item=None, name="مبل راحتی", price=1000, **extra_fields
+):
+    if display_item is None:
+        display_item = DisplayItem.objects.create(type="s", name="مبل")
+    return ItemVariant.objects.create(
+        display_item=display_item,
+        name=name,
+        dimensions={"width": 200},
+        price=price,
+        description="توضیحات",
+        fabric="مخمل",
+        color="سبز",
+        wood_color="قهوه ای",
+        **extra_fields,
+    )
+
+
+def execute_graphql(url, query, variables=None, user=None, **headers):
+    """Post an operation to a GraphQL endpoint and return the decoded body."""
+    if user is not None:
+        headers["HTTP_AUTHORIZATION"] = f"Bearer {get_token(user)}"
+    response = Client().post(
+        url,
+        json.dumps({"query": query, "variables": variables or {}}),
+        content_type="application/json",
+        **headers,
+    )
+    return response.json()
+
+
+class SeedData:
+    """
+    A few rows of every model the GraphQL operations touch, several of each
+    so that a query run per row shows up in the query counts.
+    """
+
+    def __init__(self):
+        self.provinces = [
+            Provinces.objects.create(name=name) for name in ("تهران", "اصفهان")
+        ]
+        self.cities = [
+            Cities.objects.create(province=province, name=f"{province.name} {i}")
+            for province in self.provinces
+            for i in range(2)
+        ]
+        # The signals reload the index on commit, which never comes in a
+        # TestCase; load it now like the warm index of a running worker
+        invalidate_geo_index()
+        get_geo_index()
+
+        self.customer = create_user("customer")
+        self.staff = create_user("staff", is_staff=True)
+        self.business_user = create_user("business")
+        self.business = Business.objects.create(
+            user=self.business_user,
+            name="شرکت",
+            owner_first_name="نام",
+            owner_last_name="نام خانوادگی",
+            owner_phone_number="+989120000000",
+            is_confirmed=True,
+        )
+        self.addresses = [
+            Address.objects.create(
+                user=self.customer,
+                title=f"آدرس {i}",
+                province=self.provinces[0],
+                city=self.cities[0],
+                address="خیابان اول",
+                postal_code="1234567890",
+            )
+            for i in range(3)
+        ]
+
+        self.display_items = [
+            DisplayItem.objects.create(type=type, name=f"مورد {type}")
+            for type in ("s", "b", "m")
+        ]
+        self.item_variants = [
+            create_item_variant(
+                display_item,
+                name=f"{display_item.name} {i}",
+                show_in_first_page=True,
+            )
+            for display_item in self.display_items
+            for i in range(2)
+        ]
+
+        self.orders = []
+        for i in range(3):
+            order = Order.objects.create(user=self.customer, status="ps")
+            for item_variant in self.item_variants[i : i + 2]:
+                OrderItem.add_to_order(order, item_variant, 2)
+            for j in range(2):
+                OrderTransaction.objects.create(
+                    order=order, title=f"فاکتور {j}", amount=1000
+                )
+            self.orders.append(order)
+
+
+@override_settings(GRAPHQL_QUERY_BUDGET_ACTION="raise", CATALOG_SNAPSHOT_PATH="")
+class GraphQLBudgetTestCase(TestCase):
+    """
+    Runs operations of one GraphQL endpoint against SeedData. An operation
+    exceeding the query budget of its schema fails the test with
+    QueryBudgetExceeded. The catalog is read from the database, the budgets
+    cover the case without a catalog snapshot.
+    """
+
+    url = None
+    schema = None
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = SeedData()
+
+    def execute(self, query, variables=None, user=None, **headers):
+        result = execute_graphql(self.url, query, variables, user, **headers)
+        self.assertNotIn("errors", result)
+        return result["data"]
+
+    def test_every_root_field_has_a_budget(self):
+        query_budgets = getattr(self.schema.query, "query_budgets", {})
+        for name in self.schema.query._meta.fields:
+            self.assertIn(to_snake_case(name), query_budgets, name)
+        for name, field in self.schema.mutation._meta.fields.items():
+            self.assertIsNotNone(getattr(field.type, "query_budget", None), name)
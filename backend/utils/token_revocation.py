@@ -0,0 +1,94 @@
+import hashlib
+import math
+import time
+from django.conf import settings
+from utils.redis_pool import get_redis
+
+REVOKED_TOKEN_PREFIX = "revoked_token:"
+# Sorted set of the revoked token hashes scored by expiry, only used to
+# rebuild the bloom filters of the workers
+REVOKED_TOKENS_INDEX = "revoked_tokens"
+
+
+def token_digest(token):
+    if token.startswith("Bearer "):
+        token = token.split(" ")[1]
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, digest):
+        # The digest is already a sha256, split it instead of rehashing
+        first = int(digest[:16], 16)
+        second = int(digest[16:32], 16) | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, digest):
+        for position in self.positions(digest):
+            self.bits[position // 8] |= 1 << (position % 8)
+
+    def __contains__(self, digest):
+        return all(
+            self.bits[position // 8] & (1 << (position % 8))
+            for position in self.positions(digest)
+        )
+
+
+bloom_filter = None
+bloom_filter_loaded_at = 0
+
+
+def get_bloom_filter():
+    """
+    Filter of the tokens revoked so far, rebuilt from Redis every
+    REVOKED_TOKENS_BLOOM_REFRESH seconds. Tokens revoked by other workers
+    are missed for at most that long.
+    """
+    global bloom_filter, bloom_filter_loaded_at
+    now = time.time()
+    if (
+        bloom_filter is None
+        or now - bloom_filter_loaded_at > settings.REVOKED_TOKENS_BLOOM_REFRESH
+    ):
+        client = get_redis()
+        client.zremrangebyscore(REVOKED_TOKENS_INDEX, "-inf", now)
+        digests = client.zrange(REVOKED_TOKENS_INDEX, 0, -1)
+        new_filter = BloomFilter(
+            max(len(digests) * 2, settings.REVOKED_TOKENS_BLOOM_CAPACITY),
+            settings.REVOKED_TOKENS_BLOOM_ERROR_RATE,
+        )
+        for digest in digests:
+            new_filter.add(digest.decode("ascii"))
+        bloom_filter = new_filter
+        bloom_filter_loaded_at = now
+    return bloom_filter
+
+
+def revoke_token(token, exp):
+    """
+    Revoke token until its expiry (a unix timestamp, the exp claim).
+    """
+    ttl = int(exp - time.time())
+    if ttl <= 0:
+        return False
+    digest = token_digest(token)
+    client = get_redis()
+    with client.pipeline() as pipe:
+        pipe.set(f"{REVOKED_TOKEN_PREFIX}{digest}", 1, ex=ttl)
+        pipe.zadd(REVOKED_TOKENS_INDEX, {digest: exp})
+        pipe.execute()
+    if bloom_filter is not None:
+        bloom_filter.add(digest)
+    return True
+
+
+def is_token_revoked(token):
+    digest = token_digest(token)
+    if settings.REVOKED_TOKENS_BLOOM_FILTER and digest not in get_bloom_filter():
+        return False
+    return bool(get_redis().exists(f"{REVOKED_TOKEN_PREFIX}{digest}"))